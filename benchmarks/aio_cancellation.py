@@ -0,0 +1,82 @@
+"""
+The overhead per call of telling cancellations apart, around a coroutine
+standing in for an RPC: a plain await, `distinguishing_cancellation`,
+`distinguish_cancellation`, and the wrapper task it used to create.
+Prints a JSON line for each, with nanoseconds per call.
+
+    python benchmarks/aio_cancellation.py [--calls 200000]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from kmg.kitchen.aio import (
+    CancelledFromInside,
+    CancelledFromOutside,
+    distinguish_cancellation,
+    distinguishing_cancellation,
+)
+
+
+async def rpc():
+    return 1
+
+
+async def plain():
+    return await rpc()
+
+
+async def context_manager():
+    with distinguishing_cancellation():
+        return await rpc()
+
+
+@distinguishing_cancellation()
+async def decorated():
+    return await rpc()
+
+
+async def function():
+    return await distinguish_cancellation(rpc())
+
+
+async def wrapper_task():
+    "What distinguish_cancellation did before, for comparison."
+    task = asyncio.create_task(rpc())
+    try:
+        await asyncio.wait((task,))
+    except asyncio.CancelledError:
+        task.cancel()
+        raise CancelledFromOutside from None
+    if task.cancelled():
+        raise CancelledFromInside
+    return task.result()
+
+
+async def bench(label: str, call, calls: int):
+    for _ in range(1000):  # warm up
+        await call()
+    started = time.perf_counter_ns()
+    for _ in range(calls):
+        await call()
+    elapsed = time.perf_counter_ns() - started
+    json.dump({"label": label, "ns_per_call": elapsed // calls}, sys.stdout)
+    print(flush=True)
+
+
+async def main(calls: int):
+    await bench("plain", plain, calls)
+    await bench("distinguishing_cancellation", context_manager, calls)
+    await bench("decorated", decorated, calls)
+    await bench("distinguish_cancellation", function, calls)
+    await bench("wrapper_task", wrapper_task, calls)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls))
@@ -0,0 +1,68 @@
+"""
+Event loop lag while writing many files from coroutines: with
+`kmg.kitchen.fs.atomic_replace` called directly, and with
+`kmg.kitchen.aio.atomic_write`. Prints a JSON line for each, with how late
+a 1ms heartbeat ran (its lag) while the writes went on.
+
+    python benchmarks/aio_fs.py [--directory D] [--files 200] [--size 1048576]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from kmg.kitchen.aio import atomic_write
+from kmg.kitchen.fs import atomic_replace
+from kmg.kitchen.histogram import Histogram
+
+
+async def blocking(target: Path, data: bytes):
+    with atomic_replace(target) as f:
+        f.write(data)
+
+
+async def heartbeat(lag: Histogram, interval: float = 0.001):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag.record(max(0, int((loop.time() - expected) * 1e6)))
+
+
+async def bench(label: str, write, directory: str, files: int, data: bytes):
+    lag = Histogram()
+    beating = asyncio.create_task(heartbeat(lag))
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await asyncio.gather(*(write(Path(directory, f"{i}"), data) for i in range(files)))
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(0.01)  # so a beat the writes held up gets recorded
+    beating.cancel()
+    result = {"label": label, "seconds": elapsed, "loop_lag_us": lag.summary()}
+    json.dump(result, sys.stdout)
+    print(flush=True)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--directory", default=None)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size", type=int, default=1024 * 1024)
+    args = parser.parse_args()
+
+    data = os.urandom(args.size)
+    with tempfile.TemporaryDirectory(dir=args.directory) as tmp:
+        for label, write in (
+            ("atomic_replace", blocking),
+            ("atomic_write", atomic_write),
+        ):
+            await bench(label, write, tmp, args.files, data)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+"""
+The cost of leaving a `kmg.kitchen.aio.LoopMonitor` running: time to run
+many short tasks, each yielding to the loop a few times, with and without one.
+Prints a JSON line for each, and the monitor's lag summary.
+
+    python benchmarks/aio_monitor.py [--tasks 20000] [--rounds 5]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from kmg.kitchen.aio import LoopMonitor
+
+
+async def step(yields: int):
+    for _ in range(yields):
+        await asyncio.sleep(0)
+
+
+async def workload(tasks: int) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(step(10) for _ in range(tasks)))
+    return time.perf_counter() - started
+
+
+async def main(tasks: int, rounds: int):
+    for _ in range(rounds):
+        plain = await workload(tasks)
+        with LoopMonitor() as monitor:
+            monitored = await workload(tasks)
+        result = {
+            "plain_s": round(plain, 4),
+            "monitored_s": round(monitored, 4),
+            "overhead": f"{monitored / plain - 1:+.1%}",
+            "tasks_created": monitor.tasks_created,
+            "lag_us": monitor.lag_us.summary(),
+        }
+        json.dump(result, sys.stdout)
+        print(flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.tasks, args.rounds))
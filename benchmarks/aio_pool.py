@@ -0,0 +1,64 @@
+"""
+Peak memory and time to run a trivial coroutine over many items, 64 at a time:
+with `asyncio.gather` and a semaphore (a task per item up front), and with
+`kmg.kitchen.aio.bounded_map`. Prints a JSON line for each.
+
+    python benchmarks/aio_pool.py [--items 200000] [--concurrency 64]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+
+from kmg.kitchen.aio import bounded_map
+
+
+async def work(item: int) -> int:
+    await asyncio.sleep(0)
+    return item
+
+
+async def gathered(items: int, concurrency: int) -> int:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(item: int) -> int:
+        async with semaphore:
+            return await work(item)
+
+    return sum(await asyncio.gather(*(bounded(i) for i in range(items))))
+
+
+async def mapped(items: int, concurrency: int) -> int:
+    total = 0
+    async for result in bounded_map(work, range(items), concurrency):
+        total += result
+    return total
+
+
+async def bench(label: str, run, items: int, concurrency: int):
+    tracemalloc.start()
+    started = time.perf_counter()
+    total = await run(items, concurrency)
+    elapsed = time.perf_counter() - started
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert total == items * (items - 1) // 2
+    result = {"label": label, "seconds": round(elapsed, 3), "peak_bytes": peak}
+    json.dump(result, sys.stdout)
+    print(flush=True)
+
+
+async def main(items: int, concurrency: int):
+    await bench("gather", gathered, items, concurrency)
+    await bench("bounded_map", mapped, items, concurrency)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=200000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(main(args.items, args.concurrency))
@@ -0,0 +1,113 @@
+"""
+Many coroutines waiting under `kmg.kitchen.aio.check_signal` at once,
+compared with a plain await and with the Event-and-task-per-call approach
+check_signal used to take. Prints a JSON line for each, with the time and
+memory it took to start every waiter, and how long one signal took
+to wake them all.
+
+    python benchmarks/aio_signals.py [--waiters 10000 100000]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import signal
+import sys
+import time
+import tracemalloc
+
+from kmg.kitchen.aio import check_signal
+from kmg.kitchen.aio.signals import SignalError
+
+SIGNAL = signal.SIGUSR1
+
+
+class _EventPerCall:
+    "A task and an Event per call, all set by the handler, for comparison."
+
+    def __init__(self):
+        self.events: dict[int, asyncio.Event] = {}
+        asyncio.get_running_loop().add_signal_handler(SIGNAL, self.handle)
+
+    def handle(self):
+        for event in self.events.values():
+            event.set()
+
+    async def check(self, awaitable):
+        task = asyncio.create_task(awaitable)
+        self.events[id(task)] = event = asyncio.Event()
+        event_task = asyncio.create_task(event.wait())
+        done, _pending = await asyncio.wait(
+            (event_task, task), return_when=asyncio.FIRST_COMPLETED
+        )
+        del self.events[id(task)]
+        if event_task in done:
+            task.cancel()
+            raise SignalError(SIGNAL)
+        event_task.cancel()
+        return task.result()
+
+
+async def waiter(check, forever: asyncio.Future):
+    try:
+        await check(forever)
+    except (SignalError, asyncio.CancelledError):
+        pass
+
+
+async def bench(label: str, waiters: int):
+    loop = asyncio.get_running_loop()
+    forever = loop.create_future()
+    if label == "plain":
+        check = plain
+    elif label == "check_signal":
+        check = lambda awaitable: check_signal(awaitable, SIGNAL)  # noqa: E731
+    else:
+        check = _EventPerCall().check
+
+    async def wait_forever():
+        await forever
+
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(waiter(check, wait_forever())) for _ in range(waiters)]
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)  # let nested tasks start
+    elapsed = time.perf_counter() - started
+    allocated, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    woken = time.perf_counter()
+    if label == "plain":
+        for task in tasks:
+            task.cancel()
+    else:
+        os.kill(os.getpid(), SIGNAL)
+    await asyncio.gather(*tasks)
+    woke = time.perf_counter() - woken
+    result = {
+        "label": label,
+        "waiters": waiters,
+        "start_us_per_waiter": round(elapsed / waiters * 1e6, 2),
+        "bytes_per_waiter": allocated // waiters,
+        "wake_all_ms": round(woke * 1e3, 1),
+    }
+    json.dump(result, sys.stdout)
+    print(flush=True)
+
+
+async def plain(awaitable):
+    return await awaitable
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--waiters", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+    for n in args.waiters:
+        # a loop each, since each registers its own signal handler.
+        for label in ("plain", "check_signal", "event_per_call"):
+            asyncio.run(bench(label, n))
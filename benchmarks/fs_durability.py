@@ -0,0 +1,69 @@
+"""
+What each `kmg.kitchen.fs.Durability` level costs: write many small files
+plainly, one `atomic_replace` each, and in one `AtomicBatch`,
+printing a JSON line for each. Run it on the filesystem you care about.
+
+    python benchmarks/fs_durability.py [--directory D] [--files 200] [--size 4096]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from kmg.kitchen.fs import AtomicBatch, Durability, atomic_replace
+
+
+def plain(targets: list[Path], data: bytes, durability: Durability):
+    for target in targets:
+        with open(target, "wb") as f:
+            f.write(data)
+
+
+def one_by_one(targets: list[Path], data: bytes, durability: Durability):
+    for target in targets:
+        with atomic_replace(target, durability=durability) as f:
+            f.write(data)
+
+
+def batched(targets: list[Path], data: bytes, durability: Durability):
+    with AtomicBatch(durability) as batch:
+        for target in targets:
+            batch.write(target, data)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--directory", default=None)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size", type=int, default=4096)
+    args = parser.parse_args()
+
+    data = os.urandom(args.size)
+    runs = [("plain", plain, Durability.NONE)] + [
+        (name, how, durability)
+        for durability in Durability
+        for name, how in (("atomic_replace", one_by_one), ("batch", batched))
+    ]
+    with tempfile.TemporaryDirectory(dir=args.directory) as tmp:
+        targets = [Path(tmp, f"{i}") for i in range(args.files)]
+        for name, how, durability in runs:
+            started = time.perf_counter()
+            how(targets, data, durability)
+            elapsed = time.perf_counter() - started
+            result = {
+                "label": name,
+                "durability": durability.value,
+                "files": args.files,
+                "seconds": elapsed,
+                "files_per_second": args.files / elapsed,
+            }
+            json.dump(result, sys.stdout)
+            print(flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Patch a few small regions of a large file atomically, by rewriting it
+through `kmg.kitchen.fs.atomic_replace` and through `atomic_patch`,
+printing a JSON line for each (and how `atomic_patch` copied it).
+
+    python benchmarks/fs_patch.py [--directory D] [--size-mb 256] [--patches 16]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from kmg.kitchen import fs
+from kmg.kitchen.fs import atomic_patch, atomic_replace
+
+PATCH = b"p" * 4096
+
+
+def rewrite(target: Path, offsets: list[int]):
+    with open(target, "rb") as src, atomic_replace(target) as f:
+        position = 0
+        for offset in sorted(offsets):
+            f.write(src.read(offset - position))
+            f.write(PATCH)
+            src.seek(len(PATCH), os.SEEK_CUR)
+            position = offset + len(PATCH)
+        while chunk := src.read(fs.COPY_CHUNK_SIZE):
+            f.write(chunk)
+
+
+def patch(target: Path, offsets: list[int]):
+    with atomic_patch(target) as mapped:
+        for offset in offsets:
+            mapped[offset : offset + len(PATCH)] = PATCH
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--directory", default=None)
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--patches", type=int, default=16)
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    with tempfile.TemporaryDirectory(dir=args.directory) as tmp:
+        target = Path(tmp, "file")
+        with open(target, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+        with open(target, "rb") as src, open(Path(tmp, "probe"), "wb") as dst:
+            method = fs.clone_file(src, dst)
+        os.remove(Path(tmp, "probe"))
+
+        # non-overlapping 4K slots.
+        slots = random.sample(range(size // len(PATCH)), args.patches)
+        offsets = [slot * len(PATCH) for slot in slots]
+        for label, how in (("atomic_replace", rewrite), ("atomic_patch", patch)):
+            started = time.perf_counter()
+            how(target, offsets)
+            result = {
+                "label": label,
+                "size_mb": args.size_mb,
+                "patches": args.patches,
+                "seconds": time.perf_counter() - started,
+                "clone": method if how is patch else None,
+            }
+            json.dump(result, sys.stdout)
+            print(flush=True)
+
+
+if __name__ == "__main__":
+    main()
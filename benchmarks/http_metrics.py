@@ -0,0 +1,46 @@
+"""
+Measure what collecting metrics costs `kmg.kitchen.http`: the same load
+with metrics on and off, printing one JSON line for each and the overhead.
+
+    python benchmarks/http_metrics.py [--duration 5] [--rounds 3]
+"""
+
+import argparse
+import json
+import sys
+
+from kmg.kitchen import load
+from kmg.kitchen.http import Server, make_server
+
+
+def bench(metrics: bool, args) -> float:
+    server = Server(make_server(metrics=metrics))
+    server.start()
+    try:
+        result = load.run(server.url, args.duration, args.concurrency)
+    finally:
+        server.stop()
+    json.dump({"label": f"metrics={metrics}", **result.to_dict()}, sys.stdout)
+    print(flush=True)
+    return result.throughput
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    # alternate, keeping the best of each, so drift doesn't favour either.
+    best = {False: 0.0, True: 0.0}
+    for _ in range(args.rounds):
+        for metrics in (False, True):
+            best[metrics] = max(best[metrics], bench(metrics, args))
+    overhead = (1 - best[True] / best[False]) * 100 if best[False] else 0.0
+    json.dump({"label": "overhead", "percent": round(overhead, 2)}, sys.stdout)
+    print()
+
+
+if __name__ == "__main__":
+    main()
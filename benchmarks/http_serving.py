@@ -0,0 +1,62 @@
+"""
+Compare the serving modes of `kmg.kitchen.http` under the same load,
+printing one JSON line per mode (see `kmg.kitchen.load`).
+
+    python benchmarks/http_serving.py [--duration 5] [--certs C --privkey K]
+"""
+
+import argparse
+import json
+import ssl
+import sys
+
+from kmg.kitchen import load
+from kmg.kitchen.http import Server, ServerProcesses, make_server
+from kmg.kitchen.https import make_context
+
+MODES = {
+    "serial": {"threads": None, "keep_alive": False},
+    "threaded": {"keep_alive": False},
+    "threaded+keep-alive": {},
+}
+
+
+def bench(label: str, server, args, client_ctx):
+    server.start()
+    try:
+        result = load.run(
+            server.url, args.duration, args.concurrency, ssl_context=client_ctx
+        )
+    finally:
+        server.stop()
+    json.dump({"label": label, **result.to_dict()}, sys.stdout)
+    print(flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--certs")
+    parser.add_argument("--privkey")
+    args = parser.parse_args()
+
+    schemes: list[tuple[str, dict, ssl.SSLContext | None]] = [("http", {}, None)]
+    if args.certs and args.privkey:
+        client_ctx = ssl.create_default_context()
+        client_ctx.check_hostname = False
+        client_ctx.verify_mode = ssl.CERT_NONE
+        server_kwargs = {"ssl_context": make_context(args.certs, args.privkey)}
+        schemes.append(("https", server_kwargs, client_ctx))
+
+    for scheme, server_kwargs, client_ctx in schemes:
+        for mode, kwargs in MODES.items():
+            server = Server(make_server(**server_kwargs, **kwargs))
+            bench(f"{scheme} {mode}", server, args, client_ctx)
+        server = ServerProcesses(processes=args.processes, **server_kwargs)
+        bench(f"{scheme} processes+keep-alive", server, args, client_ctx)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Build an `IPSet` from many random CIDRs and time membership checks against it,
+and against a linear scan of `ipaddress` networks, printing a JSON line for each.
+
+    python benchmarks/ipset.py [--v4 50000] [--v6 10000] [--lookups 100000]
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network, ip_address
+
+from kmg.kitchen.ipset import IPSet
+
+
+def networks(v4: int, v6: int) -> list[IPv4Network | IPv6Network]:
+    result: list[IPv4Network | IPv6Network] = []
+    for _ in range(v4):
+        prefix = random.randint(16, 32)
+        address = IPv4Address(random.getrandbits(32))
+        result.append(IPv4Network(f"{address}/{prefix}", strict=False))
+    for _ in range(v6):
+        prefix = random.randint(32, 64)
+        address = IPv6Address(random.getrandbits(128))
+        result.append(IPv6Network(f"{address}/{prefix}", strict=False))
+    return result
+
+
+def addresses(n: int) -> list[str]:
+    return [
+        str(IPv4Address(random.getrandbits(32)))
+        if random.random() < 0.8
+        else str(IPv6Address(random.getrandbits(128)))
+        for _ in range(n)
+    ]
+
+
+def report(name: str, lookups: int, elapsed: float, **extra):
+    print(
+        json.dumps({"name": name, "lookups_per_s": round(lookups / elapsed), **extra})
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--v4", type=int, default=50000)
+    parser.add_argument("--v6", type=int, default=10000)
+    parser.add_argument("--lookups", type=int, default=100000)
+    parser.add_argument("--linear-lookups", type=int, default=100)
+    args = parser.parse_args()
+
+    cidrs = networks(args.v4, args.v6)
+    lines = [str(network) for network in cidrs]
+    probes = addresses(args.lookups)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    ipset = IPSet(lines)
+    built = time.perf_counter() - start
+    allocated, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    hits = sum(probe in ipset for probe in probes)
+    report(
+        "ipset",
+        len(probes),
+        time.perf_counter() - start,
+        hits=hits,
+        build_s=round(built, 3),
+        ranges_bytes=ipset.nbytes,
+        allocated_bytes=allocated,
+    )
+
+    probes = probes[: args.linear_lookups]
+    start = time.perf_counter()
+    hits = sum(
+        any(address in network for network in cidrs)
+        for address in map(ip_address, probes)
+    )
+    report("linear", len(probes), time.perf_counter() - start, hits=hits)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Throughput against a local server that allows --quota requests a second
+(answering 429 with Retry-After past that), from several threads:
+unthrottled, leaving it to retries; throttled with a `TokenBucket` just under
+the quota; and from several processes sharing a `SharedTokenBucket`.
+Prints a JSON line for each, with successful requests a second and how many
+were refused.
+
+    python benchmarks/ratelimit.py [--quota 200] [--threads 8] [--seconds 3]
+"""
+
+import argparse
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+
+from kmg.kitchen.histogram import Histogram
+from kmg.kitchen.http import PooledHTTPServer, Server
+from kmg.kitchen.ratelimit import SharedTokenBucket, SlidingWindow, TokenBucket
+from kmg.kitchen.requests import ThreadSessions
+
+HEADROOM = 0.95
+"How far under the quota the clients aim."
+
+
+def quota_handler(quota: int, refused: list[int]):
+    window = SlidingWindow(quota, 1.0)
+
+    class _Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if window.try_acquire():
+                self.send_response(200)
+            else:
+                refused.append(1)
+                self.send_response(429)
+                self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return _Handler
+
+
+def hammer(
+    url: str, threads: int, seconds: float, **session_kwargs
+) -> tuple[int, Histogram]:
+    """
+    Make requests from threads until seconds are up.
+    Returns how many worked, and their latencies in µs.
+    """
+    deadline = time.monotonic() + seconds
+    with ThreadSessions(check=False, **session_kwargs) as sessions:
+
+        def worker() -> Histogram:
+            latency = Histogram()
+            while time.monotonic() < deadline:
+                started = time.perf_counter_ns()
+                if sessions.get(url).status_code == 200:
+                    latency.record((time.perf_counter_ns() - started) // 1000)
+            return latency
+
+        total = Histogram()
+        with ThreadPoolExecutor(threads) as pool:
+            for latency in pool.map(lambda _: worker(), range(threads)):
+                total.merge(latency)
+        return total.count, total
+
+
+def _process(url: str, path: Path, quota: int, threads: int, seconds: float, out):
+    with SharedTokenBucket(path, quota * HEADROOM) as bucket:
+        out.put(hammer(url, threads, seconds, limit=bucket)[1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quota", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    def run(label: str, go):
+        refused: list[int] = []
+        handler = quota_handler(args.quota, refused)
+        server = PooledHTTPServer(("127.0.0.1", 0), handler, threads=32)
+        with Server(server) as running:
+            started = time.monotonic()
+            ok, latency = go(running.url)
+            elapsed = time.monotonic() - started
+        result = {
+            "label": label,
+            "ok_per_s": round(ok / elapsed, 1),
+            "quota": args.quota,
+            "refused": len(refused),
+            "latency_us": latency.summary(),
+        }
+        json.dump(result, sys.stdout)
+        print(flush=True)
+
+    run("retries", lambda url: hammer(url, args.threads, args.seconds))
+    bucket = TokenBucket(args.quota * HEADROOM)
+    run(
+        "token_bucket",
+        lambda url: hammer(url, args.threads, args.seconds, limit=bucket),
+    )
+
+    def processes(url: str) -> tuple[int, Histogram]:
+        mp = multiprocessing.get_context("fork")
+        out = mp.SimpleQueue()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "bucket")
+            procs = [
+                mp.Process(
+                    target=_process,
+                    args=(url, path, args.quota, args.threads, args.seconds, out),
+                )
+                for _ in range(args.processes)
+            ]
+            for proc in procs:
+                proc.start()
+            total = Histogram()
+            for _ in procs:
+                total.merge(out.get())
+            for proc in procs:
+                proc.join()
+        return total.count, total
+
+    run("shared_token_bucket", processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Compare fetching a file from a local `kmg.kitchen.http` static server
+with and without a warm `kmg.kitchen.httpcache.DiskCache`, which turns each
+full response into a 304 revalidation. Prints a JSON line for each,
+with the bytes the server sent.
+
+    python benchmarks/requests_cache.py [--requests 500] [--size 1048576]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from kmg.kitchen.histogram import Histogram
+from kmg.kitchen.http import Server, make_server
+from kmg.kitchen.httpcache import DiskCache
+from kmg.kitchen.requests import session
+
+
+def bench(label: str, server: Server, cache: DiskCache | None, count: int):
+    sent_before = server.metrics.snapshot()["bytes_out"]
+    latency = Histogram()
+    with session(cache=cache) as s:
+        s.get(server.url + "file")  # warm up the connection, and the cache
+        for _ in range(count):
+            started = time.perf_counter_ns()
+            s.get(server.url + "file")
+            latency.record((time.perf_counter_ns() - started) // 1000)
+    sent = server.metrics.snapshot()["bytes_out"] - sent_before
+    result = {
+        "label": label,
+        "latency_us": latency.summary(),
+        "server_bytes_out": sent,
+        "cache": cache.stats() if cache is not None else None,
+    }
+    json.dump(result, sys.stdout)
+    print(flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--size", type=int, default=1024 * 1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files, cache_dir = Path(tmp, "files"), Path(tmp, "cache")
+        files.mkdir()
+        (files / "file").write_bytes(os.urandom(args.size))
+        with Server(make_server(directory=files)) as server:
+            bench("no cache", server, None, args.requests)
+            bench("warm cache", server, DiskCache(cache_dir), args.requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare module-level `requests.get`, which connects afresh every call,
+against a `kmg.kitchen.requests.session`, which reuses its connections,
+against a local `kmg.kitchen.http` server. Prints one JSON line for each.
+
+    python benchmarks/requests_reuse.py [--requests 2000] [--certs C --privkey K]
+"""
+
+import argparse
+import json
+import ssl
+import sys
+import time
+
+import requests
+
+from kmg.kitchen.histogram import Histogram
+from kmg.kitchen.http import Server, make_server
+from kmg.kitchen.https import make_context
+from kmg.kitchen.requests import session
+
+
+def bench(label: str, get, url: str, count: int):
+    latency = Histogram()
+    for _ in range(count):
+        started = time.perf_counter_ns()
+        get(url)
+        latency.record((time.perf_counter_ns() - started) // 1000)
+    json.dump({"label": label, "latency_us": latency.summary()}, sys.stdout)
+    print(flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--certs")
+    parser.add_argument("--privkey")
+    args = parser.parse_args()
+
+    schemes: list[tuple[str, ssl.SSLContext | None]] = [("http", None)]
+    if args.certs and args.privkey:
+        schemes.append(("https", make_context(args.certs, args.privkey)))
+
+    for scheme, ssl_context in schemes:
+        with Server(make_server(ssl_context=ssl_context)) as server:
+            verify = {"verify": False} if ssl_context else {}
+            bench(
+                f"{scheme} requests.get",
+                lambda url: requests.get(url, **verify),
+                server.url,
+                args.requests,
+            )
+            with session() as s:
+                bench(
+                    f"{scheme} session",
+                    lambda url: s.get(url, **verify),
+                    server.url,
+                    args.requests,
+                )
+
+
+if __name__ == "__main__":
+    main()
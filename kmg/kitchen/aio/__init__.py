@@ -2,12 +2,20 @@ from .cancellation import (
     CancelledFromInside,
     CancelledFromOutside,
     distinguish_cancellation,
+    distinguishing_cancellation,
 )
+from .fs import atomic_write
+from .monitor import LoopMonitor
+from .pool import bounded_map
 from .signals import check_signal
 
 __all__ = [
+    "atomic_write",
+    "bounded_map",
     "check_signal",
+    "LoopMonitor",
     "CancelledFromOutside",
     "CancelledFromInside",
     "distinguish_cancellation",
+    "distinguishing_cancellation",
 ]
@@ -1,5 +1,6 @@
 import asyncio
-from typing import Any, Coroutine, TypeVar
+import functools
+from typing import Any, Awaitable, Callable, Coroutine, TypeVar
 
 # https://gist.github.com/twisteroidambassador/f35c7b17d4493d492fe36ab3e5c92202
 
@@ -14,35 +15,63 @@ class CancelledFromInside(asyncio.CancelledError):
 
 T = TypeVar("T")
 
-# TODO: to ensure this is handled (cuz nested would get fucky), perhaps not exceptions but matchable return types?
-# alternatively, test with nesting.
-async def distinguish_cancellation(fut: Coroutine[T, Any, Any] | asyncio.Task[T]) -> T:
-    """Wait for a future. If cancelled, raise different exceptions depending
-    on who did the cancellation.
-    If fut was cancelled, propagate cancellation outward by raising
-    CancelledFromInside.
-    If this function was cancelled, cancel fut, and raise CancelledFromOutside.
+
+class distinguishing_cancellation:
+    """
+    A context manager telling apart who cancelled what's awaited in it.
+    If the current task was cancelled, CancelledError is raised as
+    CancelledFromOutside. If something it awaited was cancelled
+    (a task, or a future), it's raised as CancelledFromInside.
+
+    It needs no extra task: the task's `cancelling()` count says whether it
+    was cancelled while in the block. Nested uses agree with each other,
+    an outer one seeing CancelledFromOutside raised by an inner one as
+    coming from outside it too (and likewise from inside).
+
+    Also usable as a decorator for coroutine functions.
     """
-    if isinstance(fut, asyncio.Task):
-        task = fut
-    else:
-        task = asyncio.create_task(fut)
 
-    try:
-        # will only return once task is cancelled.
-        await asyncio.wait((task,))
-    except asyncio.CancelledError:
-        # if this was raised, that means _this_ function was cancelled, not `task`.
+    __slots__ = ("_task", "_cancelling")
 
-        # TODO: can we / do we need to optionally disable this?
-        # will shielding fut cancel it, so we can leave it up to the caller?
-        task.cancel()
-        raise CancelledFromOutside
+    def __enter__(self):
+        task = asyncio.current_task()
+        if task is None:
+            raise RuntimeError("distinguishing_cancellation must be used in a task")
+        self._task = task
+        self._cancelling = task.cancelling()
+        return self
 
-    assert task.done()
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None or not issubclass(exc_type, asyncio.CancelledError):
+            return
+        if self._task.cancelling() > self._cancelling:
+            error = CancelledFromOutside
+        else:
+            error = CancelledFromInside
+        if not isinstance(exc, error):
+            raise error(*exc.args)
 
-    # this means it returned because `task` was cancelled.
-    if task.cancelled():
-        raise CancelledFromInside
+    def __call__(
+        self, fn: Callable[..., Awaitable[T]]
+    ) -> Callable[..., Coroutine[Any, Any, T]]:
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs) -> T:
+            with distinguishing_cancellation():
+                return await fn(*args, **kwargs)
 
-    return task.result()
+        return wrapper
+
+
+async def distinguish_cancellation(
+    fut: Coroutine[Any, Any, T] | asyncio.Future[T],
+) -> T:
+    """Wait for a future. If cancelled, raise different exceptions depending
+    on who did the cancellation.
+    If fut was cancelled, propagate cancellation outward by raising
+    CancelledFromInside.
+    If this function was cancelled, cancel fut, and raise CancelledFromOutside.
+
+    A coroutine is run in the current task (see `distinguishing_cancellation`).
+    """
+    with distinguishing_cancellation():
+        return await fut
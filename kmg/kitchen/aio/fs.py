@@ -0,0 +1,116 @@
+"""
+An asyncio counterpart to `kmg.kitchen.fs.atomic_replace`, doing the blocking
+writes, fsyncs and rename on a bounded pool of threads instead of the loop.
+"""
+
+import asyncio
+import contextlib
+import tempfile
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, AsyncIterable, Callable, Iterable, TypeVar
+
+from ..fs import Durability, commit_temporary, discard_temporary
+from .cancellation import distinguishing_cancellation
+
+DEFAULT_WORKERS = 8
+"How many threads the default executor has, bounding concurrent file work."
+WRITE_SIZE = 256 * 1024
+"Chunks are gathered up to this size before each write, to save thread hops."
+
+T = TypeVar("T")
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _default_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(DEFAULT_WORKERS, thread_name_prefix="kmg-aio-fs")
+    return _executor
+
+
+async def _step(executor: Executor, fn: Callable[..., T], *args) -> T:
+    """
+    Run fn in executor. If we're cancelled meanwhile, the thread carries on
+    regardless, so wait for it (however many more times we're cancelled)
+    before letting the cancellation through, so that whoever cleans up knows
+    where things stand.
+    """
+    future = asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        while not future.done():
+            with contextlib.suppress(asyncio.CancelledError):
+                await asyncio.wait((future,))
+        raise
+
+
+async def _chunks(
+    data: bytes | Iterable[bytes] | AsyncIterable[bytes],
+) -> AsyncIterable[bytes]:
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        yield data
+    elif isinstance(data, AsyncIterable):
+        async for chunk in data:
+            yield chunk
+    else:
+        for chunk in data:
+            yield chunk
+
+
+async def _write(
+    target: Path,
+    data: bytes | Iterable[bytes] | AsyncIterable[bytes],
+    durability: Durability,
+    executor: Executor,
+):
+    # kept here, so that it's cleaned up even if we're cancelled as it's made.
+    created: list[IO[bytes]] = []
+    try:
+        await _step(
+            executor,
+            lambda: created.append(
+                tempfile.NamedTemporaryFile(dir=target.parent, delete=False)
+            ),
+        )
+        (f,) = created
+        pending: list[bytes] = []
+        size = 0
+        async for chunk in _chunks(data):
+            pending.append(chunk)
+            size += len(chunk)
+            if size >= WRITE_SIZE:
+                await _step(executor, f.writelines, pending)
+                pending, size = [], 0
+        if pending:
+            await _step(executor, f.writelines, pending)
+        await _step(executor, commit_temporary, f, target, durability)
+    except BaseException:
+        # including cancellation: a commit that got underway may have finished.
+        # Done right here, since it's quick, so a further cancellation
+        # can't leave the file behind.
+        for f in created:
+            discard_temporary(f)
+        raise
+
+
+async def atomic_write(
+    target: Path,
+    data: bytes | Iterable[bytes] | AsyncIterable[bytes],
+    durability: Durability = Durability.FILE,
+    executor: Executor | None = None,
+):
+    """
+    Atomically replace target with data (bytes, or an iterable or async
+    iterable of chunks), as `fs.atomic_replace` would, without blocking the loop.
+
+    The blocking work runs on executor, by default a shared pool of
+    `DEFAULT_WORKERS` threads. Whatever happens, the temporary file is cleaned
+    up before this returns or raises: `CancelledFromOutside` if the caller was
+    cancelled, or `CancelledFromInside` if data was (e.g. its producer).
+    If cancelled as the rename was underway, target may still be replaced.
+    """
+    with distinguishing_cancellation():
+        await _write(target, data, durability, executor or _default_executor())
@@ -0,0 +1,259 @@
+"""
+An asyncio-native counterpart to `kmg.kitchen.http`, for running the test
+server inside an existing event loop rather than on a background thread.
+"""
+
+import asyncio
+from ssl import SSLContext
+
+from ..http import (
+    DEFAULT_ADDR,
+    DEFAULT_HANDSHAKE_TIMEOUT,
+    DEFAULT_PORT,
+    DEFAULT_RESPONSE_TEXT,
+    CannedResponse,
+    format_url,
+)
+from .cancellation import CancelledFromInside, distinguishing_cancellation
+
+DEFAULT_IDLE_TIMEOUT = 60.0
+"""
+How long a keep-alive connection may sit idle before it's closed, in seconds.
+Longer than the threaded server's, since idle connections here don't hold a thread.
+"""
+MAX_HEAD_SIZE = 64 * 1024
+"The largest request line and headers accepted before giving up on a client."
+MAX_BODY_SIZE = 1024 * 1024
+"The largest request body accepted (and ignored, as it arrives)."
+SWEEP_INTERVAL = 1.0
+"How often idle connections are looked for, in seconds."
+
+BAD_REQUEST = (
+    b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+)
+NOT_IMPLEMENTED = (
+    b"HTTP/1.1 501 Not Implemented\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+)
+
+
+class _ResponseProtocol(asyncio.Protocol):
+    """
+    A minimal HTTP/1.1 connection: answers every GET with the canned response,
+    keeping the connection alive and answering pipelined requests in order.
+    """
+
+    # kept small, since there may be tens of thousands of these sitting idle.
+    __slots__ = ("server", "transport", "buffer", "skipping", "last_active", "paused")
+
+    def __init__(self, server: "AsyncServer"):
+        self.server = server
+        self.transport: asyncio.Transport | None = None
+        self.buffer = b""
+        self.skipping = 0
+        "How much more of a request body to drop before the next request."
+        self.last_active = 0.0
+        self.paused = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.last_active = self.server._loop.time()
+        self.server._connections.add(self)
+
+    def connection_lost(self, exc):
+        self.server._connections.discard(self)
+        self.transport = None
+
+    def data_received(self, data: bytes):
+        self.last_active = self.server._loop.time()
+        self.buffer = self.buffer + data if self.buffer else data
+        if not self.paused:
+            self._process()
+
+    def pause_writing(self):
+        # stop answering (and reading) until the client catches up.
+        self.paused = True
+        if self.transport is not None:
+            self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.paused = False
+        if self.transport is not None:
+            self.transport.resume_reading()
+            self._process()
+
+    def _process(self):
+        transport = self.transport
+        while transport is not None and not self.paused and self.buffer:
+            if self.skipping:
+                dropped = min(self.skipping, len(self.buffer))
+                self.buffer = self.buffer[dropped:]
+                self.skipping -= dropped
+                continue
+
+            end = self.buffer.find(b"\r\n\r\n")
+            if end < 0:
+                if len(self.buffer) > MAX_HEAD_SIZE:
+                    self._fail(BAD_REQUEST)
+                return
+
+            request_line, *header_lines = self.buffer[:end].split(b"\r\n")
+            try:
+                method, _target, version = request_line.split(b" ")
+                headers = {}
+                for line in header_lines:
+                    name, value = line.split(b":", 1)
+                    headers[name.strip().lower()] = value.strip().lower()
+            except ValueError:
+                return self._fail(BAD_REQUEST)
+            length = headers.get(b"content-length", b"0")
+            if not length.isdigit() or int(length) > MAX_BODY_SIZE:
+                return self._fail(BAD_REQUEST)
+
+            if b"transfer-encoding" in headers or not version.startswith(b"HTTP/1."):
+                return self._fail(NOT_IMPLEMENTED)
+            # the body is ignored, so it's dropped as it arrives.
+            self.buffer = self.buffer[end + 4 :]
+            self.skipping = int(length)
+
+            if method != b"GET":
+                return self._fail(NOT_IMPLEMENTED)
+
+            connection = headers.get(b"connection")
+            if version == b"HTTP/1.0":
+                close = connection != b"keep-alive"
+                # it won't reuse the connection unless told it can.
+                transport.write(self.server.response.render(close, not close))
+            else:
+                close = connection == b"close"
+                transport.write(self.server.response.render(close))
+            if close:
+                self.buffer = b""
+                transport.close()
+                return
+
+    def _fail(self, response: bytes):
+        self.buffer = b""
+        if self.transport is not None:
+            self.transport.write(response)
+            self.transport.close()
+
+
+class AsyncServer:
+    """
+    A simple HTTP(s) server that responds to all requests with
+    the given response_text, served from the running event loop.
+
+    Use it as an async context manager, or call `serve_forever`.
+    """
+
+    def __init__(
+        self,
+        address: str = DEFAULT_ADDR,
+        port: int = DEFAULT_PORT,
+        ssl_context: SSLContext | None = None,
+        response_text: bytes = DEFAULT_RESPONSE_TEXT,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        handshake_timeout: float = DEFAULT_HANDSHAKE_TIMEOUT,
+    ):
+        self.bind_address = address
+        self.bind_port = port
+        self.ssl_context = ssl_context
+        self.response = CannedResponse(response_text, protocol_version="HTTP/1.1")
+        self.idle_timeout = idle_timeout
+        self.handshake_timeout = handshake_timeout
+        self.server: asyncio.Server | None = None
+        self._loop: asyncio.AbstractEventLoop = None  # type: ignore  # set by start
+        self._connections: set[_ResponseProtocol] = set()
+        self._sweeper: asyncio.TimerHandle | None = None
+        self._stopping = False
+
+    @property
+    def protocol(self) -> str:
+        "HTTP or HTTPS?"
+        return "http" if self.ssl_context is None else "https"
+
+    @property
+    def address(self) -> str:
+        assert self.server is not None, "server has not been started"
+        return self.server.sockets[0].getsockname()[0]
+
+    @property
+    def port(self) -> int:
+        assert self.server is not None, "server has not been started"
+        return self.server.sockets[0].getsockname()[1]
+
+    @property
+    def url(self) -> str:
+        "The base URL that the server is reachable by."
+        assert self.server is not None, "server has not been started"
+        return format_url(self.protocol, self.server.sockets[0].getsockname())
+
+    @property
+    def connections(self) -> int:
+        "How many connections are currently open."
+        return len(self._connections)
+
+    async def start(self):
+        "Start listening."
+        self._loop = loop = asyncio.get_running_loop()
+        self._stopping = False
+        self.server = await loop.create_server(
+            lambda: _ResponseProtocol(self),
+            self.bind_address,
+            self.bind_port,
+            ssl=self.ssl_context,
+            ssl_handshake_timeout=self.handshake_timeout if self.ssl_context else None,
+            reuse_address=True,
+        )
+        self._sweeper = loop.call_later(SWEEP_INTERVAL, self._sweep)
+
+    def _sweep(self):
+        "Close connections that have been idle too long."
+        loop = self._loop
+        cutoff = loop.time() - self.idle_timeout
+        for conn in [c for c in self._connections if c.last_active < cutoff]:
+            if conn.transport is not None:
+                conn.transport.close()
+        self._sweeper = loop.call_later(SWEEP_INTERVAL, self._sweep)
+
+    async def stop(self):
+        "Stop listening, close every connection, and wait for it all to finish."
+        if self.server is None:
+            return
+        self._stopping = True
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        self.server.close()
+        for conn in list(self._connections):
+            if conn.transport is not None:
+                conn.transport.close()
+        await self.server.wait_closed()
+
+    async def serve_forever(self):
+        """
+        Serve until cancelled or stopped, then shut down.
+        Cancelling the caller raises `CancelledFromOutside`;
+        if the server is closed out from under it by anything but `stop`,
+        `CancelledFromInside` is raised.
+        """
+        if self.server is None:
+            await self.start()
+        assert self.server is not None
+        try:
+            with distinguishing_cancellation():
+                await self.server.serve_forever()
+        except CancelledFromInside:
+            if not self._stopping:
+                raise
+        finally:
+            await self.stop()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def __str__(self):
+        return f"{self.protocol} serving at {self.url}"
@@ -0,0 +1,206 @@
+"""
+Watching an event loop for lag and for whatever blocks it: see `LoopMonitor`.
+"""
+
+import asyncio
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Callable, Coroutine
+
+from ..histogram import Histogram
+
+DEFAULT_INTERVAL = 0.05
+"How often the heartbeat runs, in seconds."
+DEFAULT_THRESHOLD = 0.1
+"How long the loop must be held up to count as a stall, in seconds."
+DEFAULT_KEEP = 100
+"How many of the latest stalls are kept."
+STACK_DEPTH = 32
+"How many frames of a stalled loop's stack are kept."
+
+logger = logging.getLogger(__name__)
+
+
+class Stall:
+    "A time the loop was held up by a slow callback or task step."
+
+    __slots__ = ("due", "started", "duration", "task", "stack")
+
+    def __init__(self, due: float, task: str | None, stack: list[str]):
+        self.due = due
+        "When (by `time.monotonic`) the heartbeat held up was due."
+        self.started = time.time()
+        self.duration: float | None = None
+        "How long the loop was held up for, in seconds, or None if it still is."
+        self.task = task
+        "The qualname of the coroutine the running task was in, if any."
+        self.stack = stack
+        "The loop thread's stack, innermost frame last, when it was seen stalled."
+
+    def as_dict(self) -> dict:
+        return {
+            "started": self.started,
+            "duration": self.duration,
+            "task": self.task,
+            "stack": self.stack,
+        }
+
+
+class LoopMonitor:
+    """
+    Measures an event loop's lag, how late a heartbeat callback scheduled
+    every interval seconds runs, into `lag_us` (a Histogram, in µs).
+
+    A watchdog thread notices when the heartbeat is more than threshold
+    seconds late, meaning something is blocking the loop, and records a
+    `Stall` with the loop thread's stack and the running task's coroutine,
+    sampled while it's stuck. Stalls too short for the watchdog to catch
+    are still recorded, without a stack.
+
+    Also counts the tasks created, through a task factory (wrapping any
+    already set), and can log a `snapshot` every dump_interval seconds
+    (or pass it to dump).
+
+    The heartbeat is one callback per interval, and the watchdog doesn't
+    touch the loop, so it's cheap enough to leave running.
+    Use it as a context manager, or `start` and `stop` it, in the loop.
+    """
+
+    def __init__(
+        self,
+        interval: float = DEFAULT_INTERVAL,
+        threshold: float = DEFAULT_THRESHOLD,
+        keep: int = DEFAULT_KEEP,
+        dump_interval: float | None = None,
+        dump: Callable[[dict], None] | None = None,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.dump_interval = dump_interval
+        self.dump = dump or (lambda snapshot: logger.info(json.dumps(snapshot)))
+        self.lag_us = Histogram()
+        self.stalls: deque[Stall] = deque(maxlen=keep)
+        self.tasks_created = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread = 0
+        self._previous_factory = None
+        self._due = 0.0
+        self._stall: Stall | None = None
+        self._lock = threading.Lock()  # between the heartbeat and the watchdog
+        self._stopping = threading.Event()
+        self._watchdog: threading.Thread | None = None
+        self._beat_handle: asyncio.TimerHandle | None = None
+        self._dump_handle: asyncio.TimerHandle | None = None
+
+    def start(self):
+        "Start monitoring the running loop."
+        if self._loop is not None:
+            raise RuntimeError("already started")
+        loop = self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._previous_factory = loop.get_task_factory()
+        loop.set_task_factory(self._task_factory)  # type: ignore
+        self._stopping.clear()
+        self._due = time.monotonic() + self.interval
+        self._beat_handle = loop.call_later(self.interval, self._beat)
+        if self.dump_interval is not None:
+            self._dump_handle = loop.call_later(self.dump_interval, self._dump)
+        self._watchdog = threading.Thread(
+            target=self._watch, daemon=True, name="kmg-loop-monitor"
+        )
+        self._watchdog.start()
+
+    def stop(self):
+        "Stop monitoring, keeping what was recorded."
+        loop = self._loop
+        if loop is None:
+            return
+        for handle in (self._beat_handle, self._dump_handle):
+            if handle is not None:
+                handle.cancel()
+        if loop.get_task_factory() == self._task_factory:
+            loop.set_task_factory(self._previous_factory)
+        self._stopping.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+        self._loop = None
+
+    def _task_factory(
+        self, loop: asyncio.AbstractEventLoop, coro: Coroutine[Any, Any, Any], **kwargs
+    ) -> asyncio.Future:
+        self.tasks_created += 1
+        if self._previous_factory is not None:
+            return self._previous_factory(loop, coro, **kwargs)
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+    def _beat(self):
+        assert self._loop is not None
+        now = time.monotonic()
+        with self._lock:
+            due, self._due = self._due, now + self.interval
+            stall, self._stall = self._stall, None
+        self._beat_handle = self._loop.call_later(self.interval, self._beat)
+        lag = max(now - due, 0.0)
+        self.lag_us.record(int(lag * 1e6))
+        if stall is None and lag >= self.threshold:  # too quick for the watchdog
+            stall = Stall(due, None, [])
+            self.stalls.append(stall)
+        if stall is not None:
+            stall.duration = lag
+
+    def _watch(self):
+        "The watchdog thread's body."
+        check = self.threshold / 2
+        while not self._stopping.wait(check):
+            due = self._due
+            if time.monotonic() - due < self.threshold:
+                continue
+            with self._lock:
+                if self._stall is not None or due != self._due:
+                    continue  # already seen, or the heartbeat just ran
+                self._stall = stall = self._sample(due)
+            self.stalls.append(stall)
+
+    def _sample(self, due: float) -> Stall:
+        "What the loop thread is doing, as seen from the watchdog."
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = []
+        if frame is not None:
+            summary = traceback.extract_stack(frame, limit=STACK_DEPTH)
+            stack = [f"{f.filename}:{f.lineno} in {f.name}" for f in summary]
+        task = asyncio.current_task(self._loop) if self._loop is not None else None
+        qualname = None
+        if task is not None:
+            coro = task.get_coro()
+            qualname = getattr(coro, "__qualname__", None) or repr(coro)
+        return Stall(due, qualname, stack)
+
+    def _dump(self):
+        assert self._loop is not None and self.dump_interval is not None
+        self._dump_handle = self._loop.call_later(self.dump_interval, self._dump)
+        try:
+            self.dump(self.snapshot())
+        except Exception:
+            logger.exception("Failed to dump loop monitor snapshot")
+
+    def snapshot(self) -> dict:
+        "Everything recorded so far, as JSON-friendly data. Lags are in µs."
+        loop = self._loop
+        return {
+            "lag_us": self.lag_us.summary(),
+            "stalls": [stall.as_dict() for stall in list(self.stalls)],
+            "tasks_alive": len(asyncio.all_tasks(loop)) if loop is not None else 0,
+            "tasks_created": self.tasks_created,
+        }
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
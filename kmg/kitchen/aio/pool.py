@@ -0,0 +1,121 @@
+"""
+Mapping a coroutine function over many items, a bounded number at a time:
+see `bounded_map`.
+"""
+
+import asyncio
+import signal as signals
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Coroutine,
+    Iterable,
+    TypeVar,
+)
+
+from .cancellation import CancelledFromInside, distinguishing_cancellation
+from .signals import SignalError, check_signal
+
+DEFAULT_CONCURRENCY = 16
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def _aiter(items: Iterable[T] | AsyncIterable[T]) -> AsyncIterator[T]:
+    if isinstance(items, AsyncIterable):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def bounded_map(
+    fn: Callable[[T], Coroutine[Any, Any, R]],
+    items: Iterable[T] | AsyncIterable[T],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    ordered: bool = False,
+    max_pending: int | None = None,
+    signal: signals.Signals | None = None,
+) -> AsyncIterator[R]:
+    """
+    Yield fn(item) for each of items (sync or async, read lazily),
+    running at most concurrency of them at once, as they finish or,
+    if ordered, in the order of items.
+
+    At most max_pending items (4 * concurrency by default) are read but not
+    yet yielded, so when ordered, one slow item holds up reading more rather
+    than letting finished ones pile up. Memory use depends on these,
+    not on how many items there are.
+
+    If fn raises, the others running are cancelled and waited for,
+    and the error raised. Likewise if the caller is cancelled
+    (`CancelledFromOutside`), or one of them is (`CancelledFromInside`),
+    or the caller stops iterating (use `contextlib.aclosing` to make sure).
+
+    If signal is given and arrives, no more items are started: those running
+    finish and are yielded, then `SignalError` is raised.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    max_pending = max_pending or 4 * concurrency
+    source = _aiter(items)
+    exhausted = False
+    interrupted: SignalError | None = None
+    read = yielded = 0
+    running: dict[asyncio.Task, int] = {}
+    finished: dict[int, R] = {}  # when ordered, waiting for their turn
+    done: asyncio.Queue[asyncio.Task] = asyncio.Queue()
+    try:
+        while True:
+            while (
+                not exhausted
+                and interrupted is None
+                and len(running) < concurrency
+                and read - yielded < max_pending
+            ):
+                with distinguishing_cancellation():
+                    try:
+                        item = await anext(source)
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                task = asyncio.create_task(fn(item))
+                task.add_done_callback(done.put_nowait)
+                running[task] = read
+                read += 1
+            if not running:
+                break
+
+            with distinguishing_cancellation():
+                if signal is None or interrupted is not None:
+                    task = await done.get()
+                else:
+                    try:
+                        task = await check_signal(done.get(), signal)
+                    except SignalError as e:
+                        interrupted = e
+                        continue
+            index = running.pop(task)
+            if task.cancelled():
+                raise CancelledFromInside
+            result = task.result()
+            if not ordered:
+                yielded += 1
+                yield result
+                continue
+            finished[index] = result
+            while yielded in finished:
+                yielded += 1
+                yield finished.pop(yielded - 1)
+        if interrupted is not None:
+            raise interrupted
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.wait(running)
+        await source.aclose()  # type: ignore
@@ -1,40 +1,87 @@
 import asyncio
 import collections.abc as abc
 import signal
-from collections import UserDict
+import weakref
 from typing import Any, TypeVar
 
 
-class _SignalListenerMap(UserDict[int, asyncio.Event]):
-    def handle(self):
-        for event in self.data.values():
-            event.set()
-            # TODO: it says set _immediately_ wakes them up, so is immediate clearing okay?
-            event.clear()
+class _Cancel:
+    """
+    The one cancellation an arrival of the signal makes of a task, shared by
+    all its `check_signal` calls (nested ones, say) waiting for that signal.
+    """
 
-    def __getitem__(self, id: int) -> asyncio.Event:
-        if id not in self.data:
-            self.data[id] = event = asyncio.Event()
-            return event
-        else:
-            return self.data[id]
+    __slots__ = ("uncancelled",)
 
+    def __init__(self):
+        self.uncancelled = False
+        "Whether one of the calls has taken it back with `Task.uncancel`."
 
-class _SignalMap(UserDict[signal.Signals, _SignalListenerMap]):
-    def listener_map_for(self, signal: signal.Signals) -> _SignalListenerMap:
-        "Idempotently register the handler for the given signal. Returns the map."
-        if signal in self:
-            return self[signal]
-        task_mapper = _SignalListenerMap()
-        self[signal] = task_mapper
 
-        loop = asyncio.get_running_loop()
-        loop.add_signal_handler(signal, task_mapper.handle)
+class _Scope:
+    "One `check_signal` call: the task it runs in, and if the signal cancelled it."
 
-        return task_mapper
+    __slots__ = ("task", "cancel")
 
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.cancel: _Cancel | None = None
 
-_SIGNAL_MAP = _SignalMap()
+
+class _SignalListeners:
+    """
+    The calls waiting for one signal in one loop. When it arrives, they're all
+    cancelled, and the next calls wait for the next arrival (generation).
+    """
+
+    __slots__ = ("scopes", "generation")
+
+    def __init__(self):
+        # a dict, for O(1) removal, in the order they started.
+        self.scopes: dict[_Scope, None] = {}
+        self.generation = 0
+        "How many times the signal has arrived."
+
+    def handle(self):
+        self.generation += 1
+        scopes, self.scopes = self.scopes, {}
+        cancels: dict[asyncio.Task, _Cancel] = {}
+        for scope in scopes:
+            cancel = cancels.get(scope.task)
+            if cancel is None:  # cancel each task just once
+                cancels[scope.task] = cancel = _Cancel()
+                scope.task.cancel()
+            scope.cancel = cancel
+
+
+class _SignalMap(dict[signal.Signals, _SignalListeners]):
+    """
+    The signals listened for in one loop. It doesn't refer to the loop,
+    so that the registry's entry goes when the loop does.
+    """
+
+    def listeners_for(
+        self, loop: asyncio.AbstractEventLoop, signal: signal.Signals
+    ) -> _SignalListeners:
+        "Idempotently register the handler for the given signal. Returns the listeners."
+        listeners = self.get(signal)
+        if listeners is None:
+            self[signal] = listeners = _SignalListeners()
+            loop.add_signal_handler(signal, listeners.handle)
+        return listeners
+
+
+_SIGNAL_MAPS: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _SignalMap] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _signal_map(loop: asyncio.AbstractEventLoop | None = None) -> _SignalMap:
+    loop = loop or asyncio.get_running_loop()
+    signal_map = _SIGNAL_MAPS.get(loop)
+    if signal_map is None:
+        _SIGNAL_MAPS[loop] = signal_map = _SignalMap()
+    return signal_map
 
 
 class SignalError(Exception):
@@ -49,36 +96,51 @@ T = TypeVar("T")
 
 
 async def check_signal(
-    awaitable: abc.Coroutine[Any, Any, T] | asyncio.Task[T],
+    awaitable: abc.Coroutine[Any, Any, T] | asyncio.Future[T],
     signal: signal.Signals,
 ) -> T:
     """
     Run a coroutine, raising an exception if a signal is recieved while doing so.
+
+    The coroutine runs in the current task, which is cancelled (as with
+    `asyncio.timeout`) when the signal arrives, so it can clean up before
+    SignalError is raised. A task (or other future) is waited for, but left
+    running. Either way, this costs no extra tasks, and waiting callers
+    are woken in one pass when the signal arrives.
     """
 
     match awaitable:
-        case asyncio.Task():
-            awaitable_task = awaitable
+        case asyncio.Future():  # including Tasks
+            waiting = asyncio.shield(awaitable)
         case _ if asyncio.iscoroutine(awaitable):
-            # type doesn't propogate because iscoroutine is a type guard that doesn't have an overload
-            awaitable_task: asyncio.Task[T] = asyncio.create_task(awaitable)
+            waiting = awaitable
         case _:
             raise TypeError("awaitable must be a coroutine or task")
 
-    task_id = id(awaitable_task)
-    signal_listener_map = _SIGNAL_MAP.listener_map_for(signal)
-    event = signal_listener_map[task_id]
-    event_task = asyncio.create_task(event.wait())
-
-    done, _pending = await asyncio.wait(
-        (event_task, awaitable_task), return_when=asyncio.FIRST_COMPLETED
-    )
-
-    del signal_listener_map[task_id]
-
-    if event_task in done:
+    task = asyncio.current_task()
+    if task is None:
+        raise RuntimeError("check_signal must be called from a task")
+    loop = asyncio.get_running_loop()
+    listeners = _signal_map(loop).listeners_for(loop, signal)
+    scope = _Scope(task)
+    listeners.scopes[scope] = None
+    cancelling = task.cancelling()
+    try:
+        result = await waiting
+    except asyncio.CancelledError:
+        cancel = scope.cancel
+        if cancel is None or cancel.uncancelled:
+            raise  # not ours, or ours was already taken back by a nested call
+        cancel.uncancelled = True
+        if task.uncancel() > cancelling:
+            raise  # (also) cancelled by someone else
+        raise SignalError(signal=signal) from None
+    finally:
+        listeners.scopes.pop(scope, None)
+
+    if scope.cancel is not None:  # the coroutine swallowed our cancellation
+        if not scope.cancel.uncancelled:
+            scope.cancel.uncancelled = True
+            task.uncancel()
         raise SignalError(signal=signal)
-    elif awaitable_task in done:
-        return awaitable_task.result()
-    else:
-        raise RuntimeError("asyncio.wait returned even though no tasks were done")
+    return result
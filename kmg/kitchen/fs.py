@@ -1,19 +1,227 @@
 import contextlib
+import enum
+import errno
+import mmap
 import os
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import IO, Iterator
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None  # type: ignore
+
+FICLONE = 0x40049409
+"Linux's ioctl for sharing a whole file's extents (a reflink), from linux/fs.h."
+COPY_CHUNK_SIZE = 1024 * 1024
+# what cloning or copy_file_range fail with when the filesystem can't do it.
+_UNSUPPORTED = frozenset(
+    {
+        errno.EOPNOTSUPP,
+        errno.ENOTTY,
+        errno.EXDEV,
+        errno.EINVAL,
+        errno.ENOSYS,
+        errno.EBADF,
+    }
+)
+
+
+class Durability(enum.Enum):
+    "How hard `atomic_replace` and `AtomicBatch` work to survive a crash."
+
+    NONE = "none"
+    "Atomic, but after a crash the new file may be lost, or even empty."
+    FILE = "file"
+    "fsync the file before it's renamed, so its contents are on disk."
+    DIRECTORY = "directory"
+    "fsync the directory after the rename too, so the rename is on disk."
+
+
+def fsync_directory(directory: Path):
+    "Make renames (and other entry changes) in directory durable."
+    fd = os.open(directory, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def commit_temporary(f: IO[bytes], target: Path, durability: Durability):
+    """
+    Make the temporary file f (in target's directory) as durable as asked,
+    and rename it over target.
+    """
+    f.flush()
+    if durability is not Durability.NONE:
+        os.fsync(f.fileno())
+    os.replace(f.name, target)
+    if durability is Durability.DIRECTORY:
+        fsync_directory(target.parent)
+
+
+def discard_temporary(f: IO[bytes]):
+    "Close and remove a temporary file, unless it's already been renamed."
+    f.close()
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(f.name)
 
 
 @contextlib.contextmanager
-def atomic_replace(target: Path, delete=True):
+def atomic_replace(target: Path, delete=True, durability=Durability.FILE):
     with tempfile.NamedTemporaryFile(
         dir=target.parent,
         delete=False,
     ) as f:
         try:
             yield f
-            os.replace(f.name, target)
-        finally:
-            f.close()
+            commit_temporary(f, target, durability)
+        except BaseException:
             if delete:
-                os.remove(f.name)
+                discard_temporary(f)
+            raise
+
+
+class AtomicBatch:
+    """
+    Stage writes to many files, then `commit` them together:
+    each file is replaced atomically, as with `atomic_replace`,
+    but the fsyncs are issued concurrently (so the filesystem can group them)
+    and each directory is fsynced once for the whole batch, not once per file.
+
+    A crash part way through a commit can leave some files replaced and
+    others not, but never a file half written.
+    As a context manager, it commits on success and aborts on error.
+    """
+
+    FSYNC_THREADS = 16
+
+    def __init__(self, durability: Durability = Durability.DIRECTORY):
+        self.durability = durability
+        self._staged: list[tuple[IO[bytes], Path]] = []
+
+    def open(self, target: Path) -> IO[bytes]:
+        "A file to write target's new contents to."
+        f = tempfile.NamedTemporaryFile(dir=target.parent, delete=False)
+        self._staged.append((f, target))
+        return f
+
+    def write(self, target: Path, data: bytes):
+        self.open(target).write(data)
+
+    def commit(self):
+        staged, self._staged = self._staged, []
+        try:
+            for f, _target in staged:
+                f.flush()
+            if self.durability is not Durability.NONE and staged:
+                threads = min(self.FSYNC_THREADS, len(staged))
+                with ThreadPoolExecutor(threads) as pool:
+                    list(
+                        pool.map(lambda f: os.fsync(f.fileno()), (f for f, _ in staged))
+                    )
+            for f, _target in staged:
+                f.close()
+        except BaseException:
+            self._abort(staged)
+            raise
+        for i, (f, target) in enumerate(staged):
+            try:
+                os.replace(f.name, target)
+            except BaseException:
+                self._abort(staged[i:])
+                raise
+        if self.durability is Durability.DIRECTORY:
+            for directory in {target.parent for _, target in staged}:
+                fsync_directory(directory)
+
+    def abort(self):
+        "Throw away everything staged."
+        staged, self._staged = self._staged, []
+        self._abort(staged)
+
+    @staticmethod
+    def _abort(staged: list[tuple[IO[bytes], Path]]):
+        for f, _target in staged:
+            discard_temporary(f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+def clone_file(src: IO[bytes], dst: IO[bytes]) -> str:
+    """
+    Make dst a copy of src (both opened in binary mode) as cheaply as
+    the filesystem allows, returning how: a "reflink" clone sharing the data
+    until either is written, an in-kernel "copy_file_range", or a plain "copy".
+    """
+    src_fd, dst_fd = src.fileno(), dst.fileno()
+    size = os.fstat(src_fd).st_size
+    os.ftruncate(dst_fd, 0)
+    if fcntl is not None:
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+            return "reflink"
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < size:
+                n = os.copy_file_range(
+                    src_fd, dst_fd, size - copied, offset_src=copied, offset_dst=copied
+                )
+                if n == 0:
+                    break
+                copied += n
+            return "copy_file_range"
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+
+    buffer = bytearray(COPY_CHUNK_SIZE)
+    with memoryview(buffer) as view:
+        while n := os.preadv(src_fd, [view], copied):
+            os.pwrite(dst_fd, view[:n], copied)
+            copied += n
+    return "copy"
+
+
+@contextlib.contextmanager
+def atomic_patch(
+    target: Path,
+    size: int | None = None,
+    durability: Durability = Durability.FILE,
+    delete=True,
+) -> Iterator[mmap.mmap]:
+    """
+    Atomically update parts of a (large) file in place, as far as the caller
+    can tell: target is copied with `clone_file` to a temporary file, which is
+    mapped writable for the caller to patch, and renamed over target
+    (as with `atomic_replace`) once the block exits without error.
+
+    The copy keeps target's permissions. If size is given, it's resized first.
+    Release any memoryviews of the mapping before the block ends.
+    """
+    with atomic_replace(target, delete, durability) as f:
+        with open(target, "rb") as src:
+            clone_file(src, f)
+            os.fchmod(f.fileno(), os.fstat(src.fileno()).st_mode & 0o7777)
+        if size is not None:
+            os.ftruncate(f.fileno(), size)
+        if not os.fstat(f.fileno()).st_size:
+            raise ValueError("can't map an empty file")
+        with mmap.mmap(f.fileno(), 0) as mapped:
+            yield mapped
+            if durability is not Durability.NONE:
+                mapped.flush()
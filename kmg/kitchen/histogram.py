@@ -0,0 +1,131 @@
+"""
+A small HdrHistogram-style histogram of non-negative integers (e.g. latencies).
+"""
+
+from array import array
+from typing import Iterable
+
+DEFAULT_PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+class Histogram:
+    """
+    A log-linear histogram: values are bucketed keeping `precision_bits`
+    significant bits, so the relative error is under 2 ** -(precision_bits - 1)
+    and memory grows with the log of the largest value, not the number recorded.
+    With the default of 7 bits, that's under 1% error,
+    and a range up to an hour in microseconds fits in about 2,000 counters.
+
+    Recording isn't thread-safe: keep one per thread and `merge` them.
+    """
+
+    def __init__(self, precision_bits: int = 7):
+        if precision_bits < 2:
+            raise ValueError("precision_bits must be at least 2")
+        self.precision_bits = precision_bits
+        self._sub_buckets = 1 << precision_bits
+        self._half = self._sub_buckets >> 1
+        self.counts = array("Q")
+        self.count = 0
+        self.total = 0
+        self.min: int | None = None
+        self.max: int | None = None
+
+    def _index(self, value: int) -> int:
+        if value < self._sub_buckets:
+            return value
+        shift = value.bit_length() - self.precision_bits
+        return (
+            self._sub_buckets + (shift - 1) * self._half + (value >> shift) - self._half
+        )
+
+    def _highest_equivalent(self, index: int) -> int:
+        "The largest value that lands in the bucket at index."
+        if index < self._sub_buckets:
+            return index
+        shift, sub_bucket = divmod(index - self._sub_buckets, self._half)
+        shift += 1
+        return ((sub_bucket + self._half) << shift) + (1 << shift) - 1
+
+    def record(self, value: int, count: int = 1):
+        "Record a value, count times."
+        if value < 0:
+            raise ValueError("can only record non-negative values")
+        index = self._index(value)
+        if index >= len(self.counts):
+            self.counts.extend(bytes(8 * (index + 1 - len(self.counts))))
+        self.counts[index] += count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram"):
+        "Add everything recorded in other to this histogram."
+        if other.precision_bits != self.precision_bits:
+            raise ValueError("can only merge histograms with the same precision")
+        if len(other.counts) > len(self.counts):
+            self.counts.extend(bytes(8 * (len(other.counts) - len(self.counts))))
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percentile: float) -> int:
+        """
+        The value at or below which the given percentage (0-100) of values fall.
+        Returns 0 if nothing has been recorded.
+        """
+        if not 0 <= percentile <= 100:
+            raise ValueError("percentile must be between 0 and 100")
+        if not self.count:
+            return 0
+        wanted = max(1, -(-self.count * percentile // 100))  # ceiling
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(self._highest_equivalent(index), self.max)  # type: ignore
+        return self.max  # type: ignore
+
+    def cumulative(self, bounds: Iterable[int]) -> list[int]:
+        """
+        How many values were at or below each of the (ascending) bounds,
+        to within the histogram's precision. Useful for fixed-bucket exporters.
+        """
+        result = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            last = min(self._index(bound), len(self.counts) - 1)
+            while index <= last:
+                seen += self.counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+    def percentiles(
+        self, percentiles: Iterable[float] = DEFAULT_PERCENTILES
+    ) -> dict[float, int]:
+        return {p: self.percentile(p) for p in percentiles}
+
+    def summary(self, percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> dict:
+        "A JSON-friendly summary, with percentiles keyed like `p99.9`."
+        return {
+            "count": self.count,
+            "min": self.min or 0,
+            "mean": self.mean,
+            "max": self.max or 0,
+            **{f"p{p:g}": v for p, v in self.percentiles(percentiles).items()},
+        }
@@ -4,51 +4,835 @@ A bare simple HTTP server, merely for testing.
 
 
 import contextlib
+import enum
+import logging
+import logging.handlers
+import multiprocessing
+import multiprocessing.connection
+import os
+import selectors
+import signal
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from socketserver import BaseRequestHandler
 from ssl import SSLContext, SSLSocket
-from threading import Thread
+from threading import Condition, Event, Thread
+from typing import Callable, Sequence, TextIO
+
+from .ipset import IPSet
+from .metrics import ServerMetrics
+from .static import StaticFiles
 
 DEFAULT_ADDR = "127.0.0.1"
 DEFAULT_PORT = 0  # random port
 DEFAULT_RESPONSE_TEXT = b"Hello, world!"
+DEFAULT_THREADS = 32
+DEFAULT_IDLE_TIMEOUT = 5.0
+"How long a keep-alive connection may sit idle before it's closed, in seconds."
+DEFAULT_MAX_REQUESTS = 1000
+"How many requests a keep-alive connection may make before it's closed."
+DEFAULT_HANDSHAKE_TIMEOUT = 10.0
+"How long a client gets to finish its TLS handshake, in seconds."
+DEFAULT_DRAIN_TIMEOUT = 5.0
+"How long draining waits for connections to finish, in seconds."
+
+logger = logging.getLogger(__name__)
+ACCESS_LOGGER = f"{__name__}.access"
+"The name of the logger `buffered_access_log` sets up."
+
+ListenAddress = str | tuple[str, int]
+"A host (on the port given alongside), or a (host, port) pair."
+
+
+def _family(host: str) -> socket.AddressFamily:
+    return socket.AF_INET6 if ":" in host else socket.AF_INET
+
+
+def listen_addresses(
+    address: ListenAddress | Sequence[ListenAddress], port: int
+) -> list[tuple[str, int]]:
+    "(host, port) pairs for one or more addresses, taking port for bare hosts."
+    if isinstance(address, str) or (
+        isinstance(address, tuple) and len(address) == 2 and isinstance(address[1], int)
+    ):
+        address = [address]  # type: ignore
+    pairs = [(a, port) if isinstance(a, str) else (str(a[0]), a[1]) for a in address]
+    if not pairs:
+        raise ValueError("need at least one address to listen on")
+    return pairs
+
+
+def dual_stack(addresses: Sequence[tuple[str, int]]) -> bool:
+    """
+    Whether IPv6 sockets among addresses should accept IPv4 too (so that ::
+    covers every address), which is only possible if no IPv4 addresses are
+    listened on alongside.
+    """
+    return all(_family(host) == socket.AF_INET6 for host, _ in addresses)
+
+
+def format_url(protocol: str, sockname: tuple) -> str:
+    "The base URL for a socket's (host, port, ...), bracketing IPv6 hosts."
+    host, port = sockname[:2]
+    if ":" in host:
+        host = f"[{host}]"
+    return f"{protocol}://{host}:{port}/"
+
+
+class CannedResponse:
+    """
+    A fixed response, serialized up front so it can be sent with one write.
+    Only the Date header changes, and it's re-rendered at most once a second.
+    """
+
+    def __init__(
+        self,
+        body: bytes,
+        status: int = 200,
+        reason: str = "ALL GOOD",
+        content_type: str = "text/plain",
+        protocol_version: str = "HTTP/1.0",
+    ):
+        self.body = body
+        handler = BaseHTTPRequestHandler
+        self._head = (
+            f"{protocol_version} {status} {reason}\r\n"
+            f"Server: {handler.server_version} {handler.sys_version}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+        ).encode("latin-1")
+        self._rendered = (-1, b"", b"", b"")
+
+    def render(self, close: bool = False, keep_alive: bool = False) -> bytes:
+        """
+        The whole response, with an up-to-date Date header.
+        If close is set, it includes a `Connection: close` header;
+        if keep_alive is, `Connection: keep-alive`, which HTTP/1.0 clients
+        need to see before they'll reuse the connection.
+        """
+        # one tuple, so threads never see a mismatched second and payload.
+        second, plain, closing, keeping = self._rendered
+        now = int(time.time())
+        if second != now:
+            date = b"Date: " + formatdate(now, usegmt=True).encode("latin-1")
+            plain = b"".join((self._head, date, b"\r\n\r\n", self.body))
+            closing = b"".join(
+                (self._head, date, b"\r\nConnection: close\r\n\r\n", self.body)
+            )
+            keeping = b"".join(
+                (self._head, date, b"\r\nConnection: keep-alive\r\n\r\n", self.body)
+            )
+            self._rendered = (now, plain, closing, keeping)
+        if close:
+            return closing
+        return keeping if keep_alive else plain
+
+
+def buffered_access_log(stream: TextIO = sys.stderr, capacity: int = 1024):
+    """
+    Set up the "kmg.kitchen.http.access" logger for `make_server`'s access_log,
+    to buffer up to `capacity` lines before writing them out to stream
+    (replacing any handlers it had). Errors are written immediately,
+    along with whatever was buffered.
+    """
+    target = logging.StreamHandler(stream)
+    target.setFormatter(logging.Formatter("%(message)s"))
+    logger = logging.getLogger(ACCESS_LOGGER)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    logger.addHandler(logging.handlers.MemoryHandler(capacity, logging.ERROR, target))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def _flush(log: logging.Logger):
+    "Write out whatever log's handlers have buffered."
+    for handler in log.handlers:
+        handler.flush()
+
+
+class _CountingReader:
+    "Wraps a handler's rfile, counting the bytes read through it."
+
+    __slots__ = ("file", "count")
+
+    def __init__(self, file):
+        self.file = file
+        self.count = 0
+
+    def readline(self, size: int = -1) -> bytes:
+        line = self.file.readline(size)
+        self.count += len(line)
+        return line
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        self.count += len(data)
+        return data
+
+    def take(self) -> int:
+        "The count since the last take."
+        count, self.count = self.count, 0
+        return count
+
+    @property
+    def closed(self) -> bool:
+        return self.file.closed
+
+    def close(self):
+        self.file.close()
+
+
+class _CountingWriter(_CountingReader):
+    "Wraps a handler's wfile, counting the bytes written through it."
+
+    __slots__ = ()
+
+    def write(self, data) -> int:
+        written = self.file.write(data)
+        self.count += written
+        return written
+
+    def flush(self):
+        self.file.flush()
+
+
+class Overload(enum.Enum):
+    "What a pooled server does with a connection when every slot is taken."
+
+    REJECT = "reject"
+    "Answer with a 503 and close the connection."
+    QUEUE = "queue"
+    "Stop accepting until a slot frees up, leaving clients in the listen backlog."
+
+
+REJECTED_RESPONSE = (
+    b"HTTP/1.0 503 Service Unavailable\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+
+
+class GracefulHTTPServer(HTTPServer):
+    """
+    An HTTPServer that stops as soon as it's asked to, and can drain.
+
+    `shutdown` wakes `serve_forever` through a pipe rather than waiting
+    for its next poll. `drain` stops taking new requests and waits for
+    those in flight, closing connections as they finish.
+
+    Connections from peers in `deny`, or not in `allow` (if set),
+    are closed as soon as they're accepted.
 
-# TODO: logging?
+    It can listen on several addresses (IPv4 or IPv6) at once: the first is
+    server_address, and `add_listener` adds more. One loop accepts from all.
+    """
+
+    allow: IPSet | None = None
+    deny: IPSet | None = None
+    max_handshakes: int | None = None
+    "How many TLS handshakes may run at once (see `start_handshake`)."
+    dual_stack = True
+    "Whether an IPv6 socket bound to :: accepts IPv4 connections too."
+
+    def __init__(
+        self,
+        server_address: tuple[str, int],
+        RequestHandlerClass: type[BaseRequestHandler],
+        bind_and_activate: bool = True,
+    ):
+        self.address_family = _family(server_address[0])
+        # all set before binding, which calls server_close if it fails.
+        self.sockets: list[socket.socket] = []
+        "Every listening socket, the first being `socket`."
+        self.draining = False
+        self.closing = False
+        self._shutdown_request = False
+        self._is_shut_down = Event()
+        self._is_shut_down.set()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self._connections: set[socket.socket] = set()
+        # oldest first, so the longest idle can be closed to make room.
+        self._idle: dict[socket.socket, None] = {}
+        self._changed = Condition()
+        self._handshaking = 0
+        super().__init__(server_address, RequestHandlerClass, bind_and_activate)
+        self.sockets.append(self.socket)
+        self._accepting = self.socket
+
+    def server_bind(self):
+        self._configure(self.socket)
+        super().server_bind()
+
+    def _configure(self, sock: socket.socket):
+        if sock.family == socket.AF_INET6:
+            sock.setsockopt(
+                socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, not self.dual_stack
+            )
+
+    def add_listener(self, server_address: tuple[str, int]) -> socket.socket:
+        "Listen on another address too, with the same socket options."
+        sock = socket.socket(_family(server_address[0]), self.socket_type)
+        try:
+            if self.allow_reuse_address:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.allow_reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self._configure(sock)
+            sock.bind(server_address)
+            sock.listen(self.request_queue_size)
+        except BaseException:
+            sock.close()
+            raise
+        self.sockets.append(sock)
+        return sock
+
+    def get_request(self):
+        return self._accepting.accept()
+
+    def serve_forever(self, poll_interval: float | None = None):
+        "Handle requests until `shutdown`. poll_interval is only for `service_actions`."
+        self._is_shut_down.clear()
+        try:
+            with selectors.DefaultSelector() as selector:
+                for sock in self.sockets:
+                    selector.register(sock, selectors.EVENT_READ, sock)
+                selector.register(self._wake_r, selectors.EVENT_READ)
+                while not self._shutdown_request:
+                    ready = selector.select(poll_interval)
+                    if self._shutdown_request:
+                        break
+                    for key, _ in ready:
+                        if key.data is not None:
+                            self._accepting = key.data
+                            self._handle_request_noblock()  # type: ignore
+                        else:
+                            os.read(self._wake_r, 64)
+                    self.service_actions()
+        finally:
+            self._shutdown_request = False
+            self._is_shut_down.set()
+
+    def shutdown(self, close_connections: bool = False):
+        """
+        Stop `serve_forever` and wait for it to return. Don't call it from there.
+        If close_connections, close any open connections rather than waiting
+        for a serial server to finish the one it's handling.
+        """
+        self._shutdown_request = True
+        os.write(self._wake_w, b"\0")
+        if close_connections:
+            self.close_connections()
+        self._is_shut_down.wait()
+
+    def verify_request(self, request, client_address) -> bool:
+        host = client_address[0]
+        if self.deny is not None and host in self.deny:
+            return False
+        return self.allow is None or host in self.allow
+
+    def process_request(self, request, client_address):
+        if self._track(request):
+            super().process_request(request, client_address)
+
+    def _track(self, request: socket.socket) -> bool:
+        "Note a newly accepted connection. Returns False (closing it) if we're stopping."
+        if self._shutdown_request:
+            self.shutdown_request(request)
+            return False
+        with self._changed:
+            self._connections.add(request)
+        return True
+
+    def shutdown_request(self, request):
+        super().shutdown_request(request)
+        with self._changed:
+            self._connections.discard(request)
+            self._idle.pop(request, None)
+            self._changed.notify_all()
+
+    def mark_idle(self, request: socket.socket) -> bool:
+        """
+        Note that a connection is waiting for its next request,
+        so draining can close it. Returns False if it should close now.
+        """
+        with self._changed:
+            if self.draining:
+                return False
+            self._idle[request] = None
+            self._changed.notify_all()
+            return True
+
+    def mark_busy(self, request: socket.socket):
+        "Note that a connection has started a request."
+        with self._changed:
+            self._idle.pop(request, None)
+
+    def start_handshake(self, request: socket.socket, timeout: float | None) -> bool:
+        """
+        Wait up to timeout seconds for a turn to do a connection's TLS
+        handshake, with at most `max_handshakes` at once. Returns False if
+        it shouldn't go ahead, for want of a turn, or because it's being closed.
+
+        Until `end_handshake`, the connection counts as idle (it's waiting
+        on its client), so draining, or a pool wanting room, can close it.
+        """
+        with self._changed:
+            if self.draining or self.closing:
+                return False
+            self._idle[request] = None
+            self._changed.notify_all()
+
+            def ready() -> bool:
+                return (
+                    request not in self._idle  # closed to make room
+                    or self.draining
+                    or self.closing
+                    or self.max_handshakes is None
+                    or self._handshaking < self.max_handshakes
+                )
+
+            self._changed.wait_for(ready, timeout)
+            if request not in self._idle or self.draining or self.closing:
+                self._idle.pop(request, None)
+                return False
+            if self.max_handshakes is not None and (
+                self._handshaking >= self.max_handshakes
+            ):
+                self._idle.pop(request, None)
+                return False  # timed out
+            self._handshaking += 1
+            return True
+
+    def end_handshake(self, request: socket.socket):
+        "Note that a connection's handshake, started with `start_handshake`, is over."
+        with self._changed:
+            self._handshaking -= 1
+            self._idle.pop(request, None)
+            self._changed.notify_all()
+
+    @property
+    def connections(self) -> int:
+        "How many connections are open."
+        return len(self._connections)
+
+    @property
+    def idle_connections(self) -> int:
+        "How many open connections are waiting for their next request."
+        return len(self._idle)
+
+    def drain(self, timeout: float | None = DEFAULT_DRAIN_TIMEOUT) -> bool:
+        """
+        Stop accepting connections and wait up to timeout seconds for
+        those open to finish their current request, closing idle ones.
+        Returns whether they all finished; close the rest with `server_close`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            self.draining = True
+            for request in self._idle:
+                _shutdown_quietly(request, socket.SHUT_RD)
+            self._changed.notify_all()  # for those waiting to handshake
+        self._shutdown_request = True
+        os.write(self._wake_w, b"\0")
+        # a serial server finishes its connection before it stops accepting.
+        if not self._is_shut_down.wait(timeout):
+            return False
+        with self._changed:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            return self._changed.wait_for(lambda: not self._connections, remaining)
+
+    def close_connections(self):
+        "Close every open connection, whatever it's doing."
+        with self._changed:
+            self.closing = True
+            for request in self._connections:
+                _shutdown_quietly(request, socket.SHUT_RDWR)
+            self._changed.notify_all()  # for those waiting to handshake
+
+    def handle_error(self, request, client_address):
+        # connections we closed out from under their handlers aren't news.
+        if not self.closing:
+            super().handle_error(request, client_address)
+
+    def server_close(self):
+        self.close_connections()
+        super().server_close()
+        for sock in self.sockets:
+            sock.close()
+        for fd in (self._wake_r, self._wake_w):
+            with contextlib.suppress(OSError):
+                os.close(fd)
+
+
+def _shutdown_quietly(request: socket.socket, how: int):
+    # socket's own, rather than SSLSocket's, which would unwrap it under the handler.
+    with contextlib.suppress(OSError):
+        socket.socket.shutdown(request, how)
+
+
+class PooledHTTPServer(GracefulHTTPServer):
+    """
+    An HTTPServer that handles connections on a bounded pool of threads.
+
+    At most `threads` connections are handled at once,
+    with up to `queue_size` more waiting for a free thread.
+    Past that, the longest idle keep-alive connection is closed to make room,
+    so idle clients can't keep new ones out; if none are idle,
+    `overload` decides whether to reject or wait.
+    """
+
+    def __init__(
+        self,
+        server_address: tuple[str, int],
+        RequestHandlerClass: type[BaseRequestHandler],
+        threads: int,
+        queue_size: int = 0,
+        overload: Overload = Overload.QUEUE,
+        bind_and_activate: bool = True,
+    ):
+        if threads < 1:
+            raise ValueError("threads must be at least 1")
+        if queue_size < 0:
+            raise ValueError("queue_size must not be negative")
+        self.threads = threads
+        self.queue_size = queue_size
+        self.overload = overload
+        self._taken = 0  # slots, under _changed
+        self._evicted: set[socket.socket] = set()  # idle, closed to make room
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix="kmg-http")
+        super().__init__(server_address, RequestHandlerClass, bind_and_activate)
+
+    def process_request(self, request, client_address):
+        if not self._track(request):
+            return
+        if not self._take_slot():
+            self._reject(request)
+            return
+        try:
+            self._pool.submit(self._process_request_thread, request, client_address)
+        except RuntimeError:  # pool was shut down underneath us
+            self._release_slot()
+            self.shutdown_request(request)
+
+    def _take_slot(self) -> bool:
+        """
+        Take a slot for a new connection, closing an idle one to free a slot
+        if need be. Returns False if the connection should be rejected.
+        """
+        with self._changed:
+            while self._taken >= self.threads + self.queue_size:
+                if self._evicted:
+                    pass  # wait for the last one closed to give its slot back
+                elif self._idle:
+                    request = next(iter(self._idle))
+                    del self._idle[request]
+                    self._evicted.add(request)
+                    # its handler sees EOF, as when draining.
+                    _shutdown_quietly(request, socket.SHUT_RD)
+                    self._changed.notify_all()  # if it's waiting to handshake
+                    continue
+                elif self.overload is Overload.REJECT:
+                    return False
+                self._changed.wait()
+            self._taken += 1
+            return True
+
+    def _release_slot(self):
+        with self._changed:
+            self._taken -= 1
+            self._changed.notify_all()
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._release_slot()
+
+    def shutdown_request(self, request):
+        super().shutdown_request(request)
+        with self._changed:
+            self._evicted.discard(request)
+
+    def _reject(self, request):
+        if isinstance(request, SSLSocket):
+            # no handshake yet, and we're not going to do one on the accept path.
+            self.shutdown_request(request)
+            return
+        try:
+            request.sendall(REJECTED_RESPONSE)
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
 
 
 def make_server(
-    address: str = DEFAULT_ADDR,
+    address: ListenAddress | Sequence[ListenAddress] = DEFAULT_ADDR,
     port: int = DEFAULT_PORT,
     ssl_context: SSLContext | None = None,
     response_text: bytes = DEFAULT_RESPONSE_TEXT,
-) -> HTTPServer:
+    threads: int | None = DEFAULT_THREADS,
+    queue_size: int = 0,
+    overload: Overload = Overload.QUEUE,
+    reuse_port: bool = False,
+    access_log: logging.Logger | None = None,
+    keep_alive: bool = True,
+    idle_timeout: float | None = DEFAULT_IDLE_TIMEOUT,
+    max_requests: int | None = DEFAULT_MAX_REQUESTS,
+    directory: Path | str | None = None,
+    handshake_timeout: float | None = DEFAULT_HANDSHAKE_TIMEOUT,
+    max_handshakes: int | None = None,
+    metrics: bool = True,
+    metrics_path: str | None = None,
+    allow: IPSet | None = None,
+    deny: IPSet | None = None,
+) -> GracefulHTTPServer:
     """
     Create a simple HTTP(s) server that responds to all requests with
     the given response_text.
+
+    address can be a list of addresses to listen on together, IPv4 or IPv6,
+    each a host (on port) or a (host, port) pair. Any on port 0 share the
+    first one's random port, if they can. Listening on "::" accepts IPv4 too,
+    unless IPv4 addresses are also listed.
+
+    Connections are handled concurrently on a bounded pool of `threads`
+    threads (see `PooledHTTPServer`). If threads is None,
+    they are handled one at a time.
+
+    Connections are kept alive (HTTP/1.1), and pipelined requests are answered
+    in order. A connection is closed once it has been idle for idle_timeout
+    seconds, or has made max_requests requests. Either can be None for no limit.
+    If keep_alive is False, every connection is closed after one request.
+
+    If a directory is given, the files in it are served instead of response_text
+    (see `StaticFiles`).
+
+    If reuse_port is set, the socket is bound with SO_REUSEPORT,
+    so that other processes can listen on the same address
+    (see `ServerProcesses`).
+
+    Requests are only logged if an access_log is given
+    (see `buffered_access_log`). Errors are still logged to stderr without one.
+
+    With an ssl_context, accepting a connection doesn't wait for its TLS
+    handshake: that happens in the connection's handler (on its pool thread,
+    or a serial server's only one), and is abandoned after handshake_timeout
+    seconds. At most max_handshakes run at once (if given); others wait
+    up to handshake_timeout for their turn. Meanwhile, a pool wanting room
+    for new connections can close them, as it does idle ones.
+
+    Unless metrics is False, requests, bytes, connections and latencies are
+    recorded into the server's `metrics` (a `ServerMetrics`, also available
+    as `Server.metrics`). If metrics_path is given (e.g. "/metrics"),
+    GETting it returns them in the Prometheus text format.
+
+    If given, only peers in allow, and none in deny, are served;
+    others are disconnected before anything is read (or a TLS handshake).
     """
+    if metrics_path is not None and not metrics:
+        raise ValueError("metrics_path needs metrics")
+    recorder = ServerMetrics() if metrics else None
+    version = "HTTP/1.1" if keep_alive else "HTTP/1.0"
+    response = CannedResponse(response_text, protocol_version=version)
+    static = StaticFiles(directory) if directory is not None else None
+
+    def _handshake(server: GracefulHTTPServer, sock: SSLSocket) -> bool:
+        "Do the TLS handshake for a freshly accepted socket. Returns if it worked."
+        started = time.monotonic()
+        if not server.start_handshake(sock, handshake_timeout):
+            return False
+        idle_timeout = sock.gettimeout()
+        begun = time.monotonic()  # not counting the wait for a turn
+        try:
+            if handshake_timeout is not None:
+                remaining = started + handshake_timeout - time.monotonic()
+                sock.settimeout(max(remaining, 0))
+            sock.do_handshake()
+            if recorder is not None:
+                elapsed = time.monotonic() - begun
+                recorder.mine().handshake_us.record(int(elapsed * 1e6))
+            return True
+        except OSError:  # including SSLError and TimeoutError
+            return False
+        finally:
+            sock.settimeout(idle_timeout)
+            server.end_handshake(sock)
 
     class _ResponseHandler(BaseHTTPRequestHandler):
+        timeout = idle_timeout
+        protocol_version = version
+
+        def setup(self):
+            super().setup()
+            self.requests_handled = 0
+            if recorder is not None:
+                self.rfile = _CountingReader(self.rfile)
+                self.wfile = _CountingWriter(self.wfile)
+                recorder.mine().connections_opened += 1
+            self.handshaken = not isinstance(self.connection, SSLSocket) or _handshake(
+                self.server, self.connection
+            )
+
+        def finish(self):
+            super().finish()
+            if recorder is not None:
+                mine = recorder.mine()
+                mine.bytes_in += self.rfile.take()
+                mine.bytes_out += self.wfile.take()
+                mine.connections_closed += 1
+
+        def handle_one_request(self):
+            if self.requests_handled and not self.server.mark_idle(self.connection):
+                self.close_connection = True  # draining
+                return
+            super().handle_one_request()
+
+        def parse_request(self):
+            self.request_started = time.perf_counter_ns()
+            self.server.mark_busy(self.connection)
+            return super().parse_request()
+
+        def _record_request(self, body_sent: int):
+            "Record a completed request, which sent body_sent bytes around wfile."
+            if recorder is None:
+                return
+            mine = recorder.mine()
+            mine.requests += 1
+            mine.bytes_in += self.rfile.take()
+            mine.bytes_out += self.wfile.take() + body_sent
+            elapsed = time.perf_counter_ns() - self.request_started
+            mine.latency_us.record(elapsed // 1000)
+
+        def handle(self):
+            if self.handshaken:
+                super().handle()
+
+        def _count_request(self):
+            self.requests_handled += 1
+            if max_requests is not None and self.requests_handled >= max_requests:
+                self.close_connection = True
+            if self.server.draining:
+                self.close_connection = True
+
         def do_GET(self):
-            self.send_response(200, "ALL GOOD")
-            self.send_header("Content-Type", "text/plain")
-            self.send_header("Content-Length", str(len(response_text)))
+            self._count_request()
+            if metrics_path is not None and self.path == metrics_path:
+                self._send_metrics()
+                self._record_request(0)
+            elif static is not None:
+                self._record_request(static.serve(self))
+            else:
+                payload = response.render(
+                    self.close_connection, self.request_version == "HTTP/1.0"
+                )
+                self.connection.sendall(payload)
+                if access_log is not None:
+                    self.log_request(200, len(response.body))
+                self._record_request(len(payload))
+
+        def do_HEAD(self):
+            if static is None:
+                self.send_error(HTTPStatus.NOT_IMPLEMENTED)
+                return
+            self._count_request()
+            self._record_request(static.serve(self, head=True))
+
+        def _send_metrics(self):
+            assert recorder is not None
+            body = recorder.prometheus().encode()
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            if self.close_connection:
+                self.send_header("Connection", "close")
             self.end_headers()
-            self.wfile.write(response_text)
+            self.wfile.write(body)
+
+        def log_error(self, format, *args):
+            # an idle keep-alive connection timing out is business as usual.
+            if not (args and isinstance(args[0], TimeoutError)):
+                super().log_error(format, *args)
+
+        def log_request(self, code="-", size="-"):
+            if access_log is not None:
+                super().log_request(code, size)
 
-    server = HTTPServer(
-        (address, port), _ResponseHandler
-    )  # TODO: will listen work with ipv6?
+        def log_message(self, format, *args):
+            if access_log is None:
+                super().log_message(format, *args)
+            else:
+                access_log.info(
+                    "%s - - [%s] %s",
+                    self.address_string(),
+                    self.log_date_time_string(),
+                    format % args,
+                )
+
+    first, *others = addresses = listen_addresses(address, port)
+    if threads is None:
+        server = GracefulHTTPServer(first, _ResponseHandler, False)
+    else:
+        server = PooledHTTPServer(
+            first, _ResponseHandler, threads, queue_size, overload, False
+        )
+    server.allow_reuse_port = reuse_port
+    server.dual_stack = dual_stack(addresses)
+    try:
+        server.server_bind()
+        server.server_activate()
+        for host, other_port in others:
+            if other_port == 0 and first[1] == 0:
+                try:
+                    server.add_listener((host, server.server_port))
+                    continue
+                except OSError:  # taken there: settle for a port of its own
+                    pass
+            server.add_listener((host, other_port))
+    except BaseException:
+        server.server_close()
+        raise
     if ssl_context is not None:
         # why isn't this documented? :/
-        server.socket = ssl_context.wrap_socket(server.socket, server_side=True)  # type: ignore
+        # handshakes are left to the handler (see _handshake), off the accept path.
+        server.sockets = [
+            ssl_context.wrap_socket(
+                sock, server_side=True, do_handshake_on_connect=False
+            )
+            for sock in server.sockets
+        ]
+        server.socket = server._accepting = server.sockets[0]  # type: ignore
+    server.metrics = recorder  # type: ignore
+    server.allow, server.deny = allow, deny
+    server.max_handshakes = max_handshakes
     return server
 
 
 class Server:
     """
     A server and an associated thread.
+    As a context manager, it's started on entry and stopped on exit.
     """
 
-    def __init__(self, server: HTTPServer, threader: type[Thread] = Thread):
+    def __init__(self, server: GracefulHTTPServer, threader: type[Thread] = Thread):
         self.server = server
         self.thread = threader(target=server.serve_forever)
 
@@ -70,8 +854,21 @@ class Server:
 
     @property
     def url(self) -> str:
-        "The base URL that the server is reachable by."
-        return f"{self.protocol}://{self.address}:{self.port}/"
+        "The base URL that the server is reachable by (on its first address)."
+        return self.urls[0]
+
+    @property
+    def urls(self) -> list[str]:
+        "The base URLs for every address the server listens on."
+        return [
+            format_url(self.protocol, sock.getsockname())
+            for sock in self.server.sockets
+        ]
+
+    @property
+    def metrics(self) -> ServerMetrics | None:
+        "What the server has recorded, if it was made by `make_server` with metrics."
+        return getattr(self.server, "metrics", None)
 
     def start(self):
         "Start the server thread."
@@ -79,9 +876,14 @@ class Server:
 
     @contextlib.contextmanager
     def serve(self):
+        "Start the server, and after the block, wait until it's stopped."
         self.thread.start()
-        yield self
-        self.wait()  # TODO: what if caller stops it?
+        try:
+            yield self
+        except BaseException:
+            self.stop()
+            raise
+        self.wait()
 
     def wait(self):
         "wait for the thread"
@@ -93,13 +895,292 @@ class Server:
             raise
 
     def stop(self):
-        "Stop the server, waiting for shutdown."
-        self.server.shutdown()
+        "Stop the server now, closing any open connections."
+        if self.thread.is_alive():
+            self.server.shutdown(close_connections=True)
         self.server.server_close()
-        self.thread.join()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def drain(self, timeout: float | None = DEFAULT_DRAIN_TIMEOUT) -> bool:
+        """
+        Stop the server gracefully: stop accepting, let requests in flight
+        finish for up to timeout seconds, then close whatever's left.
+        Returns whether everything finished in time.
+        """
+        drained = self.server.drain(timeout) if self.thread.is_alive() else True
+        self.stop()
+        return drained
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def __str__(self):
+        return f"{self.protocol} serving at {', '.join(self.urls)}"
+
+
+def _exit_on_signal(signum, _frame):
+    raise SystemExit(0)
+
+
+def _reserve(host: str, port: int, dual_stack: bool) -> socket.socket:
+    "Bind (but don't listen on) an address for SO_REUSEPORT servers to share."
+    sock = socket.socket(_family(host), socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        if sock.family == socket.AF_INET6:
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, not dual_stack)
+        sock.bind((host, port))
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+class ServerProcesses:
+    """
+    Several forked server processes sharing addresses through SO_REUSEPORT,
+    each with its own accept loop. The kernel spreads connections across them.
+
+    The addresses (one or more, as for `make_server`) are reserved in this
+    process (bound but never listening), so that a random port can be shared
+    and isn't lost between restarts.
+    A supervisor thread restarts any process that exits while serving,
+    backing off while they keep failing soon after starting, and gives up
+    (stopping them all, and raising from `wait`) after `MAX_QUICK_FAILURES`
+    of those in a row.
+
+    If given, setup() is called first thing in each process, e.g. to install
+    signal handlers or start threads there (neither survive the fork).
+    Keyword arguments are passed to `make_server` in each process.
+    """
+
+    RESTART_DELAY = 0.1
+    "How long to wait before restarting a process that exited, in seconds, at first."
+    MAX_RESTART_DELAY = 10.0
+    "The most the restart delay doubles up to while processes fail quickly."
+    MIN_UPTIME = 1.0
+    "A process exiting sooner than this many seconds after starting failed quickly."
+    MAX_QUICK_FAILURES = 5
+    "How many quick failures in a row to put up with before giving up."
+    STOP_TIMEOUT = 5.0
+    "How long to wait for a process to exit after SIGTERM before killing it."
+    START_TIMEOUT = 10.0
+    "How long `start` waits for the processes to start listening, in seconds."
+
+    def __init__(
+        self,
+        address: ListenAddress | Sequence[ListenAddress] = DEFAULT_ADDR,
+        port: int = DEFAULT_PORT,
+        processes: int | None = None,
+        setup: Callable[[], object] | None = None,
+        **kwargs,
+    ):
+        if processes is None:
+            processes = os.cpu_count() or 1
+        elif processes < 1:
+            raise ValueError("processes must be at least 1")
+        self.processes = processes
+        self.setup = setup
+        self.kwargs = kwargs
+        self.restarts = 0
+        self.error: RuntimeError | None = None
+        "Why the supervisor gave up, if it did."
+
+        addresses = listen_addresses(address, port)
+        self.reservations: list[socket.socket] = []
+        try:
+            for host, host_port in addresses:
+                if host_port == 0 and self.reservations:  # share the first's
+                    host_port = self.reservations[0].getsockname()[1]
+                sock = _reserve(host, host_port, dual_stack(addresses))
+                self.reservations.append(sock)
+        except BaseException:
+            for reservation in self.reservations:
+                reservation.close()
+            raise
+        self._socknames = [sock.getsockname() for sock in self.reservations]
+
+        self._mp = multiprocessing.get_context("fork")
+        self._procs: list[multiprocessing.process.BaseProcess] = []
+        self._started: list[float] = []
+        self._quick_failures = 0
+        self._listening = self._mp.Semaphore(0)
+        self._stopping = Event()
+        self._wake_r, self._wake_w = os.pipe()
+        self.thread = Thread(target=self._supervise)
+
+    @property
+    def protocol(self) -> str:
+        "HTTP or HTTPS?"
+        return "http" if self.kwargs.get("ssl_context") is None else "https"
+
+    @property
+    def address(self) -> str:
+        return self._socknames[0][0]
+
+    @property
+    def port(self) -> int:
+        return self._socknames[0][1]
+
+    @property
+    def url(self) -> str:
+        "The base URL that the servers are reachable by (on the first address)."
+        return self.urls[0]
+
+    @property
+    def urls(self) -> list[str]:
+        "The base URLs for every address the servers listen on."
+        return [format_url(self.protocol, sockname) for sockname in self._socknames]
+
+    @property
+    def pids(self) -> list[int | None]:
+        "The process IDs of the current server processes."
+        return [proc.pid for proc in self._procs]
+
+    def _run(self):
+        "The body of each server process."
+        # the parent decides when to stop, so Ctrl-C only goes through it,
+        # as does a hangup, unless setup handles SIGHUP (e.g. to reload).
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, _exit_on_signal)
+        if self.setup is not None:
+            self.setup()
+        addresses = [sockname[:2] for sockname in self._socknames]
+        server = make_server(addresses, reuse_port=True, **self.kwargs)
+        self._listening.release()
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            # the process exits without running logging's atexit flush.
+            if self.kwargs.get("access_log") is not None:
+                _flush(self.kwargs["access_log"])
+
+    def send_signal(self, signum: int):
+        "Send a signal to every server process."
+        for proc in list(self._procs):
+            with contextlib.suppress(ValueError, ProcessLookupError):  # exited
+                if proc.pid is not None and proc.exitcode is None:
+                    os.kill(proc.pid, signum)
+
+    def _spawn(self, i: int | None = None) -> multiprocessing.process.BaseProcess:
+        "Start a server process, replacing the i'th."
+        proc = self._mp.Process(target=self._run, daemon=True)
+        proc.start()
+        if i is None:
+            self._procs.append(proc)
+            self._started.append(time.monotonic())
+        else:
+            self._procs[i].close()
+            self._procs[i] = proc
+            self._started[i] = time.monotonic()
+        return proc
+
+    def _reap(self, i: int):
+        "Clean up after the i'th process, which exited, noting if it failed quickly."
+        proc = self._procs[i]
+        proc.join()
+        uptime = time.monotonic() - self._started[i]
+        logger.warning(
+            "Server process %s exited with code %s after %.1fs",
+            proc.pid,
+            proc.exitcode,
+            uptime,
+        )
+        if uptime < self.MIN_UPTIME:
+            self._quick_failures += 1
+        else:
+            self._quick_failures = 0
+        if self._quick_failures >= self.MAX_QUICK_FAILURES and self.error is None:
+            self.error = RuntimeError(
+                f"server processes failed {self._quick_failures} times in a row"
+                f" within {self.MIN_UPTIME}s of starting"
+                f" (the last with exit code {proc.exitcode})"
+            )
+
+    def _supervise(self):
+        while not self._stopping.is_set():
+            sentinels = {proc.sentinel: i for i, proc in enumerate(self._procs)}
+            ready = multiprocessing.connection.wait([*sentinels, self._wake_r])
+            exited = [sentinels[s] for s in ready if s in sentinels]  # type: ignore
+            if not exited:
+                continue
+            for i in exited:
+                self._reap(i)
+            if self.error is not None:
+                logger.error("Giving up: %s", self.error)
+                return
+            delay = min(
+                self.RESTART_DELAY * 2**self._quick_failures, self.MAX_RESTART_DELAY
+            )
+            if self._stopping.wait(delay):
+                return
+            for i in exited:
+                self._spawn(i)
+                self.restarts += 1
+
+    def start(self):
+        """
+        Start the server processes and their supervisor,
+        returning once they're all listening.
+        """
+        for _ in range(self.processes):
+            self._spawn()
+        deadline = time.monotonic() + self.START_TIMEOUT
+        for _ in self._procs:
+            if not self._listening.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                break  # the supervisor will restart any that died
+        self.thread.start()
+
+    @contextlib.contextmanager
+    def serve(self):
+        self.start()
+        yield self
+        self.wait()
+
+    def wait(self):
+        """
+        wait for the supervisor. If it gave up on processes that kept failing,
+        stop the rest and raise its `error`.
+        """
+        try:
+            self.thread.join()
+        except KeyboardInterrupt:
+            print("\nShutting down servers")
+            self.stop()
+            raise
+        if self.error is not None:
+            self.stop()
+            raise self.error
+
+    def stop(self):
+        "Stop every server process, waiting for them to exit."
+        self._stopping.set()
+        os.write(self._wake_w, b"\0")
+        if self.thread.is_alive():
+            self.thread.join()
+        for proc in self._procs:
+            proc.terminate()
+        for proc in self._procs:
+            proc.join(self.STOP_TIMEOUT)
+            if proc.exitcode is None:
+                proc.kill()
+                proc.join()
+        for reservation in self.reservations:
+            reservation.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
 
     def __str__(self):
-        return f"{self.protocol} serving at {self.url}"
+        urls = ", ".join(self.urls)
+        return f"{self.protocol} serving at {urls} from {self.processes} processes"
 
 
 try:
@@ -107,19 +1188,135 @@ try:
 
     from kmg.kitchen.ip import IPAddress, ListenSpec
 
+    def serving_options(f):
+        "The click options for how to serve, shared by the serving CLIs."
+        f = click.option(
+            "--deny",
+            type=click.Path(exists=True, dir_okay=False),
+            default=None,
+            help="Refuse peers in the networks listed (one per line) in this file",
+        )(f)
+        f = click.option(
+            "--allow",
+            type=click.Path(exists=True, dir_okay=False),
+            default=None,
+            help="Only serve peers in the networks listed (one per line) in this file",
+        )(f)
+        f = click.option(
+            "--metrics-path",
+            default=None,
+            help="Serve Prometheus metrics at this path, e.g. /metrics",
+        )(f)
+        f = click.option(
+            "--max-requests",
+            type=click.IntRange(min=1),
+            default=DEFAULT_MAX_REQUESTS,
+            show_default=True,
+            help="Close a keep-alive connection after this many requests",
+        )(f)
+        f = click.option(
+            "--idle-timeout",
+            type=click.FloatRange(min=0, min_open=True),
+            default=DEFAULT_IDLE_TIMEOUT,
+            show_default=True,
+            help="Close a keep-alive connection after this many idle seconds",
+        )(f)
+        f = click.option(
+            "--keep-alive/--no-keep-alive",
+            default=True,
+            show_default=True,
+            help="Keep connections open between requests, or close after each",
+        )(f)
+        f = click.option(
+            "--workers",
+            type=click.IntRange(min=1),
+            default=1,
+            show_default=True,
+            help="Serve from this many processes sharing the address",
+        )(f)
+        f = click.option(
+            "--overload",
+            type=click.Choice([o.value for o in Overload]),
+            default=Overload.QUEUE.value,
+            show_default=True,
+            help="What to do when every thread and queue slot is busy",
+        )(f)
+        f = click.option(
+            "--queue-size",
+            type=click.IntRange(min=0),
+            default=0,
+            show_default=True,
+            help="Connections allowed to wait for a free thread",
+        )(f)
+        f = click.option(
+            "--threads",
+            type=click.IntRange(min=1),
+            default=DEFAULT_THREADS,
+            show_default=True,
+            help="Handle connections on a pool of this many threads",
+        )(f)
+        return f
+
     @click.command()
     @click.option("--response", default=DEFAULT_RESPONSE_TEXT)
+    @click.option(
+        "--directory",
+        type=click.Path(exists=True, file_okay=False),
+        default=None,
+        help="Serve the files in this directory instead of --response",
+    )
+    @click.option(
+        "--access-log",
+        default=False,
+        is_flag=True,
+        help="Log every request (buffered) to stderr",
+    )
+    @serving_options
     @click.argument(
-        "listen_address",
-        type=ListenSpec(DEFAULT_ADDR, DEFAULT_PORT),
-        default=(DEFAULT_ADDR, DEFAULT_PORT),
+        "listen_addresses", type=ListenSpec(DEFAULT_ADDR, DEFAULT_PORT), nargs=-1
     )
-    def _serve(response: str, listen_address: tuple[IPAddress, int]):
-        addr, port = listen_address
-        server = Server(make_server(str(addr), port, response_text=response.encode()))
+    def _serve(
+        response: str,
+        directory: str | None,
+        access_log: bool,
+        workers: int,
+        threads: int,
+        queue_size: int,
+        overload: str,
+        keep_alive: bool,
+        idle_timeout: float,
+        max_requests: int,
+        metrics_path: str | None,
+        allow: str | None,
+        deny: str | None,
+        listen_addresses: tuple[tuple[IPAddress, int], ...],
+    ):
+        addresses = [
+            (str(addr), port)
+            for addr, port in listen_addresses or [(DEFAULT_ADDR, DEFAULT_PORT)]
+        ]
+        kwargs = dict(
+            response_text=response.encode(),
+            directory=directory,
+            access_log=buffered_access_log() if access_log else None,
+            threads=threads,
+            queue_size=queue_size,
+            overload=Overload(overload),
+            keep_alive=keep_alive,
+            idle_timeout=idle_timeout,
+            max_requests=max_requests,
+            metrics_path=metrics_path,
+            allow=IPSet.from_file(allow) if allow else None,
+            deny=IPSet.from_file(deny) if deny else None,
+        )
+        if workers > 1:
+            server = ServerProcesses(addresses, processes=workers, **kwargs)
+        else:
+            server = Server(make_server(addresses, **kwargs))
 
         with server.serve():
-            print("Serving at", click.style(server.url, bold=True))
+            for url in server.urls:
+                print("Serving at", click.style(url, bold=True))
 
     if __name__ == "__main__":
         _serve()
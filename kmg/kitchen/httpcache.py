@@ -0,0 +1,325 @@
+"""
+An on-disk HTTP cache for `kmg.kitchen.requests` sessions:
+see `DiskCache` and `session(cache=...)`.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .fs import atomic_replace
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+SUFFIX = ".cache"
+# hop-by-hop, or describing the encoded body rather than the decoded one we keep.
+_DROPPED_HEADERS = frozenset(
+    {"connection", "keep-alive", "transfer-encoding", "content-encoding"}
+)
+
+
+class _Entry:
+    "What's kept in memory about a cached response; the body stays on disk."
+
+    __slots__ = ("path", "size", "expires", "etag", "last_modified", "vary")
+
+    def __init__(self, path: Path, size: int, meta: dict):
+        self.path = path
+        self.size = size
+        self.expires: float = meta["expires"]
+        self.etag: str | None = meta["headers"].get("ETag")
+        self.last_modified: str | None = meta["headers"].get("Last-Modified")
+        self.vary: dict[str, str | None] = meta.get("vary", {})
+        "The request headers the response Vary'd on, and their values."
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires
+
+    def matches(self, headers) -> bool:
+        "Whether this entry answers a request with these headers, by its Vary."
+        return all(headers.get(name) == value for name, value in self.vary.items())
+
+
+def _directives(headers) -> dict[str, str | None]:
+    "Parse Cache-Control into {directive: argument}."
+    directives: dict[str, str | None] = {}
+    for part in headers.get("Cache-Control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+def _expires(headers, authorized: bool = False) -> float | None:
+    """
+    When a response goes stale by its max-age (0 for no-cache),
+    or None if it mustn't be stored at all. The cache may be shared
+    between sessions, so that includes private responses, and responses
+    to requests with credentials unless they're public.
+    """
+    directives = _directives(headers)
+    if (
+        "no-store" in directives
+        or "private" in directives
+        or (authorized and "public" not in directives)
+        or headers.get("Vary", "").strip() == "*"
+    ):
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    try:
+        max_age = int(directives.get("max-age") or 0)
+        age = int(headers.get("Age", 0))
+    except ValueError:
+        return 0.0
+    return time.time() + max_age - age
+
+
+class DiskCache:
+    """
+    A cache of GET responses (status 200) stored one file per URL in directory,
+    with a small index of them in memory, kept under max_bytes on disk
+    by evicting the least recently used.
+
+    Responses are fresh for their Cache-Control max-age, and then revalidated
+    with If-None-Match / If-Modified-Since; ones with neither max-age nor
+    a validator aren't worth keeping. A response that Varies is only used
+    for requests with the same values of those headers. Every write goes through
+    `fs.atomic_replace`, so a crash can lose entries but never corrupt them.
+
+    Thread-safe, so one cache can be shared by several sessions.
+    """
+
+    def __init__(self, directory: Path | str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        "Requests answered from the cache without asking the server."
+        self.misses = 0
+        "Requests the server answered in full."
+        self.revalidations = 0
+        "Requests the server confirmed (304) the cached copy for."
+        self.evictions = 0
+        self._index: OrderedDict[str, _Entry] = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self._load()
+
+    def _load(self):
+        "Index what's already on disk, least recently used first."
+        found = []
+        for path in self.directory.iterdir():
+            if path.name.startswith("tmp"):  # left by a crash mid-write
+                path.unlink(missing_ok=True)
+            elif path.suffix == SUFFIX:
+                try:
+                    with open(path, "rb") as f:
+                        meta = json.loads(f.readline())
+                        size = os.fstat(f.fileno()).st_size
+                    found.append((path.stat().st_mtime, meta["url"], path, size, meta))
+                except (OSError, ValueError, KeyError):
+                    path.unlink(missing_ok=True)
+        for _mtime, url, path, size, meta in sorted(found, key=lambda f: f[0]):
+            self._index[url] = _Entry(path, size, meta)
+            self._bytes += size
+        self._evict()
+
+    def _path(self, url: str) -> Path:
+        return self.directory / (hashlib.sha256(url.encode()).hexdigest() + SUFFIX)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "evictions": self.evictions,
+            "entries": len(self._index),
+            "bytes": self._bytes,
+        }
+
+    def lookup(self, url: str) -> _Entry | None:
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is not None:
+                self._index.move_to_end(url)
+            return entry
+
+    def load(self, entry: _Entry) -> tuple[dict, bytes] | None:
+        "Read an entry's metadata and body back, or None if it's gone."
+        try:
+            with open(entry.path, "rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        os.utime(entry.path)  # remember it was used, for the next _load
+        return meta, body
+
+    def store(self, url: str, resp: requests.Response, expires: float):
+        "Cache resp's (already read) content for url."
+        headers = {
+            name: value
+            for name, value in resp.headers.items()
+            if name.lower() not in _DROPPED_HEADERS
+        }
+        headers["Content-Length"] = str(len(resp.content))
+        vary = {
+            name: resp.request.headers.get(name)
+            for name in map(str.strip, resp.headers.get("Vary", "").split(","))
+            if name
+        }
+        meta = {"url": url, "expires": expires, "headers": headers, "vary": vary}
+        self._write(url, meta, resp.content)
+
+    def refresh(
+        self, url: str, entry: _Entry, resp: requests.Response, authorized: bool
+    ) -> tuple[dict, bytes] | None:
+        """
+        Update an entry after a 304, returning its metadata and body, with
+        the 304's headers merged over the stored ones (a 304 usually leaves
+        out Cache-Control, meaning the stored one still holds).
+        Only the index is updated, rather than rewriting the body; after a
+        restart, the entry is just revalidated again.
+        """
+        loaded = self.load(entry)
+        if loaded is None:
+            self.forget(url)
+            return None
+        meta, body = loaded
+        headers = CaseInsensitiveDict(meta["headers"])
+        for name, value in resp.headers.items():
+            if name.lower() not in _DROPPED_HEADERS | {"content-length"}:
+                headers[name] = value
+        meta["headers"] = dict(headers)
+        expires = _expires(headers, authorized)
+        if expires is None:
+            self.forget(url)
+            return meta, body
+        entry.expires = expires
+        entry.etag = headers.get("ETag")
+        entry.last_modified = headers.get("Last-Modified")
+        return meta, body
+
+    def count(self, outcome: str):
+        "Count a hit, miss or revalidation."
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def _write(self, url: str, meta: dict, body: bytes):
+        path = self._path(url)
+        with atomic_replace(path) as f:
+            f.write(json.dumps(meta).encode() + b"\n")
+            f.write(body)
+            size = f.tell()
+        with self._lock:
+            old = self._index.pop(url, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._index[url] = _Entry(path, size, meta)
+            self._bytes += size
+            self._evict()
+
+    def forget(self, url: str):
+        with self._lock:
+            entry = self._index.pop(url, None)
+            if entry is not None:
+                self._bytes -= entry.size
+                entry.path.unlink(missing_ok=True)
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._index:
+            _url, entry = self._index.popitem(last=False)
+            self._bytes -= entry.size
+            entry.path.unlink(missing_ok=True)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            for entry in self._index.values():
+                entry.path.unlink(missing_ok=True)
+            self._index.clear()
+            self._bytes = 0
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    An `HTTPAdapter` that answers GETs from a `DiskCache` when it can,
+    revalidating stale entries. Streamed, ranged and non-GET requests
+    go straight through.
+    """
+
+    def __init__(self, cache: DiskCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(
+        self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None
+    ):
+        kwargs = dict(
+            stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies
+        )
+        if request.method != "GET" or stream or "Range" in request.headers:
+            return super().send(request, **kwargs)
+        cache, url = self.cache, request.url
+        authorized = "Authorization" in request.headers
+        entry = cache.lookup(url)
+        if entry is not None and not entry.matches(request.headers):
+            entry = None  # one entry per URL: other variants just take turns
+        if entry is not None and entry.fresh:
+            loaded = cache.load(entry)
+            if loaded is not None:
+                cache.count("hits")
+                return self._cached(request, *loaded)
+
+        if entry is not None:
+            request = request.copy()
+            if entry.etag is not None:
+                request.headers["If-None-Match"] = entry.etag
+            if entry.last_modified is not None:
+                request.headers["If-Modified-Since"] = entry.last_modified
+        resp = super().send(request, **kwargs)
+
+        if entry is not None and resp.status_code == 304:
+            resp.content  # drain it, so the connection goes back to the pool
+            refreshed = cache.refresh(url, entry, resp, authorized)
+            if refreshed is not None:
+                cache.count("revalidations")
+                return self._cached(request, *refreshed)
+            # it vanished underneath us: ask again, unconditionally.
+            for name in ("If-None-Match", "If-Modified-Since"):
+                request.headers.pop(name, None)
+            resp = super().send(request, **kwargs)
+
+        cache.count("misses")
+        if resp.status_code != 200:
+            return resp
+        expires = _expires(resp.headers, authorized)
+        has_validator = "ETag" in resp.headers or "Last-Modified" in resp.headers
+        if expires is None or (expires <= time.time() and not has_validator):
+            cache.forget(url)
+            return resp
+        cache.store(url, resp, expires)  # reads the content, which is fine unstreamed
+        return resp
+
+    def _cached(self, request, meta: dict, body: bytes) -> requests.Response:
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.reason = "OK"
+        resp.headers = CaseInsensitiveDict(meta["headers"])
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp.url = request.url
+        resp.request = request
+        resp.connection = self
+        resp._content = body
+        resp._content_consumed = True
+        return resp
@@ -1,37 +1,202 @@
+import logging
+import os
+import signal
 import webbrowser
 from pathlib import Path
-from ssl import PROTOCOL_TLS_SERVER, SSLContext
+from ssl import OP_NO_TICKET, PROTOCOL_TLS_SERVER, SSLContext, SSLError, SSLObject
+from threading import Event, Lock, Thread
+from typing import Sequence
 
 from . import http
-from .http import DEFAULT_ADDR, DEFAULT_PORT, Server
+from .http import (
+    DEFAULT_ADDR,
+    DEFAULT_HANDSHAKE_TIMEOUT,
+    DEFAULT_PORT,
+    ListenAddress,
+    Overload,
+    Server,
+    ServerProcesses,
+)
 
 DEFAULT_RESPONSE_TEXT = b"Secure hello,  world!"
+DEFAULT_NUM_TICKETS = 2
 
+logger = logging.getLogger(__name__)
 
-def make_context(bundle: Path | str, keyfile: Path | str) -> SSLContext:
-    "Make an SSL context with the right protocol and given bundle / key info"
+
+def make_context(
+    bundle: Path | str,
+    keyfile: Path | str,
+    tickets: bool = True,
+    num_tickets: int = DEFAULT_NUM_TICKETS,
+) -> SSLContext:
+    """
+    Make an SSL context with the right protocol and given bundle / key info.
+
+    Sessions can be resumed from the server-side session cache,
+    and from session tickets if tickets is set.
+    num_tickets is how many tickets are sent after a TLS 1.3 handshake.
+    """
     ctx = SSLContext(PROTOCOL_TLS_SERVER)
     ctx.load_cert_chain(bundle, keyfile)
+    if tickets:
+        ctx.num_tickets = num_tickets
+    else:
+        ctx.options |= OP_NO_TICKET
+        ctx.num_tickets = 0
     return ctx
 
 
+def handshake_stats(*contexts: SSLContext) -> dict[str, int]:
+    """
+    Count the handshakes servers have completed with the given contexts:
+    `resumed` ones, which skipped the certificate exchange, and `full` ones.
+    Resumptions are counted against the first context, which must be
+    the one the listening socket was wrapped with.
+    """
+    accepted = sum(ctx.session_stats()["accept_good"] for ctx in contexts)
+    resumed = contexts[0].session_stats()["hits"]
+    return {"full": accepted - resumed, "resumed": resumed}
+
+
+class ReloadingContext:
+    """
+    A server SSL context whose certificate and key can be reloaded from disk
+    without restarting the server or dropping connections.
+
+    Pass `context` to `make_server`. Each reload loads the files into a fresh
+    context, so a bad or half-written pair is rejected without affecting
+    anything, then swaps it in for new handshakes. Existing connections keep
+    the certificate they started with, and sessions can still be resumed
+    across reloads, since they're cached by the original context.
+
+    Reload explicitly, when the files change (`watch`), or on SIGHUP
+    (`reload_on_sighup`). Each process serving with it reloads its own copy,
+    so with `ServerProcesses`, set those up in every one of them
+    (with its setup argument).
+    """
+
+    def __init__(
+        self,
+        bundle: Path | str,
+        keyfile: Path | str,
+        tickets: bool = True,
+        num_tickets: int = DEFAULT_NUM_TICKETS,
+    ):
+        self.bundle = Path(bundle)
+        self.keyfile = Path(keyfile)
+        self.tickets = tickets
+        self.num_tickets = num_tickets
+        self.reloads = 0
+
+        self._stamp = self._file_stamp()
+        self.context = self._load()
+        self.context.sni_callback = self._select
+        self._current = self.context
+        # handshakes done by contexts since replaced, for stats. (The original
+        # stays in use, for resumptions, so it's counted as it goes.)
+        self._retired_handshakes = 0
+        self._lock = Lock()
+        self._stop_watching = Event()
+
+    def _load(self) -> SSLContext:
+        return make_context(self.bundle, self.keyfile, self.tickets, self.num_tickets)
+
+    def _file_stamp(self) -> tuple:
+        stats = [os.stat(path) for path in (self.bundle, self.keyfile)]
+        return tuple((stat.st_ino, stat.st_mtime_ns, stat.st_size) for stat in stats)
+
+    def _select(self, sslobj: SSLObject, _server_name: str | None, ctx: SSLContext):
+        # called for every ClientHello, SNI or not.
+        current = self._current
+        if current is not ctx:
+            sslobj.context = current
+
+    def reload(self) -> bool:
+        """
+        Load the certificate and key again, and use them for new handshakes.
+        Returns whether that worked; on failure, the old ones stay in use.
+        """
+        with self._lock:
+            try:
+                self._stamp = self._file_stamp()
+                context = self._load()
+            except (OSError, SSLError):
+                logger.exception("Failed to reload %s / %s", self.bundle, self.keyfile)
+                return False
+            previous, self._current = self._current, context
+            if previous is not self.context:
+                # handshakes it's still in the middle of go uncounted.
+                stats = previous.session_stats()
+                self._retired_handshakes += stats["accept_good"]
+            self.reloads += 1
+            logger.info("Reloaded %s / %s", self.bundle, self.keyfile)
+            return True
+
+    def reload_if_changed(self) -> bool:
+        "Reload if either file has changed since the last (attempted) load."
+        try:
+            changed = self._file_stamp() != self._stamp
+        except OSError:  # mid-replace; try again next time
+            return False
+        return changed and self.reload()
+
+    def watch(self, interval: float = 1.0) -> Thread:
+        "Check for changes every interval seconds on a daemon thread, until `stop`."
+
+        def _watch():
+            while not self._stop_watching.wait(interval):
+                self.reload_if_changed()
+
+        self._stop_watching.clear()
+        thread = Thread(target=_watch, daemon=True, name="kmg-tls-reload")
+        thread.start()
+        return thread
+
+    def reload_on_sighup(self):
+        "Reload on SIGHUP. Must be called from the main thread."
+
+        def _reload(_signum, _frame):
+            # not in the handler, which may have interrupted the main thread
+            # holding our lock (in `reload` or `stats`).
+            Thread(target=self.reload, daemon=True, name="kmg-tls-reload").start()
+
+        signal.signal(signal.SIGHUP, _reload)
+
+    def stop(self):
+        "Stop watching for changes."
+        self._stop_watching.set()
+
+    def stats(self) -> dict[str, int]:
+        "Handshake counts (see `handshake_stats`), and how many reloads happened."
+        with self._lock:
+            contexts = {self.context: None, self._current: None}
+            stats = handshake_stats(*contexts)
+            stats["full"] += self._retired_handshakes
+        return {**stats, "reloads": self.reloads}
+
+
 def make_server(
-    address: str,
+    address: ListenAddress | Sequence[ListenAddress],
     port: int,
     ssl_context: SSLContext,
     response_text: bytes = DEFAULT_RESPONSE_TEXT,
+    **kwargs,
 ):
     """
     Create a simple HTTPs server that responds to all requests with
     the given response_text.
+    Other keyword arguments are passed through to `http.make_server`.
     """
-    return http.make_server(address, port, ssl_context, response_text)
+    return http.make_server(address, port, ssl_context, response_text, **kwargs)
 
 
 try:
     import click
 
+    from kmg.kitchen.http import serving_options
     from kmg.kitchen.ip import IPAddress, ListenSpec
+    from kmg.kitchen.ipset import IPSet
 
     @click.command()
     @click.option(
@@ -47,6 +212,31 @@ try:
         type=click.Path(exists=True, readable=True),
         help="The certificate bundle",
     )
+    @click.option(
+        "--session-tickets/--no-session-tickets",
+        default=True,
+        show_default=True,
+        help="Let clients resume TLS sessions with tickets",
+    )
+    @click.option(
+        "--reload-interval",
+        type=click.FloatRange(min=0, min_open=True),
+        default=None,
+        help="Check for new certificates this often (seconds). SIGHUP always reloads.",
+    )
+    @click.option(
+        "--handshake-timeout",
+        type=click.FloatRange(min=0, min_open=True),
+        default=DEFAULT_HANDSHAKE_TIMEOUT,
+        show_default=True,
+        help="Drop clients that haven't finished their TLS handshake in this many seconds",
+    )
+    @click.option(
+        "--max-handshakes",
+        type=click.IntRange(min=1),
+        default=None,
+        help="Run at most this many TLS handshakes at once",
+    )
     @click.option(
         "--browser",
         default=False,
@@ -55,29 +245,91 @@ try:
         help="Launch a browser pointed at the running server",
     )
     @click.option("--response", default=DEFAULT_RESPONSE_TEXT)
+    @click.option(
+        "--directory",
+        type=click.Path(exists=True, file_okay=False),
+        default=None,
+        help="Serve the files in this directory instead of --response",
+    )
+    @click.option(
+        "--access-log",
+        default=False,
+        is_flag=True,
+        help="Log every request (buffered) to stderr",
+    )
+    @serving_options
     @click.argument(
-        "listen_address",
-        type=ListenSpec(DEFAULT_ADDR, DEFAULT_PORT),
-        default=(DEFAULT_ADDR, DEFAULT_PORT),
+        "listen_addresses", type=ListenSpec(DEFAULT_ADDR, DEFAULT_PORT), nargs=-1
     )
     def _serve(
         privkey: str,
         certs: str,
         response: str,
+        directory: str | None,
+        access_log: bool,
+        session_tickets: bool,
+        reload_interval: float | None,
+        handshake_timeout: float,
+        max_handshakes: int | None,
         browser: bool,
-        listen_address: tuple[IPAddress, int],
+        workers: int,
+        threads: int,
+        queue_size: int,
+        overload: str,
+        keep_alive: bool,
+        idle_timeout: float,
+        max_requests: int,
+        metrics_path: str | None,
+        allow: str | None,
+        deny: str | None,
+        listen_addresses: tuple[tuple[IPAddress, int], ...],
     ):
-        ctx = make_context(certs, privkey)
+        reloading = ReloadingContext(certs, privkey, tickets=session_tickets)
 
-        addr, port = listen_address
-        server = Server(
-            make_server(
-                str(addr), port, ssl_context=ctx, response_text=response.encode()
-            )
+        def reload_here():
+            "Reload in this process, which serves with the context."
+            reloading.reload_on_sighup()
+            if reload_interval is not None:
+                reloading.watch(reload_interval)
+
+        ctx = reloading.context
+
+        addresses = [
+            (str(addr), port)
+            for addr, port in listen_addresses or [(DEFAULT_ADDR, DEFAULT_PORT)]
+        ]
+        kwargs = dict(
+            ssl_context=ctx,
+            response_text=response.encode(),
+            directory=directory,
+            access_log=http.buffered_access_log() if access_log else None,
+            threads=threads,
+            queue_size=queue_size,
+            overload=Overload(overload),
+            keep_alive=keep_alive,
+            idle_timeout=idle_timeout,
+            max_requests=max_requests,
+            metrics_path=metrics_path,
+            allow=IPSet.from_file(allow) if allow else None,
+            deny=IPSet.from_file(deny) if deny else None,
+            handshake_timeout=handshake_timeout,
+            max_handshakes=max_handshakes,
         )
+        if workers > 1:
+            server = ServerProcesses(
+                addresses, processes=workers, setup=reload_here, **kwargs
+            )
+            # pass SIGHUP on, to reload them all.
+            signal.signal(
+                signal.SIGHUP, lambda signum, _frame: server.send_signal(signum)
+            )
+        else:
+            reload_here()
+            server = Server(make_server(addresses, DEFAULT_PORT, **kwargs))
 
         with server.serve():
-            print("Serving at", click.style(server.url, bold=True))
+            for url in server.urls:
+                print("Serving at", click.style(url, bold=True))
             if browser:
                 webbrowser.open(server.url)
 
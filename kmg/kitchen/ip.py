@@ -17,11 +17,17 @@ class ListenSpec(click.ParamType):
     Defaults for both can be given.
     If a part is ommitted without a default, an error is raised.
     If just a decimal number is given, it is assumed to be a port.
+    "*" (or "*:PORT") means every address, IPv4 and IPv6 (listening on ::).
+
+    For several addresses, use it with nargs=-1 (or multiple=True):
+    each value is converted on its own.
     """
 
     name: ClassVar[str] = "IP and Port"
     V6_WITH_PORT_REGEX: ClassVar[re.Pattern] = re.compile(r"\[(.*)]:(\d+)")
-    V4_WITH_PORT_REGEX: ClassVar[re.Pattern] = re.compile(r"(\d+\.\d+\.\d+\.\d):(\d+)")
+    V4_WITH_PORT_REGEX: ClassVar[re.Pattern] = re.compile(r"(\d+\.\d+\.\d+\.\d+):(\d+)")
+    WILDCARD_REGEX: ClassVar[re.Pattern] = re.compile(r"\*(?::(\d+))?")
+    WILDCARD: ClassVar[IPv6Address] = IPv6Address("::")
 
     default_addr: IPAddress | None
     default_port: int | None
@@ -47,6 +53,11 @@ class ListenSpec(click.ParamType):
         except ValueError:
             return None
 
+    def _checked_port(self, value: str) -> int:
+        port = self._convert_port(value)
+        assert port is not None  # the regexes only match digits
+        return port
+
     def _convert_str(self, value: str) -> tuple[IPv4Address | IPv6Address, int]:
         # just a port?
         port = self._convert_port(value)
@@ -60,18 +71,26 @@ class ListenSpec(click.ParamType):
             case _, _:
                 raise Unreachable
 
-        if (match := self.V6_WITH_PORT_REGEX.match(value)) is not None:
-            addr = ipaddress.IPv6Address(match.group(1))
-            port = int(match.group(2))
-            return addr, port
-
-        if (match := self.V4_WITH_PORT_REGEX.match(value)) is not None:
-            addr = ipaddress.IPv4Address(match.group(1))
-            port = int(match.group(2))
-            return addr, port
-
-        # just an IP
-        addr = ipaddress.ip_address(value)
+        if (match := self.WILDCARD_REGEX.fullmatch(value)) is not None:
+            if match.group(1) is not None:
+                return self.WILDCARD, self._checked_port(match.group(1))
+            if self.default_port is None:
+                self.fail("got just * but no default port was set")
+            return self.WILDCARD, self.default_port
+
+        try:
+            if (match := self.V6_WITH_PORT_REGEX.fullmatch(value)) is not None:
+                addr = ipaddress.IPv6Address(match.group(1))
+                return addr, self._checked_port(match.group(2))
+
+            if (match := self.V4_WITH_PORT_REGEX.fullmatch(value)) is not None:
+                addr = ipaddress.IPv4Address(match.group(1))
+                return addr, self._checked_port(match.group(2))
+
+            # just an IP
+            addr = ipaddress.ip_address(value)
+        except ValueError as e:
+            self.fail(str(e))
 
         if self.default_port is None:
             self.fail(f"got just an IP {addr} but no default port was set")
@@ -0,0 +1,205 @@
+"""
+Sets of IP addresses built from CIDR lists, for allow / deny checks
+(e.g. `make_server(allow=..., deny=...)`).
+"""
+
+import socket
+import sys
+from array import array
+from bisect import bisect_right
+from ipaddress import (
+    IPv4Address,
+    IPv4Network,
+    IPv6Address,
+    IPv6Network,
+    ip_network,
+    summarize_address_range,
+)
+from pathlib import Path
+from typing import Iterable, Iterator
+
+_V4_MAPPED = 0xFFFF << 32
+"::ffff:0:0/96, which dual-stack sockets report IPv4 peers within."
+
+Interval = tuple[int, int]
+
+
+def _merged(intervals: Iterable[Interval]) -> list[Interval]:
+    "Sort inclusive intervals, joining any that overlap or touch."
+    merged: list[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _intersected(a: list[Interval], b: list[Interval]) -> list[Interval]:
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start <= end:
+            result.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+class _Ranges:
+    "One address family's merged intervals, as parallel sorted arrays of bounds."
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, intervals: list[Interval], typecode: str | None):
+        # array('I') packs IPv4 into 4 bytes a bound; IPv6 needs python ints.
+        starts = [start for start, _ in intervals]
+        ends = [end for _, end in intervals]
+        if typecode is not None:
+            self.starts: array | list[int] = array(typecode, starts)
+            self.ends: array | list[int] = array(typecode, ends)
+        else:
+            self.starts, self.ends = starts, ends
+
+    def __contains__(self, value: int) -> bool:
+        i = bisect_right(self.starts, value) - 1
+        return i >= 0 and value <= self.ends[i]
+
+    def intervals(self) -> list[Interval]:
+        return list(zip(self.starts, self.ends))
+
+    @property
+    def nbytes(self) -> int:
+        if isinstance(self.starts, array):
+            return 2 * self.starts.itemsize * len(self.starts)
+        return sum(map(sys.getsizeof, self.starts)) + sum(map(sys.getsizeof, self.ends))
+
+
+def _v4_typecode() -> str:
+    return next(code for code in "IL" if array(code).itemsize == 4)
+
+
+class IPSet:
+    """
+    An immutable set of IPv4 and IPv6 addresses, from networks like
+    "10.0.0.0/8", "2001:db8::/32" or single addresses.
+
+    Stored as sorted, merged ranges, so membership is a binary search
+    (at most ~32 or ~128 steps, like a walk down a prefix trie)
+    however many networks went in, and overlapping or adjacent ones cost nothing.
+    IPv4 ranges take 8 bytes each.
+    """
+
+    def __init__(
+        self,
+        networks: Iterable[
+            str | IPv4Network | IPv6Network | IPv4Address | IPv6Address
+        ] = (),
+    ):
+        v4: list[Interval] = []
+        v6: list[Interval] = []
+        for network in networks:
+            if isinstance(network, str):
+                network = ip_network(network.strip(), strict=False)
+            elif isinstance(network, (IPv4Address, IPv6Address)):
+                network = ip_network(network)
+            interval = (
+                int(network.network_address),
+                int(network.broadcast_address),
+            )
+            (v4 if network.version == 4 else v6).append(interval)
+        self._set(_merged(v4), _merged(v6))
+
+    def _set(self, v4: list[Interval], v6: list[Interval]):
+        self._v4 = _Ranges(v4, _v4_typecode())
+        self._v6 = _Ranges(v6, None)
+
+    @classmethod
+    def _from(cls, v4: list[Interval], v6: list[Interval]) -> "IPSet":
+        ipset = cls.__new__(cls)
+        ipset._set(v4, v6)
+        return ipset
+
+    @classmethod
+    def from_file(cls, path: Path | str) -> "IPSet":
+        "Load one network per line, ignoring blank lines and # comments."
+        with open(path) as f:
+            return cls(
+                line for line in (raw.partition("#")[0].strip() for raw in f) if line
+            )
+
+    def __contains__(self, address: object) -> bool:
+        if isinstance(address, str):
+            # a peer's address, as a socket reports it: skip ipaddress's parsing.
+            try:
+                if ":" not in address:
+                    return int.from_bytes(socket.inet_aton(address)) in self._v4
+                packed = socket.inet_pton(socket.AF_INET6, address.partition("%")[0])
+            except OSError:
+                return False
+            value = int.from_bytes(packed)
+            if value >> 32 == _V4_MAPPED >> 32:
+                return value & 0xFFFFFFFF in self._v4
+            return value in self._v6
+        if isinstance(address, IPv4Address):
+            return int(address) in self._v4
+        if isinstance(address, IPv6Address):
+            if address.ipv4_mapped is not None:
+                return int(address.ipv4_mapped) in self._v4
+            return int(address) in self._v6
+        return False
+
+    def __or__(self, other: "IPSet") -> "IPSet":
+        return IPSet._from(
+            _merged(self._v4.intervals() + other._v4.intervals()),
+            _merged(self._v6.intervals() + other._v6.intervals()),
+        )
+
+    def __and__(self, other: "IPSet") -> "IPSet":
+        return IPSet._from(
+            _intersected(self._v4.intervals(), other._v4.intervals()),
+            _intersected(self._v6.intervals(), other._v6.intervals()),
+        )
+
+    union = __or__
+    intersection = __and__
+
+    def __iter__(self) -> Iterator[IPv4Network | IPv6Network]:
+        "The fewest networks covering the set."
+        for ranges, address in ((self._v4, IPv4Address), (self._v6, IPv6Address)):
+            for start, end in ranges.intervals():
+                yield from summarize_address_range(address(start), address(end))
+
+    def __bool__(self) -> bool:
+        return bool(self._v4.starts or self._v6.starts)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, IPSet):
+            return NotImplemented
+        return (
+            self._v4.intervals() == other._v4.intervals()
+            and self._v6.intervals() == other._v6.intervals()
+        )
+
+    @property
+    def num_addresses(self) -> int:
+        return sum(
+            end - start + 1
+            for ranges in (self._v4, self._v6)
+            for start, end in ranges.intervals()
+        )
+
+    @property
+    def nbytes(self) -> int:
+        "Roughly how much memory the ranges take."
+        return self._v4.nbytes + self._v6.nbytes
+
+    def __repr__(self):
+        networks = [str(network) for network in self]
+        shown = ", ".join(networks[:4]) + (", ..." if len(networks) > 4 else "")
+        return f"IPSet([{shown}])"
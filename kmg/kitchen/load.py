@@ -0,0 +1,281 @@
+"""
+A small HTTP load generator, for benchmarking `kmg.kitchen.http` servers
+(or anything else) with latency percentiles.
+
+Closed-loop runs keep a fixed number of requests in flight.
+Open-loop runs send at a fixed rate regardless of how the server keeps up,
+measuring latency from when each request *should* have been sent,
+so a stalled server can't hide its queueing delay (coordinated omission).
+"""
+
+import http.client
+import itertools
+import json
+import platform
+import ssl
+import sys
+import time
+from threading import Thread
+from urllib.parse import urlsplit
+
+from .histogram import Histogram
+
+DEFAULT_DURATION = 10.0
+DEFAULT_CONCURRENCY = 8
+
+
+class LoadResult:
+    "The outcome of a load run. Latencies are in microseconds."
+
+    def __init__(
+        self,
+        url: str,
+        mode: str,
+        duration: float,
+        concurrency: int,
+        rate: float | None,
+        keep_alive: bool,
+        latency: Histogram,
+        errors: int,
+    ):
+        self.url = url
+        self.mode = mode
+        self.duration = duration
+        self.concurrency = concurrency
+        self.rate = rate
+        self.keep_alive = keep_alive
+        self.latency = latency
+        self.errors = errors
+
+    @property
+    def requests(self) -> int:
+        "How many requests completed successfully."
+        return self.latency.count
+
+    @property
+    def throughput(self) -> float:
+        "Successful requests per second."
+        return self.requests / self.duration if self.duration else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "scheme": urlsplit(self.url).scheme,
+            "mode": self.mode,
+            "duration": self.duration,
+            "concurrency": self.concurrency,
+            "rate": self.rate,
+            "keep_alive": self.keep_alive,
+            "requests": self.requests,
+            "errors": self.errors,
+            "throughput": self.throughput,
+            "latency_us": self.latency.summary(),
+            "python": platform.python_version(),
+        }
+
+    def __str__(self):
+        summary = self.latency.summary()
+        return (
+            f"{self.requests} requests ({self.errors} errors) in {self.duration:.2f}s"
+            f" = {self.throughput:.1f} req/s;"
+            f" latency p50 {summary['p50']}us p90 {summary['p90']}us"
+            f" p99 {summary['p99']}us p99.9 {summary['p99.9']}us"
+        )
+
+
+class _Worker:
+    "One connection's worth of load, recording into its own histogram."
+
+    def __init__(
+        self,
+        url: str,
+        keep_alive: bool,
+        ssl_context: ssl.SSLContext | None,
+        timeout: float,
+    ):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port
+        self.https = parts.scheme == "https"
+        self.path = parts.path or "/"
+        if parts.query:
+            self.path += "?" + parts.query
+        self.keep_alive = keep_alive
+        self.ssl_context = ssl_context
+        self.timeout = timeout
+        self.conn: http.client.HTTPConnection | None = None
+        self.latency = Histogram()
+        self.errors = 0
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.https:
+            return http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout, context=self.ssl_context
+            )
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, started_ns: int):
+        "Make one request, recording its latency since started_ns."
+        if self.conn is None:
+            self.conn = self._connect()
+        try:
+            headers = {} if self.keep_alive else {"Connection": "close"}
+            self.conn.request("GET", self.path, headers=headers)
+            resp = self.conn.getresponse()
+            resp.read()
+        except (OSError, http.client.HTTPException):
+            self.errors += 1
+            self.close()
+            return
+        if not self.keep_alive:
+            self.close()
+        if 200 <= resp.status < 300:
+            self.latency.record((time.perf_counter_ns() - started_ns) // 1000)
+        else:
+            self.errors += 1
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def closed_loop(self, deadline_ns: int):
+        while (now := time.perf_counter_ns()) < deadline_ns:
+            self.request(now)
+        self.close()
+
+    def open_loop(
+        self,
+        schedule: "itertools.count[int]",
+        start_ns: int,
+        interval_ns: int,
+        deadline_ns: int,
+    ):
+        # workers share the schedule, each taking the next slot as it frees up.
+        for slot in schedule:
+            intended = start_ns + slot * interval_ns
+            if intended >= deadline_ns:
+                break
+            delay = intended - time.perf_counter_ns()
+            if delay > 0:
+                time.sleep(delay / 1e9)
+            self.request(intended)
+        self.close()
+
+
+def run(
+    url: str,
+    duration: float = DEFAULT_DURATION,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    rate: float | None = None,
+    keep_alive: bool = True,
+    ssl_context: ssl.SSLContext | None = None,
+    timeout: float = 30.0,
+) -> LoadResult:
+    """
+    Send GET requests to url for duration seconds from concurrency connections,
+    e.g. `run(server.url)` for an in-process `Server`.
+
+    If rate (requests per second) is given, run open-loop: requests are sent on
+    that fixed schedule, with concurrency bounding how many can be in flight.
+    Otherwise run closed-loop, each connection sending its next request as soon
+    as the last completes.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    if rate is not None and rate <= 0:
+        raise ValueError("rate must be positive")
+
+    workers = [
+        _Worker(url, keep_alive, ssl_context, timeout) for _ in range(concurrency)
+    ]
+    start_ns = time.perf_counter_ns()
+    deadline_ns = start_ns + int(duration * 1e9)
+    if rate is None:
+        threads = [Thread(target=w.closed_loop, args=(deadline_ns,)) for w in workers]
+    else:
+        schedule = itertools.count()
+        interval_ns = int(1e9 / rate)
+        threads = [
+            Thread(
+                target=w.open_loop, args=(schedule, start_ns, interval_ns, deadline_ns)
+            )
+            for w in workers
+        ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = (time.perf_counter_ns() - start_ns) / 1e9
+
+    latency = Histogram()
+    for worker in workers:
+        latency.merge(worker.latency)
+    return LoadResult(
+        url,
+        "closed" if rate is None else "open",
+        elapsed,
+        concurrency,
+        rate,
+        keep_alive,
+        latency,
+        sum(w.errors for w in workers),
+    )
+
+
+try:
+    import click
+
+    @click.command()
+    @click.argument("url")
+    @click.option("-d", "--duration", default=DEFAULT_DURATION, show_default=True)
+    @click.option(
+        "-c",
+        "--concurrency",
+        default=DEFAULT_CONCURRENCY,
+        show_default=True,
+        help="Connections to send from",
+    )
+    @click.option(
+        "-r",
+        "--rate",
+        type=float,
+        default=None,
+        help="Send this many requests per second (open-loop) instead of closed-loop",
+    )
+    @click.option("--keep-alive/--no-keep-alive", default=True, show_default=True)
+    @click.option(
+        "-k", "--insecure", is_flag=True, help="Don't verify HTTPS certificates"
+    )
+    @click.option("--json", "as_json", is_flag=True, help="Print results as JSON")
+    @click.option(
+        "--label", default=None, help="A name for this run, included in the JSON"
+    )
+    def _load(
+        url: str,
+        duration: float,
+        concurrency: int,
+        rate: float | None,
+        keep_alive: bool,
+        insecure: bool,
+        as_json: bool,
+        label: str | None,
+    ):
+        ssl_context = None
+        if insecure:
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+
+        result = run(url, duration, concurrency, rate, keep_alive, ssl_context)
+        if as_json:
+            json.dump({"label": label, **result.to_dict()}, sys.stdout)
+            print()
+        else:
+            print(result)
+
+    if __name__ == "__main__":
+        _load()
+
+except NameError:
+    pass
@@ -0,0 +1,149 @@
+"""
+Request metrics for `kmg.kitchen.http` servers, readable from python
+or as Prometheus text.
+"""
+
+from threading import Lock, local
+
+from .histogram import Histogram
+
+# in seconds, like Prometheus' own defaults with a few finer ones at the bottom.
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class _ThreadMetrics:
+    "One thread's share of the metrics. Only that thread writes to it."
+
+    __slots__ = (
+        "requests",
+        "bytes_in",
+        "bytes_out",
+        "connections_opened",
+        "connections_closed",
+        "latency_us",
+        "handshake_us",
+    )
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.latency_us = Histogram()
+        self.handshake_us = Histogram()
+
+
+class ServerMetrics:
+    """
+    Counters and latency histograms for a server.
+
+    Each thread records into its own counters without locking,
+    and reading merges them all, so recording stays cheap on the hot path.
+    Reads aren't atomic with respect to in-progress requests,
+    but every completed one is counted.
+    """
+
+    def __init__(self):
+        self._local = local()
+        self._threads: list[_ThreadMetrics] = []
+        self._lock = Lock()  # only for registering a new thread's counters
+
+    def mine(self) -> _ThreadMetrics:
+        "The calling thread's counters, to record into."
+        try:
+            return self._local.metrics
+        except AttributeError:
+            self._local.metrics = metrics = _ThreadMetrics()
+            with self._lock:
+                self._threads.append(metrics)
+            return metrics
+
+    def snapshot(self) -> dict:
+        "Everything recorded so far, merged across threads. Latencies are in µs."
+        with self._lock:
+            threads = list(self._threads)
+        latency, handshake = Histogram(), Histogram()
+        totals = dict.fromkeys(
+            (
+                "requests",
+                "bytes_in",
+                "bytes_out",
+                "connections_opened",
+                "connections_closed",
+            ),
+            0,
+        )
+        for metrics in threads:
+            for name in totals:
+                totals[name] += getattr(metrics, name)
+            latency.merge(metrics.latency_us)
+            handshake.merge(metrics.handshake_us)
+        return {
+            **totals,
+            "connections_active": totals["connections_opened"]
+            - totals["connections_closed"],
+            "latency_us": latency,
+            "handshake_us": handshake,
+        }
+
+    def prometheus(self, prefix: str = "kmg_http") -> str:
+        "The metrics in the Prometheus text exposition format."
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name: str, type_: str, help_: str, value):
+            lines.append(f"# HELP {prefix}_{name} {help_}")
+            lines.append(f"# TYPE {prefix}_{name} {type_}")
+            lines.append(f"{prefix}_{name} {value}")
+
+        metric("requests_total", "counter", "Requests handled.", snapshot["requests"])
+        metric(
+            "received_bytes_total", "counter", "Bytes received.", snapshot["bytes_in"]
+        )
+        metric("sent_bytes_total", "counter", "Bytes sent.", snapshot["bytes_out"])
+        metric(
+            "connections_total",
+            "counter",
+            "Connections accepted.",
+            snapshot["connections_opened"],
+        )
+        metric(
+            "connections_active",
+            "gauge",
+            "Connections currently open.",
+            snapshot["connections_active"],
+        )
+        for name, key, help_ in (
+            ("request_duration_seconds", "latency_us", "Time to handle a request."),
+            ("tls_handshake_duration_seconds", "handshake_us", "TLS handshake time."),
+        ):
+            histogram: Histogram = snapshot[key]
+            lines.append(f"# HELP {prefix}_{name} {help_}")
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for bound, count in zip(
+                DEFAULT_BUCKETS,
+                histogram.cumulative(int(b * 1e6) for b in DEFAULT_BUCKETS),
+            ):
+                lines.append(f'{prefix}_{name}_bucket{{le="{bound:g}"}} {count}')
+            lines.append(f'{prefix}_{name}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"{prefix}_{name}_sum {histogram.total / 1e6}")
+            lines.append(f"{prefix}_{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,284 @@
+"""
+Rate limits for outgoing calls, from threads or coroutines: see `TokenBucket`,
+`SlidingWindow`, `SharedTokenBucket` and `Limiters`, and
+`kmg.kitchen.requests.session(limit=...)`.
+"""
+
+import abc
+import asyncio
+import contextlib
+import mmap
+import os
+import struct
+import time
+from collections import deque
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Iterator
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None  # type: ignore
+
+
+class Limiter(abc.ABC):
+    """
+    What every limiter does. Callers reserve their turn up front, and are
+    told how long to wait for it, so waiters are served in order, and
+    each waits with one sleep rather than polling.
+    """
+
+    @abc.abstractmethod
+    def reserve(self, n: int = 1, max_wait: float | None = None) -> float | None:
+        """
+        Reserve n calls' worth, returning how many seconds to wait before
+        making them, or None (reserving nothing) if that's longer than max_wait.
+        """
+
+    @abc.abstractmethod
+    def refund(self, n: int = 1, delay: float | None = None):
+        """
+        Give back n reserved calls that won't be made after all. delay is
+        what `reserve` returned for them, if known, so that limiters which
+        keep track of each reservation can give back those very ones.
+        """
+
+    def try_acquire(self, n: int = 1) -> bool:
+        "Reserve n calls if they can be made right away."
+        return self.reserve(n, 0) is not None
+
+    def acquire(self, n: int = 1, timeout: float | None = None) -> bool:
+        """
+        Wait until n calls can be made. Returns False (without waiting)
+        if that would take longer than timeout seconds.
+        """
+        delay = self.reserve(n, timeout)
+        if delay is None:
+            return False
+        if delay > 0:
+            try:
+                time.sleep(delay)
+            except BaseException:
+                self.refund(n, delay)
+                raise
+        return True
+
+    async def acquire_async(self, n: int = 1, timeout: float | None = None) -> bool:
+        "`acquire`, without blocking the loop. Cancelling it refunds the calls."
+        delay = self.reserve(n, timeout)
+        if delay is None:
+            return False
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except BaseException:
+                self.refund(n, delay)
+                raise
+        return True
+
+
+def _take(
+    tokens: float,
+    last: float,
+    now: float,
+    n: int,
+    rate: float,
+    burst: int,
+    max_wait: float | None,
+) -> tuple[float, float, float | None]:
+    """
+    A token bucket's (tokens, last) after reserving n at now, and how long
+    to wait; or with the delay None, and nothing taken, if over max_wait.
+    Tokens go negative for reservations that have to wait.
+    """
+    if n > burst:
+        raise ValueError("can't take more than burst at once")
+    tokens = min(burst, tokens + max(now - last, 0.0) * rate)
+    delay = max(n - tokens, 0.0) / rate
+    if max_wait is not None and delay > max_wait:
+        return tokens, now, None
+    return tokens - n, now, delay
+
+
+class TokenBucket(Limiter):
+    """
+    Allows rate calls a second on average, in bursts of up to burst at once
+    (after a quiet spell). Thread-safe, and usable from coroutines.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = Lock()
+
+    def reserve(self, n: int = 1, max_wait: float | None = None) -> float | None:
+        with self._lock:
+            self._tokens, self._last, delay = _take(
+                self._tokens,
+                self._last,
+                time.monotonic(),
+                n,
+                self.rate,
+                self.burst,
+                max_wait,
+            )
+            return delay
+
+    def refund(self, n: int = 1, delay: float | None = None):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + n)
+
+
+class _Reserved(float):
+    "A `SlidingWindow` delay, which remembers the time its calls were put at."
+
+    __slots__ = ("at",)
+
+    def __new__(cls, delay: float, at: float):
+        self = super().__new__(cls, delay)
+        self.at = at
+        return self
+
+
+class SlidingWindow(Limiter):
+    """
+    Allows at most limit calls in any window seconds, for quotas counted
+    that way, which a token bucket would only approximate.
+    Keeps a timestamp per call in the window (or waiting for it).
+    Thread-safe, and usable from coroutines.
+    """
+
+    def __init__(self, limit: int, window: float):
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        if window <= 0:
+            raise ValueError("window must be positive")
+        self.limit = limit
+        self.window = window
+        self._times: deque[float] = deque()  # sorted, some maybe in the future
+        self._lock = Lock()
+
+    def reserve(self, n: int = 1, max_wait: float | None = None) -> float | None:
+        if n > self.limit:
+            raise ValueError("can't take more than limit at once")
+        with self._lock:
+            now = time.monotonic()
+            times = self._times
+            while times and times[0] <= now - self.window:
+                times.popleft()
+            excess = len(times) + n - self.limit
+            # wait until the excess-th call still in the window leaves it.
+            at = now if excess <= 0 else max(now, times[excess - 1] + self.window)
+            if max_wait is not None and at - now > max_wait:
+                return None
+            times.extend([at] * n)
+            return _Reserved(at - now, at)
+
+    def refund(self, n: int = 1, delay: float | None = None):
+        with self._lock:
+            if isinstance(delay, _Reserved):
+                # calls put at the same time are interchangeable; ones
+                # already out of the window have nothing left to give back.
+                with contextlib.suppress(ValueError):
+                    for _ in range(n):
+                        self._times.remove(delay.at)
+            else:  # the latest, which frees as many calls, if not the same
+                for _ in range(min(n, len(self._times))):
+                    self._times.pop()
+
+
+class SharedTokenBucket(Limiter):
+    """
+    A `TokenBucket` shared by every process (and thread) that opens one
+    on the same path: its state is a few bytes in that file, mapped into
+    memory, and updated under flock. Uses the wall clock, which every
+    process agrees on, so a clock stepping back just pauses refilling.
+    """
+
+    _STATE = struct.Struct("dd")  # tokens, last
+
+    def __init__(self, path: Path | str, rate: float, burst: int = 1):
+        if fcntl is None:
+            raise OSError("SharedTokenBucket needs fcntl.flock")
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+        self.path = Path(path)
+        self.rate = rate
+        self.burst = burst
+        self._lock = Lock()  # flock doesn't exclude threads sharing our fd
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            with self._flocked():
+                if os.fstat(self._fd).st_size < self._STATE.size:
+                    os.ftruncate(self._fd, self._STATE.size)
+                    os.pwrite(self._fd, self._STATE.pack(burst, time.time()), 0)
+            self._map = mmap.mmap(self._fd, self._STATE.size)
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+    @contextlib.contextmanager
+    def _flocked(self) -> Iterator[None]:
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def reserve(self, n: int = 1, max_wait: float | None = None) -> float | None:
+        with self._lock, self._flocked():
+            tokens, last = self._STATE.unpack_from(self._map)
+            tokens, last, delay = _take(
+                tokens, last, time.time(), n, self.rate, self.burst, max_wait
+            )
+            self._STATE.pack_into(self._map, 0, tokens, last)
+            return delay
+
+    def refund(self, n: int = 1, delay: float | None = None):
+        with self._lock, self._flocked():
+            tokens, last = self._STATE.unpack_from(self._map)
+            tokens = min(self.burst, tokens + n)
+            self._STATE.pack_into(self._map, 0, tokens, last)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Limiters:
+    """
+    A limiter per key (e.g. per host, or per token), each made by
+    factory(key) when first asked for.
+    """
+
+    def __init__(self, factory: Callable[[str], Limiter]):
+        self.factory = factory
+        self._limiters: dict[str, Limiter] = {}
+        self._lock = Lock()
+
+    def __getitem__(self, key: str) -> Limiter:
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(key)
+                if limiter is None:
+                    self._limiters[key] = limiter = self.factory(key)
+        return limiter
+
+    def __len__(self) -> int:
+        return len(self._limiters)
@@ -1,5 +1,21 @@
+import hashlib
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+from urllib.parse import urlsplit
+
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import AuthBase
+from urllib3.util.retry import Retry
+
+from .fs import atomic_replace
+from .httpcache import CachingAdapter, DiskCache
+from .ratelimit import Limiter, Limiters
 
 
 def checked(resp: requests.Response) -> requests.Response:
@@ -17,3 +33,559 @@ class BearerAuth(AuthBase):
     def __call__(self, request: requests.Request) -> requests.Request:
         request.headers[AUTHORIZATION_HEADER] = f"Bearer {self.token}"
         return request
+
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.25
+"Seconds before the second retry (the first is immediate), doubling after that."
+DEFAULT_BACKOFF_JITTER = 0.25
+"Up to how many seconds are added at random to each backoff."
+DEFAULT_BACKOFF_MAX = 10.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+DEFAULT_POOL_HOSTS = 16
+"How many hosts' connection pools a session keeps."
+DEFAULT_POOL_SIZE = 16
+"How many idle connections a session keeps to each host."
+
+
+def retry(
+    total: int = DEFAULT_RETRIES,
+    backoff: float = DEFAULT_BACKOFF,
+    jitter: float = DEFAULT_BACKOFF_JITTER,
+    backoff_max: float = DEFAULT_BACKOFF_MAX,
+    statuses: frozenset[int] = RETRY_STATUSES,
+) -> Retry:
+    """
+    A retry policy for connection errors and the given statuses,
+    on idempotent methods only, with jittered exponential backoff
+    (honouring Retry-After). Once out of retries, the last response is returned
+    rather than raising, so `checked` reports the real status.
+    """
+    return Retry(
+        total=total,
+        backoff_factor=backoff / 2,  # urllib3 starts doubling it from the second
+        backoff_jitter=jitter,
+        backoff_max=backoff_max,
+        status_forcelist=statuses,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+
+
+def by_host(request: requests.PreparedRequest) -> str:
+    "Rate limit each scheme://host:port separately."
+    parts = urlsplit(request.url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def by_token(request: requests.PreparedRequest) -> str:
+    "Rate limit each Authorization (e.g. `BearerAuth` token) separately, by hash."
+    header = request.headers.get(AUTHORIZATION_HEADER) or ""
+    return hashlib.sha256(header.encode()).hexdigest()[:16]
+
+
+class _LimitedRetry(Retry):
+    "A `Retry` that calls wait() after backing off, before each retry."
+
+    def __init__(self, *args, wait: Callable[[], object] = lambda: None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait = wait
+
+    @classmethod
+    def limiting(cls, retries: Retry, wait: Callable[[], object]) -> "_LimitedRetry":
+        """
+        A copy of retries, calling wait(). Only a plain `Retry` can be copied:
+        a subclass's overrides would be lost, so it's refused.
+        """
+        if type(retries) is not Retry:
+            raise TypeError(
+                f"can't rate limit the retries of a {type(retries).__name__}:"
+                " pass a plain urllib3 Retry (e.g. from retry())"
+            )
+        limited = cls.__new__(cls)
+        limited.__dict__.update(vars(retries))
+        limited.wait = wait
+        return limited
+
+    def new(self, **kw) -> "_LimitedRetry":
+        return super().new(wait=self.wait, **kw)
+
+    def sleep(self, response=None):
+        super().sleep(response)
+        self.wait()
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    An `HTTPAdapter` that waits its turn with a `ratelimit` limiter before
+    sending each request, or with the `Limiters` one for the request's key
+    (by default, its host). Each retry (which urllib3 does within the send)
+    waits its turn with the same limiter too, so a refusal (e.g. a 429)
+    doesn't set off requests the limit doesn't know about.
+    """
+
+    def __init__(
+        self,
+        *args,
+        limit: Limiter | Limiters,
+        key: Callable[[requests.PreparedRequest], str] = by_host,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.limit = limit
+        self.key = key
+        self._sending = threading.local()  # the limiter for this thread's send
+        self.max_retries = _LimitedRetry.limiting(self.max_retries, self._retrying)
+
+    def _retrying(self):
+        limiter = getattr(self._sending, "limiter", None)
+        if limiter is not None:
+            limiter.acquire()
+
+    def send(self, request, *args, **kwargs):
+        limit = self.limit
+        if isinstance(limit, Limiters):
+            limit = limit[self.key(request)]
+        limit.acquire()
+        self._sending.limiter = limit
+        try:
+            return super().send(request, *args, **kwargs)
+        finally:
+            self._sending.limiter = None
+
+
+class _RateLimitedCachingAdapter(CachingAdapter, RateLimitedAdapter):
+    "Cache hits don't wait: only what `CachingAdapter` sends on is limited."
+
+
+def _raise_for_status(resp: requests.Response, *args, **kwargs):
+    if not resp.ok:
+        resp.content  # read it, so the connection goes back to the pool
+        resp.raise_for_status()
+
+
+def session(
+    auth: AuthBase | str | None = None,
+    retries: Retry | int = DEFAULT_RETRIES,
+    pool_hosts: int = DEFAULT_POOL_HOSTS,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    hosts: dict[str, dict] | None = None,
+    check: bool = True,
+    cache: DiskCache | None = None,
+    limit: Limiter | Limiters | None = None,
+    limit_key: Callable[[requests.PreparedRequest], str] = by_host,
+) -> requests.Session:
+    """
+    A `requests.Session` that reuses connections and retries idempotent
+    requests (see `retry`; an int is a number of retries).
+    Use one instead of module-level `requests.get` and friends,
+    which connect (and handshake) afresh on every call.
+
+    auth may be a token, for `BearerAuth`. Unless check is False,
+    error statuses raise `requests.HTTPError`, as with `checked`.
+
+    pool_size should be at least how many threads share the session.
+    hosts overrides the adapter arguments (pool_connections, pool_maxsize,
+    max_retries, pool_block) for URLs with the given prefixes,
+    e.g. `{"https://api.example.com": {"pool_maxsize": 64}}`.
+
+    With a cache, GETs are answered from (and stored in) it where HTTP's
+    caching rules allow: see `DiskCache`.
+
+    With a limit, requests wait their turn (see `RateLimitedAdapter`), e.g.
+    `limit=Limiters(lambda host: TokenBucket(10))` for 10 a second per host,
+    or `limit_key=by_token` to count per token instead. Cache hits don't count.
+    Retries are counted too, so they must then be a plain `Retry`, not a subclass.
+    """
+    if isinstance(retries, int):
+        retries = retry(retries)
+    defaults = {
+        "pool_connections": pool_hosts,
+        "pool_maxsize": pool_size,
+        "max_retries": retries,
+    }
+
+    def adapter(**kwargs) -> HTTPAdapter:
+        if limit is not None:
+            kwargs.update(limit=limit, key=limit_key)
+            if cache is None:
+                return RateLimitedAdapter(**kwargs)
+            return _RateLimitedCachingAdapter(cache, **kwargs)
+        return (
+            HTTPAdapter(**kwargs) if cache is None else CachingAdapter(cache, **kwargs)
+        )
+
+    s = requests.Session()
+    for prefix in ("https://", "http://"):
+        s.mount(prefix, adapter(**defaults))
+    for prefix, overrides in (hosts or {}).items():
+        s.mount(prefix, adapter(**{**defaults, **overrides}))
+    if isinstance(auth, str):
+        auth = BearerAuth(auth)
+    s.auth = auth
+    if check:
+        s.hooks["response"].append(_raise_for_status)
+    return s
+
+
+class ThreadSessions:
+    """
+    A `session` for each thread that uses it, all made with the same arguments,
+    since sessions aren't safe to share between threads.
+    Session methods (get, post, ...) go to the calling thread's.
+    """
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self._local = threading.local()
+        self._sessions: list[requests.Session] = []
+        self._lock = threading.Lock()
+
+    def current(self) -> requests.Session:
+        "The calling thread's session."
+        try:
+            return self._local.session
+        except AttributeError:
+            self._local.session = s = session(**self.kwargs)
+            with self._lock:
+                self._sessions.append(s)
+            return s
+
+    def __getattr__(self, name: str):
+        return getattr(self.current(), name)
+
+    def close(self):
+        "Close every thread's session."
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for s in sessions:
+            s.close()
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_PER_HOST = 6
+"Like browsers, so as not to hammer any one server."
+DEFAULT_TIMEOUT = 30.0
+
+
+class Fetched:
+    "One request's outcome in a `fetch_all` batch: its response, or what it raised."
+
+    __slots__ = ("index", "request", "response", "error")
+
+    def __init__(
+        self,
+        index: int,
+        request: str | requests.Request,
+        response: requests.Response | None,
+        error: Exception | None,
+    ):
+        self.index = index
+        self.request = request
+        self.response = response
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def checked(self) -> requests.Response:
+        "The response, or raise the error."
+        if self.error is not None:
+            raise self.error
+        assert self.response is not None
+        return self.response
+
+    def __repr__(self):
+        outcome = self.error if self.error is not None else self.response
+        return f"<Fetched {self.index}: {outcome!r}>"
+
+
+_CANCEL = object()
+
+
+class Batch:
+    """
+    A bulk fetch, run by iterating over it (once): see `fetch_all`.
+    `cancel` (from any thread) or leaving a `with` block stops it early.
+    """
+
+    def __init__(
+        self,
+        requests_: Iterable[str | requests.Request],
+        concurrency: int = DEFAULT_CONCURRENCY,
+        per_host: int | None = DEFAULT_PER_HOST,
+        ordered: bool = False,
+        timeout: float | None = DEFAULT_TIMEOUT,
+        max_pending: int | None = None,
+        **session_kwargs,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if per_host is not None and per_host < 1:
+            raise ValueError("per_host must be at least 1")
+        self.requests = requests_
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.ordered = ordered
+        self.timeout = timeout
+        self.max_pending = max_pending or 4 * concurrency
+        self.session_kwargs = session_kwargs
+        self.cancelled = False
+        self._done: queue.SimpleQueue = queue.SimpleQueue()
+        self._running: Iterator[Fetched] | None = None
+
+    def cancel(self):
+        "Send nothing more, and stop yielding results once those in flight finish."
+        self.cancelled = True
+        self._done.put(_CANCEL)
+
+    def _fetch(
+        self, sessions: ThreadSessions, index: int, request: str | requests.Request
+    ) -> Fetched:
+        s = sessions.current()
+        try:
+            if isinstance(request, str):
+                resp = s.get(request, timeout=self.timeout)
+            else:
+                prepared = s.prepare_request(request)
+                settings = s.merge_environment_settings(
+                    prepared.url, {}, None, None, None
+                )
+                resp = s.send(prepared, timeout=self.timeout, **settings)
+        except Exception as e:  # one bad request (or hook) shouldn't end the batch
+            return Fetched(index, request, None, e)
+        return Fetched(index, request, resp, None)
+
+    def __iter__(self) -> Iterator[Fetched]:
+        if self._running is not None:
+            raise RuntimeError("a batch can only be run once")
+        self._running = self._run()
+        return self._running
+
+    def _run(self) -> Iterator[Fetched]:
+        items = enumerate(self.requests)
+        exhausted = False
+        read = yielded = 0
+        # read, but waiting for their host to have a free slot.
+        parked: deque[tuple[int, str | requests.Request, str]] = deque()
+        per_host: dict[str, int] = {}
+        running: dict[Future, str] = {}
+        finished: dict[int, Fetched] = {}  # when ordered, waiting for their turn
+        next_index = 0
+        sessions = ThreadSessions(**self.session_kwargs)
+        pool = ThreadPoolExecutor(self.concurrency, thread_name_prefix="kmg-fetch")
+
+        def has_room(host: str) -> bool:
+            return self.per_host is None or per_host.get(host, 0) < self.per_host
+
+        def next_request() -> tuple[int, str | requests.Request, str] | None:
+            nonlocal exhausted, read
+            for i, (index, request, host) in enumerate(parked):
+                if has_room(host):
+                    del parked[i]
+                    return index, request, host
+            while not exhausted and read - yielded < self.max_pending:
+                try:
+                    index, request = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                read += 1
+                url = request if isinstance(request, str) else request.url
+                parts = urlsplit(url)
+                host = f"{parts.scheme}://{parts.netloc}"
+                if has_room(host):
+                    return index, request, host
+                parked.append((index, request, host))
+            return None
+
+        try:
+            while not self.cancelled:
+                while len(running) < self.concurrency:
+                    if (picked := next_request()) is None:
+                        break
+                    index, request, host = picked
+                    per_host[host] = per_host.get(host, 0) + 1
+                    future = pool.submit(self._fetch, sessions, index, request)
+                    running[future] = host
+                    future.add_done_callback(self._done.put)
+                if not running:
+                    break
+
+                future = self._done.get()
+                if future is _CANCEL:
+                    break
+                per_host[running.pop(future)] -= 1
+                result = future.result()
+                if not self.ordered:
+                    yielded += 1
+                    yield result
+                    continue
+                finished[result.index] = result
+                while next_index in finished:
+                    yielded += 1
+                    next_index += 1
+                    yield finished.pop(next_index - 1)
+        finally:
+            self.cancelled = True
+            for future in running:
+                future.cancel()
+            pool.shutdown(wait=True)
+            sessions.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cancel()
+        if self._running is not None:
+            self._running.close()  # type: ignore
+
+
+def fetch_all(
+    requests_: Iterable[str | requests.Request],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    per_host: int | None = DEFAULT_PER_HOST,
+    ordered: bool = False,
+    timeout: float | None = DEFAULT_TIMEOUT,
+    max_pending: int | None = None,
+    **session_kwargs,
+) -> Batch:
+    """
+    Fetch many URLs (GET) or `requests.Request`s on a pool of concurrency
+    threads, with at most per_host in flight to any one host,
+    yielding a `Fetched` for each as it completes, or in order if asked.
+
+    Requests are read lazily, keeping a bounded number (max_pending,
+    by default 4 * concurrency) read but not yet yielded, so a huge iterable
+    can be streamed through. A failed request (including error statuses,
+    as with `checked`, and whatever a response hook raises) is reported in
+    its `Fetched` rather than stopping the batch. Other keyword arguments go to `session`, e.g. auth:
+
+        with fetch_all(urls, auth=token) as batch:
+            for fetched in batch:
+                ...
+    """
+    return Batch(
+        requests_,
+        concurrency,
+        per_host,
+        ordered,
+        timeout,
+        max_pending,
+        **session_kwargs,
+    )
+
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_RESUMES = 3
+"How many times a download picks up where it left off after a failure."
+
+
+class ChecksumError(ValueError):
+    "A download didn't match its expected checksum."
+
+
+def download(
+    url: str,
+    target: Path | str,
+    session_: requests.Session | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    hash: str | None = None,
+    expected: str | None = None,
+    resumes: int = DEFAULT_RESUMES,
+    timeout: float | None = DEFAULT_TIMEOUT,
+) -> str | None:
+    """
+    Download url to target, streaming it chunk_size at a time through
+    `fs.atomic_replace`, so memory use doesn't depend on its size and target
+    is only replaced once the whole thing has arrived (and checked).
+
+    The file is preallocated from the Content-Length. If the connection fails
+    part way, the download resumes from where it got to with a Range request
+    (If-Range, so it starts over if the file changed), up to resumes times.
+
+    If hash names a `hashlib` algorithm, it's computed as the data arrives
+    and its hex digest returned; if expected is given too, a mismatch raises
+    `ChecksumError`. session_ defaults to a fresh `session`.
+    """
+    if expected is not None and hash is None:
+        raise ValueError("expected needs a hash algorithm")
+    s = session_ if session_ is not None else session()
+    # no content-encoding, so lengths and ranges are of the bytes we store.
+    headers = {"Accept-Encoding": "identity"}
+    try:
+        resp = s.get(url, headers=headers, stream=True, timeout=timeout)
+        with atomic_replace(Path(target)) as f:
+            digest = hashlib.new(hash) if hash is not None else None
+            size = resp.headers.get("Content-Length")
+            total = int(size) if size is not None else None
+            if total and hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(f.fileno(), 0, total)
+            etag = resp.headers.get("ETag")
+            validator = (
+                etag
+                if etag and not etag.startswith("W/")
+                else resp.headers.get("Last-Modified")
+            )
+            offset = 0
+            while True:
+                try:
+                    with resp:
+                        for chunk in resp.iter_content(chunk_size):
+                            f.write(chunk)
+                            if digest is not None:
+                                digest.update(chunk)
+                            offset += len(chunk)
+                    break
+                except (
+                    requests.ConnectionError,
+                    requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError,  # i.e. cut short
+                ) as e:
+                    if resumes <= 0 or validator is None:
+                        raise
+                    resumes -= 1
+                    error = e
+
+                resume_headers = {
+                    **headers,
+                    "Range": f"bytes={offset}-",
+                    "If-Range": validator,
+                }
+                resp = s.get(url, headers=resume_headers, stream=True, timeout=timeout)
+                if resp.status_code == 206 and resp.headers.get(
+                    "Content-Range", ""
+                ).startswith(f"bytes {offset}-"):
+                    continue
+                if resp.status_code != 200:
+                    resp.close()
+                    raise error
+                # it changed since (or ignored the Range): start over.
+                f.seek(0)
+                f.truncate()
+                digest = hashlib.new(hash) if hash is not None else None
+                offset = 0
+                size = resp.headers.get("Content-Length")
+                total = int(size) if size is not None else None
+
+            if total is not None and offset != total:
+                raise requests.ConnectionError(
+                    f"{url}: got {offset} of {total} bytes", response=resp
+                )
+            f.truncate(offset)
+            hexdigest = digest.hexdigest() if digest is not None else None
+            if expected is not None and hexdigest != expected.lower():
+                raise ChecksumError(f"{url}: {hash} {hexdigest}, expected {expected}")
+            return hexdigest
+    finally:
+        if session_ is None:
+            s.close()
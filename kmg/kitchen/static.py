@@ -0,0 +1,281 @@
+"""
+Serving a directory of files for `kmg.kitchen.http`, without copying them
+through python where they can: plain sockets use `os.sendfile`, TLS sockets
+are sent chunks read into one buffer.
+"""
+
+import mimetypes
+import os
+import posixpath
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from ssl import SSLSocket
+from threading import Lock
+from urllib.parse import unquote, urlsplit
+
+DEFAULT_CACHE_ENTRIES = 1024
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_SMALL_FILE_SIZE = 64 * 1024
+DEFAULT_TTL = 1.0
+TLS_CHUNK_SIZE = 1024 * 1024
+
+
+class _Entry:
+    "What we know about a file: its metadata, and its contents if it's small."
+
+    __slots__ = (
+        "path",
+        "size",
+        "mtime",
+        "identity",
+        "etag",
+        "headers",
+        "body",
+        "checked",
+    )
+
+    def __init__(self, path: str, stat: os.stat_result, body: bytes | None):
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = int(stat.st_mtime)
+        self.identity = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        content_type, _ = mimetypes.guess_type(path)
+        self.headers = {
+            "Content-Type": content_type or "application/octet-stream",
+            "ETag": self.etag,
+            "Last-Modified": formatdate(self.mtime, usegmt=True),
+            "Accept-Ranges": "bytes",
+        }
+        self.body = body
+        self.checked = time.monotonic()
+
+
+class StaticFiles:
+    """
+    Serve the files under directory (and its index.html files) to
+    a `BaseHTTPRequestHandler`, with Range requests and ETag / Last-Modified
+    conditional requests.
+
+    Metadata for up to cache_entries files is cached for ttl seconds before
+    the file is stat'ed again, along with the contents of files up to
+    small_file_size, to a total of cache_bytes.
+    """
+
+    def __init__(
+        self,
+        directory: Path | str,
+        cache_entries: int = DEFAULT_CACHE_ENTRIES,
+        cache_bytes: int = DEFAULT_CACHE_BYTES,
+        small_file_size: int = DEFAULT_SMALL_FILE_SIZE,
+        ttl: float = DEFAULT_TTL,
+    ):
+        self.directory = os.path.realpath(directory)
+        if not os.path.isdir(self.directory):
+            raise NotADirectoryError(directory)
+        self.cache_entries = cache_entries
+        self.cache_bytes = cache_bytes
+        self.small_file_size = small_file_size
+        self.ttl = ttl
+        self._cache: OrderedDict[str, _Entry] = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = Lock()
+
+    def resolve(self, url_path: str) -> str | None:
+        "The file a URL path refers to, or None if it's outside the directory."
+        path = posixpath.normpath(unquote(urlsplit(url_path).path))
+        full = os.path.realpath(os.path.join(self.directory, path.lstrip("/")))
+        if full != self.directory and not full.startswith(self.directory + os.sep):
+            return None
+        if os.path.isdir(full):
+            full = os.path.join(full, "index.html")
+        return full
+
+    def lookup(self, path: str) -> _Entry | None:
+        "Get the (possibly cached) entry for a file, or None if it doesn't exist."
+        with self._lock:
+            entry = self._cache.get(path)
+            if entry is not None:
+                self._cache.move_to_end(path)
+                if time.monotonic() - entry.checked < self.ttl:
+                    return entry
+
+        try:
+            stat = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            self._evict(path)
+            return None
+        if not os.path.isfile(path):
+            return None
+        if entry is not None and entry.identity == (
+            stat.st_ino,
+            stat.st_size,
+            stat.st_mtime_ns,
+        ):
+            entry.checked = time.monotonic()
+            return entry
+
+        body = None
+        if stat.st_size <= self.small_file_size:
+            with open(path, "rb") as f:
+                body = f.read()
+            if len(body) != stat.st_size:  # changed since the stat; don't trust it
+                body = None
+        entry = _Entry(path, stat, body)
+        self._store(entry)
+        return entry
+
+    def _store(self, entry: _Entry):
+        with self._lock:
+            self._pop(entry.path)
+            self._cache[entry.path] = entry
+            self._cached_bytes += len(entry.body or b"")
+            while self._cache and (
+                len(self._cache) > self.cache_entries
+                or self._cached_bytes > self.cache_bytes
+            ):
+                self._pop(next(iter(self._cache)))
+
+    def _evict(self, path: str):
+        with self._lock:
+            self._pop(path)
+
+    def _pop(self, path: str):
+        old = self._cache.pop(path, None)
+        if old is not None:
+            self._cached_bytes -= len(old.body or b"")
+
+    def _not_modified(self, handler: BaseHTTPRequestHandler, entry: _Entry) -> bool:
+        if (if_none_match := handler.headers.get("If-None-Match")) is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or entry.etag in tags
+        if (if_modified_since := handler.headers.get("If-Modified-Since")) is not None:
+            try:
+                return (
+                    entry.mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+                )
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _range(
+        self, handler: BaseHTTPRequestHandler, entry: _Entry
+    ) -> tuple[int, int] | None:
+        """
+        The (start, end) of a single satisfiable byte range requested,
+        or None to send the whole file, as for a range that isn't valid
+        (RFC 9110 §14.2). Raises ValueError if it's valid but unsatisfiable.
+        """
+        requested = handler.headers.get("Range")
+        if requested is None or not requested.startswith("bytes="):
+            return None
+        if_range = handler.headers.get("If-Range")
+        if if_range is not None and if_range not in (
+            entry.etag,
+            entry.headers["Last-Modified"],
+        ):
+            return None
+        spec = requested.removeprefix("bytes=")
+        if "," in spec:  # multiple ranges: just send the whole thing
+            return None
+        first, dash, last = spec.strip().partition("-")
+        if not dash or not (first or last):
+            return None
+        if not all(part.isascii() and part.isdigit() for part in (first, last) if part):
+            return None
+        if not first:  # the last N bytes
+            start, end = max(entry.size - int(last), 0), entry.size
+        else:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            end = min(int(last) + 1, entry.size) if last else entry.size
+        if start >= end:
+            raise ValueError("unsatisfiable range")
+        return start, end
+
+    def serve(self, handler: BaseHTTPRequestHandler, head: bool = False) -> int:
+        """
+        Respond to a GET (or HEAD) request.
+        Returns how much of the body was sent straight to the socket,
+        rather than through the handler's wfile.
+        """
+        path = self.resolve(handler.path)
+        entry = self.lookup(path) if path is not None else None
+        if entry is None:
+            handler.send_error(HTTPStatus.NOT_FOUND)
+            return 0
+
+        if self._not_modified(handler, entry):
+            handler.send_response(HTTPStatus.NOT_MODIFIED)
+            for name in ("ETag", "Last-Modified"):
+                handler.send_header(name, entry.headers[name])
+            self._end_headers(handler)
+            return 0
+
+        try:
+            byte_range = self._range(handler, entry)
+        except ValueError:
+            handler.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            handler.send_header("Content-Range", f"bytes */{entry.size}")
+            handler.send_header("Content-Length", "0")
+            self._end_headers(handler)
+            return 0
+
+        start, end = byte_range or (0, entry.size)
+        if byte_range is None:
+            handler.send_response(HTTPStatus.OK)
+        else:
+            handler.send_response(HTTPStatus.PARTIAL_CONTENT)
+            handler.send_header(
+                "Content-Range", f"bytes {start}-{end - 1}/{entry.size}"
+            )
+        for name, value in entry.headers.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Length", str(end - start))
+        self._end_headers(handler)
+
+        if head or start == end:
+            return 0
+        if entry.body is not None:
+            handler.connection.sendall(memoryview(entry.body)[start:end])
+            return end - start
+        try:
+            sent = self._send_file(handler.connection, entry.path, start, end)
+        except FileNotFoundError:
+            sent = 0
+        if sent < end - start:  # it shrank underneath us; the length was a lie
+            handler.close_connection = True
+        return sent
+
+    @staticmethod
+    def _end_headers(handler: BaseHTTPRequestHandler):
+        if handler.close_connection:
+            handler.send_header("Connection", "close")
+        handler.end_headers()
+
+    @staticmethod
+    def _send_file(connection, path: str, start: int, end: int) -> int:
+        "Send [start, end) of a file without reading it into python. Returns bytes sent."
+        with open(path, "rb", buffering=0) as f:
+            if not isinstance(connection, SSLSocket):
+                return connection.sendfile(f, start, end - start)
+
+            # TLS has to encrypt in userspace, so read into one buffer, reused
+            # for each chunk. (Not an mmap: the file being truncated under
+            # one would kill the process with SIGBUS.)
+            buffer = bytearray(min(TLS_CHUNK_SIZE, end - start))
+            sent = 0
+            with memoryview(buffer) as view:
+                f.seek(start)
+                while sent < end - start:
+                    read = f.readinto(view[: end - start - sent])
+                    if not read:  # truncated
+                        break
+                    connection.sendall(view[:read])
+                    sent += read
+            return sent
@@ -0,0 +1,49 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+
+def make_cert(directory: Path, name: str = "server") -> tuple[Path, Path]:
+    "Make a self-signed (certificate, key) pair for 127.0.0.1 with openssl."
+    if shutil.which("openssl") is None:
+        pytest.skip("needs the openssl CLI to make a certificate")
+    cert, key = directory / f"{name}.pem", directory / f"{name}.key"
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "ec",
+            "-pkeyopt",
+            "ec_paramgen_curve:prime256v1",
+            "-nodes",
+            "-days",
+            "1",
+            "-subj",
+            f"/CN={name}",
+            "-addext",
+            "subjectAltName=IP:127.0.0.1",
+            "-keyout",
+            str(key),
+            "-out",
+            str(cert),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+@pytest.fixture(scope="session")
+def cert_maker():
+    "`make_cert`, for tests that need more than one certificate."
+    return make_cert
+
+
+@pytest.fixture(scope="session")
+def tls_files(tmp_path_factory) -> tuple[Path, Path]:
+    "A self-signed (certificate, key) pair for 127.0.0.1."
+    return make_cert(tmp_path_factory.mktemp("tls"))
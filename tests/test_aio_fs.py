@@ -0,0 +1,81 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from kmg.kitchen.aio import CancelledFromInside, CancelledFromOutside, atomic_write
+
+
+@pytest.mark.asyncio
+async def test_atomic_write(tmp_path):
+    target = tmp_path / "file"
+    await atomic_write(target, b"bytes")
+    assert target.read_bytes() == b"bytes"
+
+    async def chunks():
+        for i in range(100):
+            yield b"%d," % i
+
+    await atomic_write(target, chunks())
+    assert target.read_bytes() == b"".join(b"%d," % i for i in range(100))
+
+    await asyncio.gather(
+        *(atomic_write(tmp_path / f"{i}", [b"x"] * i) for i in range(50))
+    )
+    assert all((tmp_path / f"{i}").read_bytes() == b"x" * i for i in range(50))
+
+
+@pytest.mark.asyncio
+async def test_cancelled_from_outside(tmp_path):
+    target = tmp_path / "file"
+    target.write_bytes(b"old")
+    stalled = asyncio.Event()
+
+    async def chunks():
+        yield b"new"
+        stalled.set()
+        await asyncio.Event().wait()
+        yield b"never"
+
+    writing = asyncio.create_task(atomic_write(target, chunks()))
+    await stalled.wait()
+    writing.cancel()
+    with pytest.raises(CancelledFromOutside):
+        await writing
+    assert target.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["file"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_from_inside(tmp_path):
+    target = tmp_path / "file"
+    producer = asyncio.get_running_loop().create_future()
+
+    async def chunks():
+        yield b"new"
+        yield await producer
+
+    writing = asyncio.create_task(atomic_write(target, chunks()))
+    await asyncio.sleep(0.01)
+    producer.cancel()
+    with pytest.raises(CancelledFromInside):
+        await writing
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_cancelled_repeatedly(tmp_path):
+    target = tmp_path / "file"
+    unblock = threading.Event()
+    with ThreadPoolExecutor(1) as executor:
+        executor.submit(unblock.wait)  # so atomic_write's steps queue up
+        writing = asyncio.create_task(atomic_write(target, b"new", executor=executor))
+        for _ in range(3):
+            await asyncio.sleep(0.01)
+            writing.cancel()
+        unblock.set()
+        with pytest.raises(CancelledFromOutside):
+            await writing
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,113 @@
+import asyncio
+import ssl
+
+import pytest
+
+from kmg.kitchen.aio import CancelledFromOutside
+from kmg.kitchen.aio.http import MAX_BODY_SIZE, AsyncServer
+from kmg.kitchen.https import make_context
+
+
+async def read_response(reader: asyncio.StreamReader) -> tuple[bytes, bytes]:
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = next(
+        int(line.split(b":")[1])
+        for line in head.split(b"\r\n")
+        if line.lower().startswith(b"content-length:")
+    )
+    return head, await reader.readexactly(length)
+
+
+@pytest.mark.asyncio
+async def test_keep_alive_and_pipelining():
+    async with AsyncServer(response_text=b"async") as server:
+        reader, writer = await asyncio.open_connection(server.address, server.port)
+        writer.write(b"GET / HTTP/1.1\r\n\r\n" * 2)
+        for _ in range(2):
+            head, body = await read_response(reader)
+            assert head.startswith(b"HTTP/1.1 200")
+            assert body == b"async"
+
+        writer.write(b"GET / HTTP/1.1\r\nConnection: close\r\n\r\n")
+        head, body = await read_response(reader)
+        assert b"Connection: close" in head
+        assert await reader.read() == b""
+        writer.close()
+
+
+@pytest.mark.asyncio
+async def test_http_1_0_keep_alive():
+    async with AsyncServer() as server:
+        reader, writer = await asyncio.open_connection(server.address, server.port)
+        for _ in range(2):
+            writer.write(b"GET / HTTP/1.0\r\nConnection: keep-alive\r\n\r\n")
+            head, _ = await read_response(reader)
+            assert b"Connection: keep-alive" in head
+
+        writer.write(b"GET / HTTP/1.0\r\n\r\n")
+        head, _ = await read_response(reader)
+        assert b"Connection: close" in head
+        assert await reader.read() == b""
+        writer.close()
+
+
+@pytest.mark.asyncio
+async def test_rejects_other_methods():
+    async with AsyncServer() as server:
+        reader, writer = await asyncio.open_connection(server.address, server.port)
+        writer.write(b"POST / HTTP/1.1\r\nContent-Length: 2\r\n\r\nhi")
+        assert (await reader.read()).startswith(b"HTTP/1.1 501")
+        writer.close()
+
+
+@pytest.mark.asyncio
+async def test_request_bodies():
+    async with AsyncServer() as server:
+        reader, writer = await asyncio.open_connection(server.address, server.port)
+        # dropped as they arrive, in however many pieces.
+        writer.write(b"GET / HTTP/1.1\r\nContent-Length: 10\r\n\r\n01234")
+        head, _ = await read_response(reader)
+        assert head.startswith(b"HTTP/1.1 200")
+        writer.write(b"56789GET / HTTP/1.1\r\n\r\n")
+        head, _ = await read_response(reader)
+        assert head.startswith(b"HTTP/1.1 200")
+        writer.close()
+
+        for length in (b"-5", b"+5", b"x", b"%d" % (MAX_BODY_SIZE + 1)):
+            reader, writer = await asyncio.open_connection(server.address, server.port)
+            writer.write(b"GET / HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n")
+            assert (await reader.read()).startswith(b"HTTP/1.1 400")
+            writer.close()
+
+
+@pytest.mark.asyncio
+async def test_ipv6_url():
+    async with AsyncServer(address="::1") as server:
+        assert server.url == f"http://[::1]:{server.port}/"
+
+
+@pytest.mark.asyncio
+async def test_tls(tls_files):
+    cert, key = tls_files
+    client_ctx = ssl.create_default_context(cafile=cert)
+    async with AsyncServer(ssl_context=make_context(cert, key)) as server:
+        assert server.url.startswith("https://")
+        reader, writer = await asyncio.open_connection(
+            server.address, server.port, ssl=client_ctx
+        )
+        writer.write(b"GET / HTTP/1.1\r\n\r\n")
+        _head, body = await read_response(reader)
+        assert body == server.response.body
+        writer.close()
+
+
+@pytest.mark.asyncio
+async def test_serve_forever_cancelled():
+    server = AsyncServer()
+    serving = asyncio.create_task(server.serve_forever())
+    while server.server is None or not server.server.is_serving():
+        await asyncio.sleep(0)
+    serving.cancel()
+    with pytest.raises(CancelledFromOutside):
+        await serving
+    assert not server.server.is_serving()
@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+import pytest
+
+from kmg.kitchen.aio.monitor import LoopMonitor
+
+
+async def blocks_the_loop(seconds: float):
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_records_lag_and_stalls():
+    with LoopMonitor(interval=0.01, threshold=0.05) as monitor:
+        await asyncio.sleep(0.05)
+        await asyncio.create_task(blocks_the_loop(0.3))
+        await asyncio.sleep(0.05)
+    assert monitor.lag_us.count >= 5
+    assert monitor.lag_us.max >= 250_000
+
+    # a loaded machine may stall elsewhere too.
+    (stall,) = [s for s in monitor.stalls if s.task == "blocks_the_loop"]
+    assert stall.stack[-1].endswith("in blocks_the_loop")
+    assert 0.25 <= stall.duration < 1
+
+    snapshot = monitor.snapshot()
+    assert stall.as_dict() in snapshot["stalls"]
+    assert snapshot["lag_us"]["count"] == monitor.lag_us.count
+
+
+@pytest.mark.asyncio
+async def test_counts_tasks_and_restores_factory():
+    loop = asyncio.get_running_loop()
+    dumped = []
+    with LoopMonitor(interval=0.01, dump_interval=0.02, dump=dumped.append) as monitor:
+        await asyncio.gather(*(asyncio.sleep(0.001) for _ in range(50)))
+        assert monitor.snapshot()["tasks_alive"] >= 1
+        await asyncio.sleep(0.05)
+    assert monitor.tasks_created == 50
+    assert loop.get_task_factory() is None
+    assert dumped and dumped[-1]["tasks_created"] == 50
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import signal
+from contextlib import aclosing
+
+import pytest
+
+from kmg.kitchen.aio import CancelledFromInside, CancelledFromOutside, bounded_map
+from kmg.kitchen.aio.signals import SignalError
+
+
+class Tracker:
+    def __init__(self):
+        self.running = 0
+        self.most = 0
+        self.cancelled = 0
+
+    async def __call__(self, item: int, delay: float = 0.001) -> int:
+        self.running += 1
+        self.most = max(self.most, self.running)
+        try:
+            # later items finish first, to shuffle the completion order.
+            await asyncio.sleep(delay * (10 - item % 10))
+            return item * 2
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.running -= 1
+
+
+@pytest.mark.asyncio
+async def test_bounded_map():
+    tracker = Tracker()
+    results = [r async for r in bounded_map(tracker, range(100), concurrency=5)]
+    assert sorted(results) == [i * 2 for i in range(100)]
+    assert results != sorted(results)
+    assert tracker.most == 5
+
+    async def items():
+        for i in range(100):
+            yield i
+
+    results = [r async for r in bounded_map(tracker, items(), 5, ordered=True)]
+    assert results == [i * 2 for i in range(100)]
+
+
+@pytest.mark.asyncio
+async def test_reads_lazily():
+    read = 0
+
+    def items():
+        nonlocal read
+        for i in range(10**9):
+            read += 1
+            yield i
+
+    async with aclosing(bounded_map(Tracker(), items(), 4, ordered=True)) as results:
+        async for result in results:
+            if result == 20:
+                break
+    assert read <= 10 + 4 * 4
+
+
+@pytest.mark.asyncio
+async def test_error_cancels_the_rest():
+    tracker = Tracker()
+
+    async def fail(item: int) -> int:
+        if item == 3:
+            raise ValueError(item)
+        return await tracker(item, delay=1)
+
+    with pytest.raises(ValueError):
+        async for _ in bounded_map(fail, range(100), 5):
+            pass
+    assert tracker.running == 0
+    assert tracker.cancelled == 4
+
+
+@pytest.mark.asyncio
+async def test_cancellation():
+    tracker = Tracker()
+
+    async def consume():
+        async for _ in bounded_map(lambda i: tracker(i, delay=1), range(100), 5):
+            pass
+
+    task = asyncio.create_task(consume())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(CancelledFromOutside):
+        await task
+    assert tracker.running == 0
+    assert tracker.cancelled == 5
+
+    async def cancelled(item: int):
+        asyncio.current_task().cancel()
+        await asyncio.sleep(0)
+
+    with pytest.raises(CancelledFromInside):
+        async for _ in bounded_map(cancelled, range(10)):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_signal_drains():
+    tracker = Tracker()
+    results = []
+    asyncio.get_running_loop().call_later(0.005, os.kill, os.getpid(), signal.SIGUSR1)
+    with pytest.raises(SignalError):
+        async for result in bounded_map(
+            lambda i: tracker(i, delay=0.002), range(1000), 5, signal=signal.SIGUSR1
+        ):
+            results.append(result)
+    assert 5 <= len(results) < 1000
+    assert tracker.cancelled == 0 and tracker.running == 0
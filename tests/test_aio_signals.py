@@ -0,0 +1,121 @@
+import asyncio
+import gc
+import os
+import signal
+import weakref
+
+import pytest
+
+from kmg.kitchen.aio import check_signal
+from kmg.kitchen.aio.signals import _SIGNAL_MAPS, SignalError, _signal_map
+
+
+def raise_signal():
+    os.kill(os.getpid(), signal.SIGUSR1)
+
+
+@pytest.mark.asyncio
+async def test_returns_result():
+    async def work():
+        await asyncio.sleep(0)
+        return 42
+
+    assert await check_signal(work(), signal.SIGUSR1) == 42
+    assert await check_signal(asyncio.create_task(work()), signal.SIGUSR1) == 42
+    assert not _signal_map()[signal.SIGUSR1].scopes
+
+
+@pytest.mark.asyncio
+async def test_signal_cancels_coroutine():
+    cleaned_up = []
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        finally:
+            cleaned_up.append(True)
+
+    async def waiter():
+        with pytest.raises(SignalError) as raised:
+            await check_signal(work(), signal.SIGUSR1)
+        assert raised.value.signal == signal.SIGUSR1
+        assert asyncio.current_task().cancelling() == 0
+
+    waiters = [asyncio.create_task(waiter()) for _ in range(100)]
+    await asyncio.sleep(0)
+    listeners = _signal_map()[signal.SIGUSR1]
+    generation = listeners.generation
+    raise_signal()
+    await asyncio.gather(*waiters)
+    assert cleaned_up == [True] * 100
+    assert listeners.generation == generation + 1
+    assert not listeners.scopes
+
+
+@pytest.mark.asyncio
+async def test_nested_calls():
+    raised = []
+
+    async def inner(swallow):
+        try:
+            await check_signal(asyncio.sleep(10), signal.SIGUSR1)
+        except BaseException as e:
+            raised.append(type(e))
+            if not swallow:
+                raise
+
+    for swallow in (False, True):
+        asyncio.get_running_loop().call_later(0.01, raise_signal)
+        with pytest.raises(SignalError):
+            await check_signal(inner(swallow), signal.SIGUSR1)
+        assert asyncio.current_task().cancelling() == 0
+        await asyncio.sleep(0)  # and isn't cancelled again
+    assert raised == [SignalError, SignalError]
+
+
+@pytest.mark.asyncio
+async def test_signal_leaves_task_running():
+    event = asyncio.Event()
+    task = asyncio.create_task(event.wait())
+    asyncio.get_running_loop().call_later(0.01, raise_signal)
+    with pytest.raises(SignalError):
+        await check_signal(task, signal.SIGUSR1)
+    assert not task.done()
+    event.set()
+    assert await task
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_is_unregistered():
+    waiter = asyncio.create_task(check_signal(asyncio.sleep(10), signal.SIGUSR1))
+    await asyncio.sleep(0)
+    listeners = _signal_map()[signal.SIGUSR1]
+    assert len(listeners.scopes) == 1
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert not listeners.scopes
+
+
+@pytest.mark.asyncio
+async def test_cancellation_wins_over_signal():
+    waiter = asyncio.create_task(check_signal(asyncio.sleep(10), signal.SIGUSR1))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    _signal_map()[signal.SIGUSR1].handle()  # as if it arrived meanwhile
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+
+def test_registry_lets_loops_go():
+    loops = []
+
+    async def work():
+        loops.append(weakref.ref(asyncio.get_running_loop()))
+        await asyncio.sleep(0)
+
+    for _ in range(5):
+        asyncio.run(check_signal(work(), signal.SIGUSR1))
+    gc.collect()
+    assert all(loop() is None for loop in loops)
+    assert len(_SIGNAL_MAPS) <= 1  # pytest-asyncio's, if any
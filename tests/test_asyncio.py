@@ -4,6 +4,7 @@ from kmg.kitchen.aio import (
     CancelledFromInside,
     CancelledFromOutside,
     distinguish_cancellation,
+    distinguishing_cancellation,
 )
 import asyncio
 
@@ -66,3 +67,42 @@ async def test_cancel_inner_future():
     
     event_task.cancel()
     await outer()
+
+
+@pytest.mark.asyncio
+async def test_nested_distinguishing_cancellation():
+    event = asyncio.Event()
+    waiting = asyncio.Event()
+    raised = []
+
+    async def inner():
+        try:
+            with distinguishing_cancellation():
+                waiting.set()
+                await event.wait()
+        except asyncio.CancelledError as e:
+            raised.append(type(e))
+            raise
+
+    async def outer():
+        with distinguishing_cancellation():
+            await inner()
+
+    outer_task = asyncio.create_task(outer())
+    await waiting.wait()
+    outer_task.cancel()
+    with pytest.raises(CancelledFromOutside):
+        await outer_task
+    assert raised == [CancelledFromOutside]
+
+    cancelled = asyncio.create_task(event.wait())
+    cancelled.cancel()
+
+    @distinguishing_cancellation()
+    async def decorated():
+        with distinguishing_cancellation():
+            await cancelled
+
+    task = asyncio.create_task(decorated())
+    with pytest.raises(CancelledFromInside):
+        await task
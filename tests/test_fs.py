@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from kmg.kitchen import fs
+from kmg.kitchen.fs import AtomicBatch, Durability, atomic_patch, atomic_replace
+
+
+@pytest.mark.parametrize("durability", list(Durability))
+def test_atomic_replace(tmp_path, durability):
+    target = tmp_path / "file"
+    target.write_bytes(b"old")
+    with atomic_replace(target, durability=durability) as f:
+        f.write(b"new")
+        assert target.read_bytes() == b"old"
+    assert target.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["file"]
+
+    with pytest.raises(RuntimeError):
+        with atomic_replace(target, durability=durability) as f:
+            f.write(b"newer")
+            raise RuntimeError
+    assert target.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["file"]
+
+
+def test_batch(tmp_path):
+    (tmp_path / "sub").mkdir()
+    targets = [tmp_path / f"{i}" for i in range(5)] + [tmp_path / "sub" / "x"]
+    with AtomicBatch() as batch:
+        for target in targets:
+            batch.write(target, target.name.encode())
+        assert not any(target.exists() for target in targets)
+    assert [target.read_bytes() for target in targets] == [
+        target.name.encode() for target in targets
+    ]
+
+    with pytest.raises(RuntimeError):
+        with AtomicBatch(Durability.NONE) as batch:
+            batch.open(targets[0]).write(b"changed")
+            raise RuntimeError
+    assert targets[0].read_bytes() == b"0"
+    assert sorted(os.listdir(tmp_path)) == ["0", "1", "2", "3", "4", "sub"]
+
+
+def test_atomic_patch(tmp_path):
+    target = tmp_path / "file"
+    data = os.urandom(3 * fs.COPY_CHUNK_SIZE + 1)
+    target.write_bytes(data)
+    target.chmod(0o640)
+    with atomic_patch(target) as mapped:
+        mapped[10:20] = b"x" * 10
+        assert target.read_bytes() == data
+    assert target.read_bytes() == data[:10] + b"x" * 10 + data[20:]
+    assert target.stat().st_mode & 0o777 == 0o640
+
+    with pytest.raises(RuntimeError):
+        with atomic_patch(target, size=5) as mapped:
+            mapped[:] = b"short"
+            raise RuntimeError
+    assert target.read_bytes() == data[:10] + b"x" * 10 + data[20:]
+    assert os.listdir(tmp_path) == ["file"]
+
+
+def test_clone_file_falls_back_to_copying(tmp_path, monkeypatch):
+    monkeypatch.setattr(fs, "fcntl", None)
+    monkeypatch.delattr(os, "copy_file_range", raising=False)
+    data = os.urandom(2 * fs.COPY_CHUNK_SIZE + 1)
+    (tmp_path / "src").write_bytes(data)
+    with open(tmp_path / "src", "rb") as src, open(tmp_path / "dst", "wb") as dst:
+        assert fs.clone_file(src, dst) == "copy"
+    assert (tmp_path / "dst").read_bytes() == data
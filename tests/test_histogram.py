@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+from kmg.kitchen.histogram import Histogram
+
+
+def test_percentiles_within_precision():
+    histogram = Histogram()
+    values = sorted(random.randrange(1_000_000) for _ in range(10_000))
+    for value in values:
+        histogram.record(value)
+
+    for p in (50, 90, 99, 99.9):
+        exact = values[int(len(values) * p / 100) - 1]
+        assert histogram.percentile(p) == pytest.approx(exact, rel=0.02)
+    assert histogram.percentile(100) == values[-1]
+    assert histogram.count == len(values)
+
+
+def test_small_values_are_exact():
+    histogram = Histogram()
+    for value in range(100):
+        histogram.record(value)
+    assert histogram.percentile(50) == 49
+    assert histogram.min == 0
+    assert histogram.max == 99
+
+
+def test_merge():
+    a, b = Histogram(), Histogram()
+    a.record(10, count=3)
+    b.record(10_000)
+    a.merge(b)
+    assert a.count == 4
+    assert a.percentile(75) == 10
+    assert a.max == 10_000
+    assert a.summary()["p99.9"] == 10_000
@@ -0,0 +1,349 @@
+import errno
+import http.client
+import io
+import os
+import signal
+import socket
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from kmg.kitchen.http import (
+    DEFAULT_RESPONSE_TEXT,
+    GracefulHTTPServer,
+    Overload,
+    PooledHTTPServer,
+    Server,
+    ServerProcesses,
+    buffered_access_log,
+    make_server,
+)
+from kmg.kitchen.ipset import IPSet
+
+
+@pytest.fixture
+def serve():
+    servers: list[Server] = []
+
+    def _serve(**kwargs) -> Server:
+        server = Server(make_server(**kwargs))
+        server.start()
+        servers.append(server)
+        return server
+
+    yield _serve
+
+    for server in servers:
+        server.stop()
+
+
+def get(url: str) -> http.client.HTTPResponse:
+    return urllib.request.urlopen(url, timeout=5)
+
+
+def test_serves_response_text(serve):
+    server = serve()
+    with get(server.url) as resp:
+        assert resp.status == 200
+        assert resp.read() == DEFAULT_RESPONSE_TEXT
+
+
+def test_response_headers(serve):
+    server = serve(response_text=b"canned")
+    with get(server.url) as resp:
+        assert resp.headers["Content-Length"] == "6"
+        assert resp.headers["Content-Type"] == "text/plain"
+        assert resp.headers["Date"]
+        assert resp.read() == b"canned"
+
+
+def test_access_log_is_buffered(serve):
+    stream = io.StringIO()
+    log = buffered_access_log(stream, capacity=2)
+    server = serve(access_log=log)
+
+    with get(server.url):
+        pass
+    assert stream.getvalue() == ""
+
+    with get(server.url):
+        pass
+    # the handler logs after it's sent the response, so give it a moment.
+    deadline = time.monotonic() + 5
+    while not stream.getvalue() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert stream.getvalue().count('"GET / HTTP/1.1" 200') == 2
+
+
+def test_access_log_is_flushed_when_processes_stop(tmp_path):
+    path = tmp_path / "access.log"
+    with path.open("w") as stream:
+        servers = ServerProcesses(
+            processes=1, access_log=buffered_access_log(stream, capacity=100)
+        )
+        servers.start()
+        try:
+            with get(servers.url):
+                pass
+        finally:
+            servers.stop()
+    assert path.read_text().count('"GET / HTTP/1.1" 200') == 1
+
+
+def read_responses(sock: socket.socket, count: int) -> list[tuple[str, dict, bytes]]:
+    "Read (status line, headers, body) for count pipelined responses."
+    responses = []
+    with sock.makefile("rb") as f:
+        for _ in range(count):
+            status = f.readline().decode().strip()
+            headers = dict(http.client.parse_headers(f))
+            body = f.read(int(headers["Content-Length"]))
+            responses.append((status, headers, body))
+    return responses
+
+
+def test_keep_alive_pipelining(serve):
+    server = serve(max_requests=3)
+    with socket.create_connection((server.address, server.port), timeout=5) as sock:
+        sock.sendall(b"GET / HTTP/1.1\r\nHost: x\r\n\r\n" * 3)
+        first, second, third = read_responses(sock, 3)
+        assert first[0].startswith("HTTP/1.1 200")
+        assert first[2] == second[2] == third[2] == DEFAULT_RESPONSE_TEXT
+        assert "Connection" not in first[1]
+        assert third[1]["Connection"] == "close"
+        assert sock.recv(1) == b""
+
+
+def test_http_1_0_keep_alive(serve):
+    server = serve()
+    with socket.create_connection((server.address, server.port), timeout=5) as sock:
+        sock.sendall(b"GET / HTTP/1.0\r\nConnection: keep-alive\r\n\r\n" * 2)
+        for _, headers, _ in read_responses(sock, 2):
+            assert headers["Connection"] == "keep-alive"
+
+
+def test_metrics(serve):
+    server = serve(metrics_path="/metrics")
+    request = b"GET / HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n"
+    with socket.create_connection((server.address, server.port), timeout=5) as sock:
+        sock.sendall(request)
+        received = b""
+        while chunk := sock.recv(4096):
+            received += chunk
+    # the handler records after it's sent the response, so give it a moment.
+    deadline = time.monotonic() + 5
+    while (
+        server.metrics.snapshot()["connections_active"] and time.monotonic() < deadline
+    ):
+        time.sleep(0.01)
+    snapshot = server.metrics.snapshot()
+    assert snapshot["requests"] == 1
+    assert snapshot["bytes_in"] == len(request)
+    assert snapshot["bytes_out"] == len(received)
+    assert snapshot["connections_active"] == 0
+    assert snapshot["latency_us"].count == 1
+
+    with get(server.url + "metrics") as resp:
+        assert resp.headers["Content-Type"].startswith("text/plain")
+        text = resp.read().decode()
+    assert "# TYPE kmg_http_requests_total counter" in text
+    assert "kmg_http_requests_total 1" in text
+    assert 'kmg_http_request_duration_seconds_bucket{le="+Inf"} 1' in text
+
+
+def test_metrics_off(serve):
+    server = serve(metrics=False)
+    with get(server.url):
+        pass
+    assert server.metrics is None
+    with pytest.raises(ValueError):
+        make_server(metrics=False, metrics_path="/metrics")
+
+
+def test_close_per_request(serve):
+    server = serve(keep_alive=False)
+    with socket.create_connection((server.address, server.port), timeout=5) as sock:
+        sock.sendall(b"GET / HTTP/1.1\r\nHost: x\r\n\r\n")
+        ((status, headers, _body),) = read_responses(sock, 1)
+        assert status.startswith("HTTP/1.0 200")
+        assert headers["Connection"] == "close"
+        assert sock.recv(1) == b""
+
+
+def test_idle_timeout(serve):
+    server = serve(idle_timeout=0.1)
+    with socket.create_connection((server.address, server.port), timeout=5) as sock:
+        assert sock.recv(1) == b""
+
+
+def test_stop_is_immediate():
+    with Server(make_server()) as server:
+        with socket.create_connection((server.address, server.port), timeout=5) as sock:
+            sock.sendall(b"GET / HTTP/1.1\r\nHost: x\r\n\r\n")
+            read_responses(sock, 1)
+            started = time.monotonic()
+            server.stop()
+            assert time.monotonic() - started < 0.5
+            assert sock.recv(1) == b""
+
+
+@pytest.mark.parametrize("threads", [None, 4])
+def test_drain(serve, threads):
+    server = serve(threads=threads)
+    with (
+        socket.create_connection((server.address, server.port), timeout=5) as busy,
+        socket.create_connection((server.address, server.port), timeout=5) as idle,
+    ):
+        if threads is not None:  # a serial server only handles one at a time
+            idle.sendall(b"GET / HTTP/1.1\r\nHost: x\r\n\r\n")
+            read_responses(idle, 1)
+        busy.sendall(b"GET / HTTP/1.1\r\n")
+        time.sleep(0.1)  # let it start
+        draining = ThreadPoolExecutor(1).submit(server.drain, 5)
+        time.sleep(0.1)
+        if threads is not None:
+            assert idle.recv(1) == b""
+        busy.sendall(b"Host: x\r\n\r\n")
+        ((status, headers, body),) = read_responses(busy, 1)
+        assert " 200 " in status
+        assert headers["Connection"] == "close"
+        assert body == DEFAULT_RESPONSE_TEXT
+        assert draining.result(timeout=5)
+
+
+def test_allow_and_deny(serve):
+    server = serve(allow=IPSet(["127.0.0.0/8"]), deny=IPSet(["127.0.0.1"]))
+    with pytest.raises((urllib.error.URLError, ConnectionError)):
+        get(server.url)
+    server = serve(allow=IPSet(["127.0.0.0/8"]), deny=IPSet(["127.0.0.2"]))
+    with get(server.url) as resp:
+        assert resp.status == 200
+
+
+def test_listens_on_several_addresses(serve):
+    server = serve(address=["127.0.0.1", "::1"])
+    assert server.urls == [
+        f"http://127.0.0.1:{server.port}/",
+        f"http://[::1]:{server.port}/",
+    ]
+    for url in server.urls:
+        with get(url) as resp:
+            assert resp.read() == DEFAULT_RESPONSE_TEXT
+
+
+def test_dual_stack(serve):
+    server = serve(address="::", allow=IPSet(["127.0.0.0/8"]))
+    assert server.url == f"http://[::]:{server.port}/"
+    with get(f"http://127.0.0.1:{server.port}/") as resp:
+        assert resp.read() == DEFAULT_RESPONSE_TEXT
+    with pytest.raises((urllib.error.URLError, ConnectionError)):
+        get(f"http://[::1]:{server.port}/")  # not allowed
+
+    # listening on IPv4 as well, :: is just IPv6.
+    server = serve(address=[("::", 0), ("127.0.0.1", 0)])
+    (v6, _), (_, v4_port) = (s.getsockname()[:2] for s in server.server.sockets)
+    with get(f"http://[::1]:{server.port}/") as resp:
+        assert resp.read() == DEFAULT_RESPONSE_TEXT
+    with get(f"http://127.0.0.1:{v4_port}/") as resp:
+        assert resp.read() == DEFAULT_RESPONSE_TEXT
+
+
+def test_pool_serves_around_stalled_client(serve):
+    server = serve(threads=2)
+    with socket.create_connection((server.address, server.port)):
+        # the stalled connection holds one thread; the other is still free.
+        with get(server.url) as resp:
+            assert resp.read() == DEFAULT_RESPONSE_TEXT
+
+
+def test_pool_rejects_when_full(serve):
+    server = serve(threads=1, overload=Overload.REJECT)
+    with socket.create_connection((server.address, server.port)) as stalled:
+        stalled.sendall(b"GET")  # make sure it's been accepted
+        with pytest.raises(urllib.error.HTTPError) as exc_info:
+            get(server.url)
+        assert exc_info.value.code == 503
+
+
+@pytest.mark.parametrize("overload", list(Overload))
+def test_pool_closes_idle_connections_for_new_clients(serve, overload):
+    server = serve(threads=2, overload=overload)
+    idle = []
+    try:
+        for _ in range(3):  # more keep-alive clients than threads
+            sock = socket.create_connection((server.address, server.port), timeout=2)
+            idle.append(sock)
+            sock.sendall(b"GET / HTTP/1.1\r\nHost: x\r\n\r\n")
+            # answered promptly, not after an idle one times out.
+            ((status, _, body),) = read_responses(sock, 1)
+            assert status.endswith("200 ALL GOOD")
+            assert body == DEFAULT_RESPONSE_TEXT
+            # with REJECT, one that's still finishing its request isn't idle yet.
+            deadline = time.monotonic() + 5
+            while server.server.idle_connections < min(len(idle), 2):
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+        # the longest idle one was closed to make room.
+        assert idle[0].recv(1) == b""
+    finally:
+        for sock in idle:
+            sock.close()
+
+
+def test_processes_restart_and_stop():
+    servers = ServerProcesses(processes=2)
+    servers.start()
+    try:
+        with get(servers.url) as resp:
+            assert resp.read() == DEFAULT_RESPONSE_TEXT
+
+        crashed = servers.pids[0]
+        assert crashed is not None
+        os.kill(crashed, signal.SIGKILL)
+        deadline = time.monotonic() + 5
+        while servers.restarts == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert servers.restarts == 1
+        assert crashed not in servers.pids
+
+        with get(servers.url) as resp:
+            assert resp.read() == DEFAULT_RESPONSE_TEXT
+    finally:
+        servers.stop()
+
+    with pytest.raises(urllib.error.URLError):
+        get(servers.url)
+
+
+def test_processes_give_up_on_quick_failures():
+    servers = ServerProcesses(processes=1, threads=0)  # make_server raises
+    servers.RESTART_DELAY = 0.01
+    servers.MAX_QUICK_FAILURES = 3
+    servers.START_TIMEOUT = 0.5
+    servers.start()
+    with pytest.raises(RuntimeError, match="3 times in a row"):
+        servers.wait()
+    assert servers.restarts == 2
+
+
+def test_processes_must_be_positive():
+    with pytest.raises(ValueError):
+        ServerProcesses(processes=0)
+
+
+@pytest.mark.parametrize(
+    "make",
+    [
+        lambda address: GracefulHTTPServer(address, BaseHTTPRequestHandler),
+        lambda address: PooledHTTPServer(address, BaseHTTPRequestHandler, threads=2),
+    ],
+)
+def test_address_in_use(serve, make):
+    server = serve()
+    with pytest.raises(OSError) as exc_info:
+        make((server.address, server.port))
+    assert exc_info.value.errno == errno.EADDRINUSE
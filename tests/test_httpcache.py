@@ -0,0 +1,137 @@
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from kmg.kitchen.http import PooledHTTPServer, Server
+from kmg.kitchen.httpcache import DiskCache
+from kmg.kitchen.requests import session
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Serves /<cache-control>/<name>, validated by an ETag of the path,
+    and with the Authorization header in the body (Vary'd on for names
+    starting with "vary").
+    """
+
+    protocol_version = "HTTP/1.1"
+    served: list[tuple[str, int]] = []
+
+    def do_GET(self):
+        etag = f'"{self.path}"'
+        if self.headers["If-None-Match"] == etag:
+            self.served.append((self.path, 304))
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.served.append((self.path, 200))
+        body = (self.path + self.headers.get("Authorization", "")).encode() * 100
+        self.send_response(200)
+        _, cache_control, name = self.path.split("/")
+        if cache_control:
+            self.send_header("Cache-Control", cache_control)
+        if name.startswith("vary"):
+            self.send_header("Vary", "Authorization")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    _Handler.served = []
+    with Server(PooledHTTPServer(("127.0.0.1", 0), _Handler, threads=2)) as server:
+        yield server.url
+
+
+def test_fresh_and_persistent(url, tmp_path):
+    cache = DiskCache(tmp_path)
+    with session(cache=cache) as s:
+        first = s.get(url + "max-age=60/a")
+        second = s.get(url + "max-age=60/a")
+    assert second.content == first.content == b"/max-age=60/a" * 100
+    assert second.headers["ETag"] == '"/max-age=60/a"'
+    assert len(_Handler.served) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    with session(cache=DiskCache(tmp_path)) as s:
+        assert s.get(url + "max-age=60/a").content == first.content
+    assert len(_Handler.served) == 1
+
+
+def test_revalidates(url, tmp_path):
+    cache = DiskCache(tmp_path)
+    with session(cache=cache) as s:
+        for _ in range(3):
+            assert s.get(url + "no-cache/b").content == b"/no-cache/b" * 100
+    assert [status for _, status in _Handler.served] == [200, 304, 304]
+    assert cache.stats()["revalidations"] == 2
+
+
+def test_no_store(url, tmp_path):
+    cache = DiskCache(tmp_path)
+    with session(cache=cache) as s:
+        s.get(url + "no-store/c")
+        s.get(url + "no-store/c")
+    assert len(_Handler.served) == 2
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_evicts_least_recently_used(url, tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=4000)  # room for two
+    with session(cache=cache) as s:
+        s.get(url + "max-age=60/1")
+        s.get(url + "max-age=60/2")
+        s.get(url + "max-age=60/1")
+        s.get(url + "max-age=60/3")  # evicts 2
+        s.get(url + "max-age=60/1")
+        s.get(url + "max-age=60/2")
+    assert [path for path, _ in _Handler.served] == [
+        "/max-age=60/1",
+        "/max-age=60/2",
+        "/max-age=60/3",
+        "/max-age=60/2",
+    ]
+    assert cache.stats()["evictions"] == 2
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_fresh_again_after_revalidation(url, tmp_path):
+    cache = DiskCache(tmp_path)
+    with session(cache=cache) as s:
+        s.get(url + "max-age=60/d")
+        cache.lookup(url + "max-age=60/d").expires = 0
+        # the 304 has no Cache-Control, so the stored max-age still holds.
+        assert s.get(url + "max-age=60/d").content == b"/max-age=60/d" * 100
+        s.get(url + "max-age=60/d")
+    assert [status for _, status in _Handler.served] == [200, 304]
+    assert cache.stats()["hits"] == 1
+
+
+def test_not_shared_between_credentials(url, tmp_path):
+    cache = DiskCache(tmp_path)
+    with session(cache=cache) as s:
+        for token in ("a", "b", "a"):
+            resp = s.get(url + "max-age=60/e", headers={"Authorization": token})
+            assert resp.content == f"/max-age=60/e{token}".encode() * 100
+        s.get(url + "private,max-age=60/f")
+        s.get(url + "private,max-age=60/f")
+    assert len(_Handler.served) == 5
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_vary(url, tmp_path):
+    cache = DiskCache(tmp_path)
+    with session(cache=cache) as s:
+        for token in ("a", "a", "b", "b", "a"):
+            resp = s.get(
+                url + "public,max-age=60/vary", headers={"Authorization": token}
+            )
+            assert resp.content == f"/public,max-age=60/vary{token}".encode() * 100
+    assert len(_Handler.served) == 3
+    assert cache.stats()["hits"] == 2
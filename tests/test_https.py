@@ -0,0 +1,191 @@
+import shutil
+import signal
+import socket
+import ssl
+import threading
+import time
+
+import pytest
+
+from kmg.kitchen.http import Server, ServerProcesses, make_server
+from kmg.kitchen.https import ReloadingContext, make_context
+
+
+@pytest.fixture
+def reloading(tmp_path, tls_files):
+    cert, key = tmp_path / "cert.pem", tmp_path / "key.pem"
+    shutil.copy(tls_files[0], cert)
+    shutil.copy(tls_files[1], key)
+    return ReloadingContext(cert, key)
+
+
+@pytest.fixture
+def server(reloading):
+    server = Server(make_server(ssl_context=reloading.context))
+    server.start()
+    yield server
+    server.stop()
+
+
+CLIENT = ssl.create_default_context()
+CLIENT.check_hostname = False
+CLIENT.verify_mode = ssl.CERT_NONE
+
+
+def handshake(
+    server: Server | ServerProcesses, session: ssl.SSLSession | None = None
+) -> tuple[bytes, ssl.SSLSession, bool]:
+    "Make a request, returning the server's certificate, the session and if it resumed."
+    raw = socket.create_connection((server.address, server.port), timeout=5)
+    with CLIENT.wrap_socket(raw, session=session) as sock:
+        cert = sock.getpeercert(binary_form=True)
+        # TLS 1.3 tickets arrive after the handshake, so read a response to get them.
+        sock.sendall(b"GET / HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+        while sock.recv(4096):
+            pass
+        assert cert is not None and sock.session is not None
+        return cert, sock.session, sock.session_reused
+
+
+def test_resumption_is_counted(reloading, server):
+    _cert, session, reused = handshake(server)
+    assert not reused
+    _cert, _session, reused = handshake(server, session)
+    assert reused
+    assert reloading.stats() == {"full": 1, "resumed": 1, "reloads": 0}
+
+
+def test_reload(tmp_path, cert_maker, reloading, server):
+    old_cert, session, _reused = handshake(server)
+
+    new_cert, new_key = cert_maker(tmp_path, "new")
+    shutil.copy(new_cert, reloading.bundle)
+    shutil.copy(new_key, reloading.keyfile)
+    assert reloading.reload_if_changed()
+    assert not reloading.reload_if_changed()
+
+    cert, _session, _reused = handshake(server)
+    assert cert == ssl.PEM_cert_to_DER_cert(new_cert.read_text()) != old_cert
+    # sessions from before the reload still resume
+    _cert, _session, reused = handshake(server, session)
+    assert reused
+    assert reloading.stats() == {"full": 2, "resumed": 1, "reloads": 1}
+
+
+def test_stats_across_reloads(reloading, server):
+    for _ in range(3):
+        assert reloading.reload()
+        handshake(server)
+    assert reloading.stats() == {"full": 3, "resumed": 0, "reloads": 3}
+
+
+def test_sighup_handler_doesnt_wait_for_lock(reloading):
+    previous = signal.getsignal(signal.SIGHUP)
+    try:
+        reloading.reload_on_sighup()
+        handler = signal.getsignal(signal.SIGHUP)
+        with reloading._lock:  # as if SIGHUP interrupted stats() or reload()
+            handling = threading.Thread(target=handler, args=(signal.SIGHUP, None))
+            handling.start()
+            handling.join(1)
+            assert not handling.is_alive()
+        deadline = time.monotonic() + 5
+        while reloading.reloads == 0:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        signal.signal(signal.SIGHUP, previous)
+
+
+def test_processes_reload_on_sighup(tmp_path, cert_maker, reloading):
+    servers = ServerProcesses(
+        processes=2, ssl_context=reloading.context, setup=reloading.reload_on_sighup
+    )
+    servers.start()
+    try:
+        new_cert, new_key = cert_maker(tmp_path, "new")
+        shutil.copy(new_cert, reloading.bundle)
+        shutil.copy(new_key, reloading.keyfile)
+        servers.send_signal(signal.SIGHUP)
+
+        expected = ssl.PEM_cert_to_DER_cert(new_cert.read_text())
+        deadline = time.monotonic() + 5
+        in_a_row = 0
+        while in_a_row < 10:  # enough to reach both processes
+            cert, _session, _reused = handshake(servers)
+            in_a_row = in_a_row + 1 if cert == expected else 0
+            assert time.monotonic() < deadline
+        assert servers.restarts == 0
+    finally:
+        servers.stop()
+
+
+def test_bad_reload_keeps_serving(reloading, server):
+    reloading.keyfile.write_text("not a key")
+    assert not reloading.reload()
+    handshake(server)
+    assert reloading.reloads == 0
+
+
+def test_stalled_handshake_doesnt_block_accept(tls_files):
+    server = Server(
+        make_server(
+            ssl_context=make_context(*tls_files), threads=2, handshake_timeout=0.2
+        )
+    )
+    server.start()
+    try:
+        with socket.create_connection((server.address, server.port)) as stalled:
+            handshake(server)  # while the other never sends a ClientHello
+            stalled.settimeout(5)
+            assert stalled.recv(1) == b""  # dropped after the handshake timeout
+    finally:
+        server.stop()
+
+
+def stall(server: Server, count: int) -> list[socket.socket]:
+    "Open count connections that never send a ClientHello, once they're waiting."
+    stalled = [
+        socket.create_connection((server.address, server.port)) for _ in range(count)
+    ]
+    deadline = time.monotonic() + 5
+    while server.server.idle_connections < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    return stalled
+
+
+def test_stalled_handshakes_dont_starve_others(tls_files):
+    server = Server(make_server(ssl_context=make_context(*tls_files), threads=2))
+    server.start()
+    try:
+        stalled = stall(server, 2)  # one per thread
+        started = time.monotonic()
+        handshake(server)  # long before the 10s handshake timeout
+        assert time.monotonic() - started < 2
+    finally:
+        server.stop()
+        for sock in stalled:
+            sock.close()
+
+
+def test_stop_wakes_handshakes_waiting_their_turn(tls_files):
+    context = make_context(*tls_files)
+    server = Server(make_server(ssl_context=context, threads=4, max_handshakes=1))
+    server.start()
+    stalled = stall(server, 2)  # one handshaking, one waiting its turn
+    started = time.monotonic()
+    server.stop()
+    assert time.monotonic() - started < 2
+    for sock in stalled:
+        sock.close()
+
+
+def test_every_address_is_wrapped(tls_files):
+    context = make_context(*tls_files)
+    with Server(make_server(["127.0.0.1", "::1"], ssl_context=context)) as server:
+        assert [url.split(":")[0] for url in server.urls] == ["https", "https"]
+        raw = socket.create_connection(("::1", server.port), timeout=5)
+        with CLIENT.wrap_socket(raw) as sock:
+            sock.sendall(b"GET / HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+            assert sock.recv(4096).startswith(b"HTTP/1.1 200")
@@ -0,0 +1,41 @@
+from ipaddress import IPv4Address, IPv6Address
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from kmg.kitchen.ip import ListenSpec
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("8000", (IPv4Address("127.0.0.1"), 8000)),
+        ("10.0.0.12:80", (IPv4Address("10.0.0.12"), 80)),
+        ("10.0.0.12", (IPv4Address("10.0.0.12"), 1)),
+        ("[::1]:443", (IPv6Address("::1"), 443)),
+        ("::1", (IPv6Address("::1"), 1)),
+        ("*", (IPv6Address("::"), 1)),
+        ("*:80", (IPv6Address("::"), 80)),
+    ],
+)
+def test_listen_spec(value, expected):
+    assert ListenSpec("127.0.0.1", 1).convert(value, None, None) == expected
+
+
+@pytest.mark.parametrize("value", ["10.0.0.300:80", "nope", "70000", "*:99999"])
+def test_listen_spec_rejects(value):
+    with pytest.raises(click.BadParameter):
+        ListenSpec("127.0.0.1", 1).convert(value, None, None)
+
+
+def test_listen_specs_on_the_command_line():
+    @click.command()
+    @click.argument("addresses", type=ListenSpec("127.0.0.1", 1), nargs=-1)
+    def command(addresses):
+        click.echo(repr(addresses))
+
+    result = CliRunner().invoke(command, ["10.0.0.1:80", "*"])
+    assert result.output.strip() == repr(
+        ((IPv4Address("10.0.0.1"), 80), (IPv6Address("::"), 1))
+    )
@@ -0,0 +1,42 @@
+from ipaddress import ip_address, ip_network
+
+from kmg.kitchen.ipset import IPSet
+
+
+def test_membership():
+    ipset = IPSet(
+        ["10.0.0.0/8", "192.168.1.7", "2001:db8::/32", ip_network("fd00::/8")]
+    )
+    assert "10.1.2.3" in ipset
+    assert "192.168.1.7" in ipset
+    assert "192.168.1.8" not in ipset
+    assert "11.0.0.0" not in ipset
+    assert "2001:db8::1" in ipset
+    assert "2001:db9::1" not in ipset
+    assert "fd12::1%eth0" in ipset
+    assert "::ffff:10.0.0.1" in ipset
+    assert ip_address("10.255.255.255") in ipset
+    assert ip_address("::ffff:11.0.0.1") not in ipset
+    assert "not an address" not in ipset
+    assert "0.0.0.0" not in IPSet()
+
+
+def test_merging_and_iteration():
+    ipset = IPSet(["10.0.0.0/25", "10.0.0.128/25", "10.0.0.5", "::1"])
+    assert [str(n) for n in ipset] == ["10.0.0.0/24", "::1/128"]
+    assert ipset.num_addresses == 257
+    assert ipset == IPSet(["10.0.0.0/24", "::1"])
+
+
+def test_union_and_intersection():
+    a = IPSet(["10.0.0.0/24", "2001:db8::/64"])
+    b = IPSet(["10.0.0.128/25", "10.0.1.0/24", "2001:db8:0:1::/64"])
+    assert a | b == IPSet(["10.0.0.0/23", "2001:db8::/63"])
+    assert a & b == IPSet(["10.0.0.128/25"])
+    assert not (a & IPSet(["11.0.0.0/8"]))
+
+
+def test_from_file(tmp_path):
+    path = tmp_path / "allow.txt"
+    path.write_text("# office\n10.0.0.0/8  # all of it\n\n2001:db8::/32\n")
+    assert IPSet.from_file(path) == IPSet(["10.0.0.0/8", "2001:db8::/32"])
@@ -0,0 +1,20 @@
+from kmg.kitchen import load
+from kmg.kitchen.http import Server, make_server
+
+
+def test_closed_and_open_loop():
+    server = Server(make_server())
+    server.start()
+    try:
+        closed = load.run(server.url, duration=0.2, concurrency=2)
+        opened = load.run(server.url, duration=0.5, concurrency=2, rate=100)
+    finally:
+        server.stop()
+
+    assert closed.errors == 0
+    assert closed.requests > 0
+    assert closed.to_dict()["mode"] == "closed"
+
+    assert opened.errors == 0
+    assert 40 <= opened.requests <= 51
+    assert opened.to_dict()["latency_us"]["p99"] > 0
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+
+from kmg.kitchen.ratelimit import (
+    Limiter,
+    Limiters,
+    SharedTokenBucket,
+    SlidingWindow,
+    TokenBucket,
+)
+
+
+def test_limiters_must_reserve_and_refund():
+    class Incomplete(Limiter):
+        def reserve(self, n=1, max_wait=None):
+            return 0.0
+
+    with pytest.raises(TypeError):
+        Incomplete()  # type: ignore
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=100, burst=5)
+    assert [bucket.reserve() for _ in range(5)] == [0] * 5
+    assert bucket.reserve() == pytest.approx(0.01, abs=0.002)
+    assert bucket.reserve() == pytest.approx(0.02, abs=0.002)
+    assert bucket.reserve(max_wait=0.01) is None  # and nothing taken
+    assert not bucket.try_acquire()
+    bucket.refund(2)
+    assert bucket.reserve() == pytest.approx(0.01, abs=0.002)
+    with pytest.raises(ValueError):
+        bucket.reserve(6)
+
+
+def test_sliding_window():
+    window = SlidingWindow(limit=3, window=0.1)
+    assert [window.reserve() for _ in range(3)] == [0] * 3
+    assert window.reserve() == pytest.approx(0.1, abs=0.01)
+    assert window.reserve(2) == pytest.approx(0.1, abs=0.01)
+    assert window.reserve(max_wait=0.1) is None
+    assert window.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_sliding_window_refunds_the_reservation():
+    window = SlidingWindow(limit=1, window=10)
+    window.reserve()
+    waiting = window.reserve()  # in 10s
+    window.reserve()  # in 20s, and still going to make its call then
+    window.refund(1, waiting)
+    # rather than freeing the 20s turn, and putting another call there too.
+    assert window.reserve() == pytest.approx(30, abs=0.1)
+
+
+def test_acquire_paces_threads():
+    bucket = TokenBucket(rate=200)
+    started = time.monotonic()
+    for _ in range(21):
+        assert bucket.acquire()
+    assert 0.09 <= time.monotonic() - started < 0.3
+    assert not bucket.acquire(timeout=0)
+
+
+@pytest.mark.asyncio
+async def test_acquire_async():
+    bucket = TokenBucket(rate=200)
+    started = time.monotonic()
+    assert all(await asyncio.gather(*(bucket.acquire_async() for _ in range(21))))
+    assert 0.09 <= time.monotonic() - started < 0.3
+
+    waiting = asyncio.create_task(bucket.acquire_async())
+    await asyncio.sleep(0)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    await asyncio.sleep(0.01)
+    assert bucket.try_acquire()  # the cancelled one gave its turn back
+
+
+def test_shared_token_bucket(tmp_path):
+    path = tmp_path / "bucket"
+    with SharedTokenBucket(path, rate=1, burst=3) as a:
+        with SharedTokenBucket(path, rate=1, burst=3) as b:
+            assert a.try_acquire() and b.try_acquire() and a.try_acquire()
+            assert not b.try_acquire()
+            a.refund()
+            assert b.try_acquire()
+    with SharedTokenBucket(path, rate=1, burst=3) as c:
+        assert not c.try_acquire()  # the state outlives them
+
+
+def test_limiters():
+    limiters = Limiters(lambda key: TokenBucket(rate=1))
+    assert limiters["a"] is limiters["a"]
+    assert limiters["a"].try_acquire() and limiters["b"].try_acquire()
+    assert not limiters["a"].try_acquire()
+    assert len(limiters) == 2
@@ -0,0 +1,280 @@
+import hashlib
+import os
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import requests
+from urllib3.util.retry import Retry
+
+from kmg.kitchen.http import PooledHTTPServer, Server
+from kmg.kitchen.ratelimit import Limiters, TokenBucket
+from kmg.kitchen.requests import (
+    ChecksumError,
+    ThreadSessions,
+    download,
+    fetch_all,
+    retry,
+    session,
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Answers /fail/N with 503 N times before succeeding, /slow/N after
+    N % 3 hundredths of a second, and echoes auth.
+    """
+
+    protocol_version = "HTTP/1.1"
+    failures: dict[str, int] = {}
+    connections: list[tuple[str, int]] = []
+    lock = threading.Lock()
+    active = peak = 0
+
+    def setup(self):
+        super().setup()
+        self.connections.append(self.client_address)
+
+    def do_GET(self):
+        if self.path.startswith("/slow/"):
+            with self.lock:
+                _Handler.active += 1
+                _Handler.peak = max(_Handler.peak, _Handler.active)
+            time.sleep(int(self.path[6:]) % 3 / 100)
+            with self.lock:
+                _Handler.active -= 1
+        failing = self.path.startswith("/fail/")
+        remaining = (
+            self.failures.setdefault(self.path, int(self.path[6:] or 0))
+            if failing
+            else 0
+        )
+        if failing and remaining:
+            self.failures[self.path] -= 1
+            status = 503
+        else:
+            status = 404 if self.path == "/missing" else 200
+        body = (self.headers["Authorization"] or "").encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    _Handler.failures.clear()
+    _Handler.connections.clear()
+    _Handler.peak = 0
+    with Server(PooledHTTPServer(("127.0.0.1", 0), _Handler, threads=8)) as server:
+        yield server.url
+
+
+def test_reuses_connections(url):
+    with session() as s:
+        for _ in range(5):
+            s.get(url)
+    assert len(_Handler.connections) == 1
+
+
+def test_checks_and_authenticates(url):
+    with session(auth="t0ken") as s:
+        assert s.get(url).text == "Bearer t0ken"
+        with pytest.raises(requests.HTTPError) as exc_info:
+            s.get(url + "missing")
+        assert exc_info.value.response.status_code == 404
+    with session(check=False) as s:
+        assert s.get(url + "missing").status_code == 404
+
+
+def test_retries_idempotent_methods(url):
+    with session(retries=retry(2, backoff=0, jitter=0)) as s:
+        assert s.get(url + "fail/2").status_code == 200
+        with pytest.raises(requests.HTTPError):
+            s.get(url + "fail/3")
+        with pytest.raises(requests.HTTPError):
+            s.post(url + "fail/1")
+
+
+def test_thread_sessions(url):
+    seen = []
+    with ThreadSessions(auth="t") as sessions:
+
+        def use():
+            seen.append(sessions.current())
+            assert sessions.get(url).text == "Bearer t"
+
+        threads = [threading.Thread(target=use) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        use()
+        assert sessions.current() is seen[-1]
+    assert len({id(s) for s in seen}) == 3
+
+
+def test_rate_limit(url):
+    limit = Limiters(lambda host: TokenBucket(rate=100))
+    with session(limit=limit) as s:
+        started = time.monotonic()
+        for _ in range(11):
+            s.get(url)
+        assert time.monotonic() - started >= 0.09
+    assert len(limit) == 1
+
+
+def test_rate_limit_counts_retries(url):
+    class Counting(TokenBucket):
+        calls = 0
+
+        def reserve(self, n=1, max_wait=None):
+            self.calls += n
+            return super().reserve(n, max_wait)
+
+    limit = Counting(rate=1000, burst=10)
+    with session(limit=limit, retries=retry(2, backoff=0, jitter=0)) as s:
+        assert s.get(url + "fail/2").status_code == 200
+    assert limit.calls == 3
+
+
+def test_rate_limit_refuses_retry_subclasses():
+    class Custom(Retry):
+        pass
+
+    with pytest.raises(TypeError, match="Custom"):
+        session(limit=TokenBucket(rate=1), retries=Custom(2))
+
+
+def test_fetch_all(url):
+    urls = [url + f"slow/{i}" for i in range(30)] + [url + "missing"]
+    results = list(fetch_all(urls, concurrency=6, per_host=2, auth="t"))
+    assert sorted(r.index for r in results) == list(range(31))
+    assert _Handler.peak <= 2
+    (failed,) = [r for r in results if not r.ok]
+    assert failed.request == url + "missing"
+    assert isinstance(failed.error, requests.HTTPError)
+    with pytest.raises(requests.HTTPError):
+        failed.checked()
+    assert all(r.checked().text == "Bearer t" for r in results if r.ok)
+
+
+def test_fetch_all_reports_other_errors(url):
+    def disk_full(resp, *args, **kwargs):
+        raise OSError("disk full")
+
+    requests_ = [
+        requests.Request("GET", url, hooks={"response": disk_full}),
+        requests.Request("GET", url),
+    ]
+    failed, ok = sorted(fetch_all(requests_), key=lambda r: r.index)
+    assert isinstance(failed.error, OSError)
+    assert ok.ok
+
+
+def test_fetch_all_ordered(url):
+    requests_ = (requests.Request("GET", url + f"slow/{i}") for i in range(20))
+    batch = fetch_all(requests_, concurrency=4, per_host=None, ordered=True)
+    assert [r.index for r in batch] == list(range(20))
+    assert _Handler.peak > 1
+
+
+def test_fetch_all_cancel(url):
+    read = []
+
+    def urls():
+        for i in range(1000):
+            read.append(i)
+            yield url + f"slow/{i}"
+
+    with fetch_all(urls(), concurrency=2) as batch:
+        for result in batch:
+            if result.index >= 3:
+                batch.cancel()
+    assert len(read) < 20
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    "Serves payload with Range requests, cutting off the first `cuts` responses."
+
+    protocol_version = "HTTP/1.1"
+    payload = b""
+    etag = '"1"'
+    cuts = 0
+    ranges: list[str | None] = []
+
+    def do_GET(self):
+        requested = self.headers["Range"]
+        self.ranges.append(requested)
+        start = 0
+        if requested and self.headers["If-Range"] == self.etag:
+            start = int(requested.removeprefix("bytes=").rstrip("-"))
+            self.send_response(206)
+            self.send_header(
+                "Content-Range",
+                f"bytes {start}-{len(self.payload) - 1}/{len(self.payload)}",
+            )
+        else:
+            self.send_response(200)
+        body = memoryview(self.payload)[start:]  # no copies to skew the peak
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", self.etag)
+        self.end_headers()
+        if _FileHandler.cuts:
+            _FileHandler.cuts -= 1
+            body = body[: len(body) // 2]
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def file_url():
+    _FileHandler.payload = os.urandom(3 * 1024 * 1024 + 1)
+    _FileHandler.cuts = 0
+    _FileHandler.ranges = []
+    with Server(PooledHTTPServer(("127.0.0.1", 0), _FileHandler, threads=2)) as server:
+        yield server.url
+
+
+def test_download(file_url, tmp_path):
+    target = tmp_path / "file"
+    target.write_bytes(b"old")
+    expected = hashlib.sha256(_FileHandler.payload).hexdigest()
+    _FileHandler.cuts = 2
+    tracemalloc.start()
+    try:
+        digest = download(
+            file_url, target, chunk_size=64 * 1024, hash="sha256", expected=expected
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert digest == expected
+    assert target.read_bytes() == _FileHandler.payload
+    assert peak < len(_FileHandler.payload) / 4
+    assert _FileHandler.ranges[0] is None
+    assert all(r and r.startswith("bytes=") for r in _FileHandler.ranges[1:])
+    assert len(_FileHandler.ranges) == 3
+    assert os.listdir(tmp_path) == ["file"]
+
+
+def test_download_fails_cleanly(file_url, tmp_path):
+    target = tmp_path / "file"
+    target.write_bytes(b"old")
+    with pytest.raises(ChecksumError):
+        download(file_url, target, hash="sha256", expected="00")
+    _FileHandler.cuts = 2
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        download(file_url, target, resumes=1)
+    assert target.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["file"]
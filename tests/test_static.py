@@ -0,0 +1,122 @@
+import http.client
+import os
+import ssl
+import urllib.error
+import urllib.request
+
+import pytest
+
+from kmg.kitchen import static
+from kmg.kitchen.http import Server, make_server
+from kmg.kitchen.https import make_context
+from kmg.kitchen.static import DEFAULT_SMALL_FILE_SIZE, StaticFiles
+
+
+@pytest.fixture
+def files(tmp_path):
+    (tmp_path / "small.txt").write_bytes(b"0123456789")
+    (tmp_path / "large.bin").write_bytes(bytes(range(256)) * 1024)
+    assert (tmp_path / "large.bin").stat().st_size > DEFAULT_SMALL_FILE_SIZE
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "index.html").write_text("<p>hi</p>")
+    return tmp_path
+
+
+@pytest.fixture
+def server(files):
+    server = Server(make_server(directory=files))
+    server.start()
+    yield server
+    server.stop()
+
+
+def get(url: str, **headers) -> http.client.HTTPResponse:
+    return urllib.request.urlopen(
+        urllib.request.Request(url, headers=headers), timeout=5
+    )
+
+
+def test_serves_files(server, files):
+    with get(server.url + "small.txt") as resp:
+        assert resp.read() == b"0123456789"
+        assert resp.headers["Content-Type"] == "text/plain"
+    with get(server.url + "large.bin") as resp:
+        assert resp.read() == (files / "large.bin").read_bytes()
+    with get(server.url + "sub/") as resp:
+        assert resp.read() == b"<p>hi</p>"
+
+
+def test_not_found(server):
+    for path in ("missing", "..%2f..%2fetc%2fpasswd"):
+        with pytest.raises(urllib.error.HTTPError) as exc_info:
+            get(server.url + path)
+        assert exc_info.value.code == 404
+
+
+@pytest.mark.parametrize("name", ["small.txt", "large.bin"])
+def test_ranges(server, files, name):
+    data = (files / name).read_bytes()
+    with get(server.url + name, Range="bytes=2-5") as resp:
+        assert resp.status == 206
+        assert resp.headers["Content-Range"] == f"bytes 2-5/{len(data)}"
+        assert resp.read() == data[2:6]
+    with get(server.url + name, Range="bytes=-3") as resp:
+        assert resp.read() == data[-3:]
+    with pytest.raises(urllib.error.HTTPError) as exc_info:
+        get(server.url + name, Range=f"bytes={len(data)}-")
+    assert exc_info.value.code == 416
+    # invalid ranges are ignored, rather than unsatisfiable.
+    for invalid in ("bytes=5-2", "bytes=-", "bytes=+1-2", "bytes=1"):
+        with get(server.url + name, Range=invalid) as resp:
+            assert resp.status == 200
+            assert resp.read() == data
+
+
+def test_conditional(server):
+    with get(server.url + "small.txt") as resp:
+        etag = resp.headers["ETag"]
+        last_modified = resp.headers["Last-Modified"]
+
+    for headers in ({"If-None-Match": etag}, {"If-Modified-Since": last_modified}):
+        with pytest.raises(urllib.error.HTTPError) as exc_info:
+            get(server.url + "small.txt", **headers)
+        assert exc_info.value.code == 304
+
+    with get(
+        server.url + "small.txt", Range="bytes=0-0", **{"If-Range": '"x"'}
+    ) as resp:
+        assert resp.status == 200
+
+
+def test_tls(files, tls_files):
+    cert, key = tls_files
+    server = Server(make_server(ssl_context=make_context(cert, key), directory=files))
+    server.start()
+    try:
+        client = ssl.create_default_context(cafile=cert)
+        request = urllib.request.Request(
+            server.url + "large.bin", headers={"Range": "bytes=1000-"}
+        )
+        with urllib.request.urlopen(request, context=client, timeout=5) as resp:
+            assert resp.read() == (files / "large.bin").read_bytes()[1000:]
+    finally:
+        server.stop()
+
+
+def test_tls_send_survives_truncation(files, monkeypatch):
+    path = files / "large.bin"
+    data = path.read_bytes()
+
+    class Connection:  # stands in for an SSLSocket
+        def __init__(self):
+            self.received = bytearray()
+
+        def sendall(self, chunk):
+            self.received += chunk
+            os.truncate(path, 5000)
+
+    monkeypatch.setattr(static, "SSLSocket", Connection)
+    monkeypatch.setattr(static, "TLS_CHUNK_SIZE", 4096)
+    connection = Connection()
+    assert StaticFiles._send_file(connection, str(path), 0, len(data)) == 5000
+    assert connection.received == data[:5000]